@@ -37,6 +37,56 @@ taas_opts = [
         'vlan_range_end',
         default=4000,
         help=_("End range of TAAS VLAN IDs")),
+    cfg.IntOpt(
+        'ovn_mirror_workers',
+        default=4,
+        min=1,
+        help=_("Number of threads of the OVN service driver applying tap "
+               "mirror requests to the OVN Northbound database. Requests "
+               "are distributed by port, so the requests of one port are "
+               "always applied in order.")),
+    cfg.StrOpt(
+        'ovn_nb_idl_mode',
+        default='isolated',
+        choices=[('isolated', _('Each OVN service driver instance opens '
+                                'its own OVN Northbound connection.')),
+                 ('shared', _('The OVN service driver instances of a '
+                              'process share one OVN Northbound '
+                              'connection.')),
+                 ('ml2', _('Reuse the OVN Northbound connection of the '
+                           'ML2/OVN mechanism driver. The shared TaaS '
+                           'connection is used by the processes where '
+                           'the mechanism driver has no connection.'))],
+        help=_("How the OVN service driver connects to the OVN Northbound "
+               "database.")),
+    cfg.FloatOpt(
+        'sync_tap_resources_rate',
+        default=5.0,
+        min=0,
+        help=_("Number of resync requests of the TaaS agents answered per "
+               "second by each RPC worker of the server, the rate of the "
+               "whole server is this value times the number of RPC "
+               "workers. Requests above that rate are queued and answered "
+               "in order. 0 answers them as they come.")),
+    cfg.IntOpt(
+        'sync_tap_resources_burst',
+        default=10,
+        min=1,
+        help=_("Number of resync requests of the TaaS agents answered "
+               "back to back by each RPC worker before "
+               "sync_tap_resources_rate applies.")),
+    cfg.FloatOpt(
+        'port_details_cache_ttl',
+        default=0,
+        min=0,
+        help=_("Seconds the details of the ports read by TaaS are cached, "
+               "per project and admin flag of the request context. The "
+               "cached details of a port are dropped when the port is "
+               "updated or deleted, but only in the server process that "
+               "made the change, the other API and RPC workers keep them "
+               "until they expire, and can build tap flows from a stale "
+               "port VLAN or binding. 0, the default, disables the "
+               "cache.")),
 ]
 
 
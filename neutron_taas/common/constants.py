@@ -14,7 +14,18 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from neutron_lib.api.definitions import portbindings
+from neutron_lib import constants
+
 TAAS = 'TAAS'
 
 # Complete VLAN Id Range
 VLAN_RANGE = '0-4095'
+
+# TaaS agent driver handling the ports of each VNIC type
+VNIC_TYPE_DRIVER_TYPES = {portbindings.VNIC_DIRECT: 'sriov',
+                          portbindings.VNIC_NORMAL: 'ovs'}
+
+# TaaS agent driver run by the L2 agent of each agent type
+AGENT_TYPE_DRIVER_TYPES = {constants.AGENT_TYPE_NIC_SWITCH: 'sriov',
+                           constants.AGENT_TYPE_OVS: 'ovs'}
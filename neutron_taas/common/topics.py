@@ -17,3 +17,8 @@
 
 TAAS_PLUGIN = 'n-taas-plugin'
 TAAS_AGENT = 'n-taas_agent'
+
+
+def get_agent_topic(driver_type):
+    """Topic of the TaaS agents using the given driver type."""
+    return '%s-%s' % (TAAS_AGENT, driver_type)
@@ -12,6 +12,28 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from neutron_lib.api.definitions import portbindings
+
+from neutron_taas.common import constants as taas_consts
+
+
+def get_port_source_vlans(port):
+    """Get the VLANs mirrored from a port
+
+    The VLAN of the port binding, all the VLANs when the port has none.
+    """
+    src_vlans = ""
+    if port.get(portbindings.VIF_DETAILS):
+        src_vlans = port[portbindings.VIF_DETAILS].get(
+            portbindings.VIF_DETAILS_VLAN)
+
+    # If no VLAN filter configured on source port,
+    # then include all vlans
+    if not src_vlans or src_vlans == '0':
+        src_vlans = taas_consts.VLAN_RANGE
+
+    return str(src_vlans)
+
 
 def get_list_from_ranges_str(ranges_str):
     """Convert the range in string format to ranges list
@@ -0,0 +1,41 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from alembic import op
+
+from neutron.db import migration
+
+
+"""add indexes on the TaaS lookup columns
+
+Revision ID: 3d2a9c6b7e41
+Revises: f8f1f10ebaf9
+Create Date: 2026-10-18 10:12:45.318204
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3d2a9c6b7e41'
+down_revision = 'f8f1f10ebaf9'
+
+
+# milestone identifier, used by neutron-db-manage
+neutron_milestone = [migration.RELEASE_2026_2]
+
+
+def upgrade():
+    op.create_index('ix_tap_services_port_id', 'tap_services', ['port_id'])
+    op.create_index('ix_tap_flows_source_port', 'tap_flows',
+                    ['source_port'])
+    op.create_index('ix_tap_flows_tap_service_id_status', 'tap_flows',
+                    ['tap_service_id', 'status'])
+    op.create_index('ix_tap_mirrors_port_id', 'tap_mirrors', ['port_id'])
@@ -0,0 +1,40 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+from alembic import op
+from neutron.db import migration
+from neutron_lib import constants
+import sqlalchemy as sa
+
+
+"""add status to tap mirrors
+
+Revision ID: 9b4e7f2a6c13
+Revises: 3d2a9c6b7e41
+Create Date: 2026-10-18 14:03:27.519472
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9b4e7f2a6c13'
+down_revision = '3d2a9c6b7e41'
+
+
+# milestone identifier, used by neutron-db-manage
+neutron_milestone = [migration.RELEASE_2026_2]
+
+
+def upgrade():
+    op.add_column('tap_mirrors', sa.Column('status', sa.String(16),
+                                           server_default=constants.ACTIVE,
+                                           nullable=False))
@@ -0,0 +1,105 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import collections
+
+from alembic import op
+from neutron.db import migration
+from neutron_lib import exceptions
+from oslo_serialization import jsonutils
+import sqlalchemy as sa
+
+from neutron_taas._i18n import _
+
+
+"""add tap mirror tunnel ids table
+
+Revision ID: c5f1a8e3d27b
+Revises: 9b4e7f2a6c13
+Create Date: 2026-10-18 15:21:09.804153
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c5f1a8e3d27b'
+down_revision = '9b4e7f2a6c13'
+
+
+# milestone identifier, used by neutron-db-manage
+neutron_milestone = [migration.RELEASE_2026_2]
+
+
+tap_mirrors = sa.Table(
+    'tap_mirrors', sa.MetaData(),
+    sa.Column('id', sa.String(length=36)),
+    sa.Column('directions', sa.String(length=255)))
+
+
+class DuplicateTapMirrorTunnelIds(exceptions.Conflict):
+    message = _("Tunnel ids used by several tap mirrors exist in the "
+                "tap_mirrors table: %(duplicates)s. Database cannot be "
+                "upgraded, as tunnel ids are unique across all projects. "
+                "Please delete or recreate the tap mirrors sharing a tunnel "
+                "id before upgrading the database.")
+
+
+def upgrade():
+    tunnel_ids_table = op.create_table(
+        'tap_mirror_tunnel_ids',
+        sa.Column('tap_mirror_id', sa.String(length=36),
+                  sa.ForeignKey('tap_mirrors.id', ondelete='CASCADE'),
+                  primary_key=True),
+        sa.Column('direction', sa.String(length=16), primary_key=True),
+        sa.Column('tunnel_id', sa.Integer(), nullable=False),
+        sa.UniqueConstraint('tunnel_id',
+                            name='uniq_tap_mirror_tunnel_ids0tunnel_id'),
+    )
+
+    rows = get_tap_mirror_tunnel_ids(op.get_bind())
+    # Also checked here for the upgrades not run by neutron-db-manage,
+    # which runs check_sanity() beforehand.
+    _check_duplicates(rows)
+    if rows:
+        op.bulk_insert(tunnel_ids_table, rows)
+
+
+def check_sanity(connection):
+    insp = sa.inspect(connection)
+    if ('tap_mirrors' not in insp.get_table_names() or
+            'tap_mirror_tunnel_ids' in insp.get_table_names()):
+        return
+    _check_duplicates(get_tap_mirror_tunnel_ids(connection))
+
+
+def _check_duplicates(rows):
+    tap_mirror_ids = collections.defaultdict(list)
+    for row in rows:
+        tap_mirror_ids[row['tunnel_id']].append(row['tap_mirror_id'])
+    duplicates = ['%s (%s)' % (tunnel_id, ', '.join(sorted(set(ids))))
+                  for tunnel_id, ids in sorted(tap_mirror_ids.items())
+                  if len(ids) > 1]
+    if duplicates:
+        raise DuplicateTapMirrorTunnelIds(duplicates='; '.join(duplicates))
+
+
+def get_tap_mirror_tunnel_ids(connection):
+    rows = []
+    for tap_mirror in connection.execute(
+            sa.select(tap_mirrors.c.id, tap_mirrors.c.directions)):
+        for direction, tunnel_id in jsonutils.loads(
+                tap_mirror.directions).items():
+            if tunnel_id is not None:
+                rows.append({'tap_mirror_id': tap_mirror.id,
+                             'direction': direction,
+                             'tunnel_id': int(tunnel_id)})
+    return rows
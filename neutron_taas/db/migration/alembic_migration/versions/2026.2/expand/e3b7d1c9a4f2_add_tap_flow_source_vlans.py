@@ -0,0 +1,40 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+from alembic import op
+from neutron.db import migration
+import sqlalchemy as sa
+
+
+"""add source vlans to tap flows
+
+Revision ID: e3b7d1c9a4f2
+Revises: c5f1a8e3d27b
+Create Date: 2026-10-18 16:42:51.337180
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e3b7d1c9a4f2'
+down_revision = 'c5f1a8e3d27b'
+
+
+# milestone identifier, used by neutron-db-manage
+neutron_milestone = [migration.RELEASE_2026_2]
+
+
+def upgrade():
+    # Left empty for the existing tap flows, their source VLANs are read
+    # from their source port.
+    op.add_column('tap_flows', sa.Column('source_vlans', sa.String(1024),
+                                         nullable=True))
@@ -0,0 +1,42 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+from alembic import op
+from neutron.db import migration
+import sqlalchemy as sa
+
+
+"""add taas agent versions table
+
+Revision ID: f1c4a7d2b8e5
+Revises: e3b7d1c9a4f2
+Create Date: 2026-10-18 18:05:37.912654
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'f1c4a7d2b8e5'
+down_revision = 'e3b7d1c9a4f2'
+
+
+# milestone identifier, used by neutron-db-manage
+neutron_milestone = [migration.RELEASE_2026_2]
+
+
+def upgrade():
+    op.create_table(
+        'taas_agent_versions',
+        sa.Column('host', sa.String(length=255), primary_key=True),
+        sa.Column('driver_type', sa.String(length=36), primary_key=True),
+        sa.Column('rpc_version', sa.String(length=16), nullable=False),
+    )
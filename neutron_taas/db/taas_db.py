@@ -14,12 +14,20 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import copy
+import random
+import threading
+import time
 
 import sqlalchemy as sa
 from sqlalchemy import orm
 from sqlalchemy.orm import exc
 
 from neutron.db.models import segment
+from neutron.plugins.ml2 import models as ml2_models
+from neutron_lib.callbacks import events
+from neutron_lib.callbacks import registry
+from neutron_lib.callbacks import resources
 from neutron_lib import constants
 from neutron_lib.db import api as db_api
 from neutron_lib.db import model_base
@@ -28,6 +36,7 @@ from neutron_lib.db import utils as db_utils
 from neutron_lib.exceptions import taas as taas_exc
 from neutron_lib.plugins import directory
 from oslo_config import cfg
+from oslo_db import exception as db_exc
 from oslo_log import log as logging
 from oslo_utils import uuidutils
 
@@ -35,6 +44,20 @@ from neutron_taas.extensions import taas as taas_extension
 
 LOG = logging.getLogger(__name__)
 
+# Number of free taas ids read at once to pick one of them at random
+IDPOOL_SELECT_SIZE = 100
+
+
+def _supports_skip_locked(session):
+    dialect = session.get_bind().dialect
+    if dialect.name == 'postgresql':
+        return True
+    if dialect.name in ('mysql', 'mariadb'):
+        min_version = (10, 6) if getattr(dialect, 'is_mariadb', False) else (
+            8, 0)
+        return (dialect.server_version_info or ()) >= min_version
+    return False
+
 
 class TapService(model_base.BASEV2, model_base.HasId,
                  model_base.HasProjectNoIndex):
@@ -43,7 +66,7 @@ class TapService(model_base.BASEV2, model_base.HasId,
     __tablename__ = 'tap_services'
     name = sa.Column(sa.String(255), nullable=True)
     description = sa.Column(sa.String(1024), nullable=True)
-    port_id = sa.Column(sa.String(36), nullable=False)
+    port_id = sa.Column(sa.String(36), nullable=False, index=True)
     status = sa.Column(sa.String(16), nullable=False,
                        server_default=constants.ACTIVE)
 
@@ -59,13 +82,21 @@ class TapFlow(model_base.BASEV2, model_base.HasId,
                                sa.ForeignKey("tap_services.id",
                                              ondelete="CASCADE"),
                                nullable=False)
-    source_port = sa.Column(sa.String(36), nullable=False)
+    source_port = sa.Column(sa.String(36), nullable=False, index=True)
     direction = sa.Column(sa.Enum('IN', 'OUT', 'BOTH',
                                   name='tapflows_direction'),
                           nullable=False)
     status = sa.Column(sa.String(16), nullable=False,
                        server_default=constants.ACTIVE)
     vlan_filter = sa.Column(sa.String(1024), nullable=True)
+    # VLANs of the source port when the tap flow was created, NULL for the
+    # tap flows created by older releases.
+    source_vlans = sa.Column(sa.String(1024), nullable=True)
+    __table_args__ = (
+        sa.Index('ix_tap_flows_tap_service_id_status',
+                 'tap_service_id', 'status'),
+        model_base.BASEV2.__table_args__
+    )
 
 
 class TapIdAssociation(model_base.BASEV2):
@@ -85,11 +116,92 @@ class TapIdAssociation(model_base.BASEV2):
         primaryjoin='TapService.id==TapIdAssociation.tap_service_id')
 
 
+class TaasAgentVersion(model_base.BASEV2):
+
+    # Version of the agent RPC API supported by the TaaS agents of a host,
+    # reported when they resync.
+    __tablename__ = 'taas_agent_versions'
+    host = sa.Column(sa.String(255), primary_key=True)
+    driver_type = sa.Column(sa.String(36), primary_key=True)
+    rpc_version = sa.Column(sa.String(16), nullable=False)
+
+
+class PortDetailsCache():
+    """Port details kept for a short time, by context scope and port id.
+
+    The core plugin filters the ports by the project and admin flag of the
+    request context, the details of a port are only returned to the
+    contexts of the scope they were read with.
+    """
+
+    def __init__(self):
+        # {port_id: {scope: (expires_at, port)}}
+        self._ports = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_scope(context):
+        return (context.project_id, context.is_admin)
+
+    def get(self, scope, port_ids):
+        """Return the cached details of the ports that did not expire."""
+        now = time.monotonic()
+        ports = {}
+        with self._lock:
+            for port_id in port_ids:
+                entries = self._ports.get(port_id, {})
+                expires_at, port = entries.get(scope, (0, None))
+                if expires_at > now:
+                    ports[port_id] = port
+                elif port is not None:
+                    del entries[scope]
+                    if not entries:
+                        del self._ports[port_id]
+        return ports
+
+    def add(self, scope, ports, ttl):
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            for port in ports:
+                self._ports.setdefault(port['id'], {})[scope] = (
+                    expires_at, port)
+
+    def invalidate(self, port_id):
+        with self._lock:
+            self._ports.pop(port_id, None)
+
+
 class Taas_db_Mixin(taas_extension.TaasPluginBase):
 
+    def __init__(self):
+        super().__init__()
+        self._port_details_cache = PortDetailsCache()
+
     def _core_plugin(self):
         return directory.get_plugin()
 
+    @registry.receives(resources.PORT, [events.AFTER_UPDATE,
+                                        events.AFTER_DELETE])
+    def _invalidate_port_details(self, resource, event, trigger, payload):
+        self._port_details_cache.invalidate(payload.resource_id)
+
+    @db_api.retry_if_session_inactive()
+    @db_api.CONTEXT_READER
+    def is_tap_flow_source_port(self, context, port_id):
+        """Return whether a port is the source port of a tap flow."""
+        query = context.session.query(TapFlow.id).filter(
+            TapFlow.source_port == port_id)
+        return context.session.query(query.exists()).scalar()
+
+    @db_api.retry_if_session_inactive()
+    @db_api.CONTEXT_WRITER
+    def update_tap_flows_source_vlans(self, context, port_id, source_vlans):
+        """Set the source VLANs of the tap flows of a source port."""
+        context.session.query(TapFlow).filter(
+            TapFlow.source_port == port_id).update(
+                {TapFlow.source_vlans: source_vlans},
+                synchronize_session=False)
+
     @db_api.retry_if_session_inactive()
     @db_api.CONTEXT_READER
     def _get_tap_service(self, context, id):
@@ -166,6 +278,27 @@ class Taas_db_Mixin(taas_extension.TaasPluginBase):
         }
         return ns_data
 
+    @db_api.retry_if_session_inactive()
+    @db_api.CONTEXT_READER
+    def get_ports_network_data(self, context, ports):
+        network_ids = {port['network_id'] for port in ports}
+        if not network_ids:
+            return {}
+        segments = context.session.query(
+            segment.NetworkSegment.network_id,
+            segment.NetworkSegment.physical_network,
+            segment.NetworkSegment.network_type
+        ).filter(
+            segment.NetworkSegment.network_id.in_(network_ids)
+        ).all()
+
+        ns_data = {}
+        for ns in segments:
+            ns_data.setdefault(ns[0], {'physical_network': ns[1],
+                                       'network_type': ns[2]})
+        return {port['id']: ns_data.get(port['network_id'])
+                for port in ports}
+
     @db_api.retry_if_session_inactive()
     @db_api.CONTEXT_WRITER
     def create_tap_service(self, context, tap_service):
@@ -185,8 +318,7 @@ class Taas_db_Mixin(taas_extension.TaasPluginBase):
         return self._make_tap_service_dict(tap_service_db)
 
     def _rebuild_taas_id_allocation_range(self, context):
-        query = context.session.query(
-            TapIdAssociation).all()
+        query = context.session.query(TapIdAssociation.taas_id)
 
         allocate_taas_id_list = [_q.taas_id for _q in query]
         first_taas_id = cfg.CONF.taas.vlan_range_start
@@ -195,23 +327,50 @@ class Taas_db_Mixin(taas_extension.TaasPluginBase):
         all_taas_id_set = set(range(first_taas_id, last_taas_id))
         vaild_taas_id_set = all_taas_id_set - set(allocate_taas_id_list)
 
-        for _id in vaild_taas_id_set:
-            # new taas id
-            context.session.add(TapIdAssociation(
-                taas_id=_id))
+        if vaild_taas_id_set:
+            # new taas ids, inserted at once
+            context.session.execute(
+                TapIdAssociation.__table__.insert(),
+                [{'taas_id': _id} for _id in sorted(vaild_taas_id_set)])
+
+    def _get_free_taas_ids(self, context):
+        """Get candidate taas ids, in the order they should be tried.
+
+        Where the backend supports it, the first free id is locked and
+        the ids locked by concurrent transactions are skipped. Otherwise
+        a random sample of the free ids is returned, so that concurrent
+        servers are unlikely to try the same id.
+        """
+        query = context.session.query(TapIdAssociation.taas_id).filter_by(
+            tap_service_id=None)
+        if _supports_skip_locked(context.session):
+            query = query.with_for_update(skip_locked=True).limit(1)
+            return [_q.taas_id for _q in query]
+
+        free_taas_ids = [_q.taas_id for _q in query.limit(IDPOOL_SELECT_SIZE)]
+        random.shuffle(free_taas_ids)
+        return free_taas_ids
 
     def _allocate_taas_id_with_tap_service_id(self, context, tap_service_id):
-        query = context.session.query(TapIdAssociation).filter_by(
-            tap_service_id=None).first()
-        if not query:
+        free_taas_ids = self._get_free_taas_ids(context)
+        if not free_taas_ids:
             self._rebuild_taas_id_allocation_range(context)
             # try again
-            query = context.session.query(TapIdAssociation).filter_by(
-                tap_service_id=None).first()
-
-        if query:
-            query.update({"tap_service_id": tap_service_id})
-            return query
+            free_taas_ids = self._get_free_taas_ids(context)
+
+        for taas_id in free_taas_ids:
+            # Compare and swap, the id may have been allocated by another
+            # server since it was read.
+            count = context.session.query(TapIdAssociation).filter_by(
+                taas_id=taas_id, tap_service_id=None).update(
+                    {'tap_service_id': tap_service_id})
+            if count:
+                return {'tap_service_id': tap_service_id,
+                        'taas_id': taas_id}
+
+        if free_taas_ids:
+            # All the candidates were taken concurrently, retry the request.
+            raise db_exc.RetryRequest(taas_exc.TapServiceLimitReached())
         # not found
         raise taas_exc.TapServiceLimitReached()
 
@@ -221,9 +380,10 @@ class Taas_db_Mixin(taas_extension.TaasPluginBase):
         LOG.debug("create_tap_id_association() called")
         # create the TapIdAssociation object
         # allocate Taas id.
-        # if conflict happened, it will raise db.DBDuplicateEntry.
-        # this will be retry request again in neutron controller framework.
-        # so we just make sure TapIdAssociation field taas_id is unique
+        # if conflict happened while filling the allocation range, it will
+        # raise db.DBDuplicateEntry, and db.RetryRequest if all the candidate
+        # ids were allocated concurrently. The request will be retried again
+        # in neutron controller framework.
         tap_id_association_db = self._allocate_taas_id_with_tap_service_id(
             context, tap_service_id)
 
@@ -231,7 +391,7 @@ class Taas_db_Mixin(taas_extension.TaasPluginBase):
 
     @db_api.retry_if_session_inactive()
     @db_api.CONTEXT_WRITER
-    def create_tap_flow(self, context, tap_flow):
+    def create_tap_flow(self, context, tap_flow, source_vlans=None):
         LOG.debug("create_tap_flow() called")
         t_f = tap_flow['tap_flow']
         tenant_id = t_f['tenant_id']
@@ -247,6 +407,7 @@ class Taas_db_Mixin(taas_extension.TaasPluginBase):
             direction=t_f['direction'],
             status=constants.DOWN,
             vlan_filter=t_f['vlan_filter'],
+            source_vlans=source_vlans,
         )
         context.session.add(tap_flow_db)
 
@@ -270,6 +431,18 @@ class Taas_db_Mixin(taas_extension.TaasPluginBase):
         if not count:
             raise taas_exc.TapFlowNotFound(flow_id=id)
 
+    @db_api.CONTEXT_WRITER
+    def delete_tap_services(self, context, ids):
+        LOG.debug("delete_tap_services() called")
+        context.session.query(TapService).filter(
+            TapService.id.in_(ids)).delete()
+
+    @db_api.CONTEXT_WRITER
+    def delete_tap_flows(self, context, ids):
+        LOG.debug("delete_tap_flows() called")
+        context.session.query(TapFlow).filter(
+            TapFlow.id.in_(ids)).delete()
+
     def get_tap_service(self, context, id, fields=None):
         LOG.debug("get_tap_service() called")
 
@@ -282,6 +455,15 @@ class Taas_db_Mixin(taas_extension.TaasPluginBase):
         t_a = self._get_tap_id_association(context, tap_service_id)
         return self._make_tap_id_association_dict(t_a)
 
+    @db_api.CONTEXT_READER
+    def get_tap_id_associations(self, context, tap_service_ids):
+        LOG.debug("get_tap_id_associations() called")
+
+        query = context.session.query(TapIdAssociation).filter(
+            TapIdAssociation.tap_service_id.in_(tap_service_ids))
+        return {t_a.tap_service_id: self._make_tap_id_association_dict(t_a)
+                for t_a in query}
+
     @db_api.CONTEXT_READER
     def get_tap_flow(self, context, id, fields=None):
         LOG.debug("get_tap_flow() called")
@@ -289,6 +471,54 @@ class Taas_db_Mixin(taas_extension.TaasPluginBase):
         t_f = self._get_tap_flow(context, id)
         return self._make_tap_flow_dict(t_f, fields)
 
+    @db_api.retry_if_session_inactive()
+    @db_api.CONTEXT_READER
+    def get_active_tap_resources_by_host(self, context, host):
+        """Get the active tap services and tap flows of a host.
+
+        The tap services are the ones whose port is bound to the host, and
+        the tap flows the ones whose source port is, each returned with its
+        taas id. Each resource type is read with a single query.
+        """
+        LOG.debug("get_active_tap_resources_by_host() called")
+
+        ts_query = context.session.query(
+            TapService, TapIdAssociation.taas_id
+        ).join(
+            TapIdAssociation,
+            TapIdAssociation.tap_service_id == TapService.id
+        ).join(
+            ml2_models.PortBinding,
+            ml2_models.PortBinding.port_id == TapService.port_id
+        ).filter(
+            ml2_models.PortBinding.host == host,
+            ml2_models.PortBinding.status == constants.ACTIVE,
+            TapService.status == constants.ACTIVE
+        )
+        tap_services = [(self._make_tap_service_dict(ts), taas_id)
+                        for ts, taas_id in ts_query]
+
+        tf_query = context.session.query(
+            TapFlow, TapService.port_id, TapIdAssociation.taas_id
+        ).join(
+            TapService, TapService.id == TapFlow.tap_service_id
+        ).join(
+            TapIdAssociation,
+            TapIdAssociation.tap_service_id == TapService.id
+        ).join(
+            ml2_models.PortBinding,
+            ml2_models.PortBinding.port_id == TapFlow.source_port
+        ).filter(
+            ml2_models.PortBinding.host == host,
+            ml2_models.PortBinding.status == constants.ACTIVE,
+            TapService.status == constants.ACTIVE,
+            TapFlow.status == constants.ACTIVE
+        )
+        tap_flows = [(self._make_tap_flow_dict(tf), ts_port_id, taas_id)
+                     for tf, ts_port_id, taas_id in tf_query]
+
+        return tap_services, tap_flows
+
     @db_api.retry_if_session_inactive()
     @db_api.CONTEXT_READER
     def get_tap_services(self, context, filters=None, fields=None,
@@ -299,6 +529,55 @@ class Taas_db_Mixin(taas_extension.TaasPluginBase):
                                           self._make_tap_service_dict,
                                           filters=filters, fields=fields)
 
+    @db_api.retry_if_session_inactive()
+    @db_api.CONTEXT_WRITER
+    def update_agent_rpc_version(self, context, host, driver_types,
+                                 rpc_version):
+        LOG.debug("update_agent_rpc_version() called")
+        for driver_type in driver_types:
+            agent_version = context.session.get(TaasAgentVersion,
+                                                (host, driver_type))
+            if agent_version is None:
+                context.session.add(TaasAgentVersion(
+                    host=host, driver_type=driver_type,
+                    rpc_version=rpc_version))
+            else:
+                agent_version.rpc_version = rpc_version
+
+    @db_api.retry_if_session_inactive()
+    @db_api.CONTEXT_WRITER
+    def delete_agent_rpc_version(self, context, host, driver_type):
+        LOG.debug("delete_agent_rpc_version() called")
+        context.session.query(TaasAgentVersion).filter(
+            TaasAgentVersion.host == host,
+            TaasAgentVersion.driver_type == driver_type).delete(
+                synchronize_session=False)
+
+    @db_api.retry_if_session_inactive()
+    @db_api.CONTEXT_READER
+    def get_agent_rpc_version(self, context, host, driver_type):
+        """Get the agent RPC API version of a TaaS agent, None if unknown."""
+        agent_version = context.session.get(TaasAgentVersion,
+                                            (host, driver_type))
+        return agent_version.rpc_version if agent_version else None
+
+    @db_api.retry_if_session_inactive()
+    @db_api.CONTEXT_READER
+    def get_tap_service_flows_vlans(self, context, tap_service_id):
+        """Get the distinct VLANs of the active tap flows of a tap service.
+
+        Returns (source_port, source_vlans, vlan_filter) tuples, the source
+        port being only set for the tap flows without source VLANs.
+        """
+        source_port = sa.case(
+            (TapFlow.source_vlans.is_(None), TapFlow.source_port),
+            else_=sa.null())
+        query = context.session.query(
+            source_port, TapFlow.source_vlans, TapFlow.vlan_filter).filter(
+                TapFlow.tap_service_id == tap_service_id,
+                TapFlow.status == constants.ACTIVE).distinct()
+        return [tuple(row) for row in query]
+
     @db_api.retry_if_session_inactive()
     @db_api.CONTEXT_READER
     def get_tap_flows(self, context, filters=None, fields=None,
@@ -309,12 +588,43 @@ class Taas_db_Mixin(taas_extension.TaasPluginBase):
                                           self._make_tap_flow_dict,
                                           filters=filters, fields=fields)
 
+    def _get_cached_ports(self, context, port_ids):
+        if not cfg.CONF.taas.port_details_cache_ttl:
+            return {}
+        return self._port_details_cache.get(
+            PortDetailsCache.get_scope(context), port_ids)
+
+    def _cache_ports(self, context, ports):
+        ttl = cfg.CONF.taas.port_details_cache_ttl
+        if ttl:
+            self._port_details_cache.add(
+                PortDetailsCache.get_scope(context), ports, ttl)
+
     @db_api.retry_if_session_inactive()
     @db_api.CONTEXT_READER
     def get_port_details(self, context, port_id):
-        port = self._core_plugin().get_port(context, port_id)
+        port = self._get_cached_ports(context, [port_id]).get(port_id)
+        if port is None:
+            port = self._core_plugin().get_port(context, port_id)
+            self._cache_ports(context, [port])
 
-        return port
+        return copy.deepcopy(port)
+
+    @db_api.retry_if_session_inactive()
+    @db_api.CONTEXT_READER
+    def get_ports_details(self, context, port_ids):
+        if not port_ids:
+            return {}
+        ports = self._get_cached_ports(context, port_ids)
+        missing = [port_id for port_id in port_ids if port_id not in ports]
+        if missing:
+            fetched = self._core_plugin().get_ports(
+                context, filters={'id': missing})
+            self._cache_ports(context, fetched)
+            ports.update((port['id'], port) for port in fetched)
+
+        return {port_id: copy.deepcopy(port)
+                for port_id, port in ports.items()}
 
     @db_api.retry_if_session_inactive()
     @db_api.CONTEXT_WRITER
@@ -333,3 +643,17 @@ class Taas_db_Mixin(taas_extension.TaasPluginBase):
         tap_flow_db = self._get_tap_flow(context, id)
         tap_flow_db.update(t_f)
         return self._make_tap_flow_dict(tap_flow_db)
+
+    @db_api.retry_if_session_inactive()
+    @db_api.CONTEXT_WRITER
+    def update_tap_services_status(self, context, ids, status):
+        LOG.debug("update_tap_services_status() called")
+        context.session.query(TapService).filter(
+            TapService.id.in_(ids)).update({'status': status})
+
+    @db_api.retry_if_session_inactive()
+    @db_api.CONTEXT_WRITER
+    def update_tap_flows_status(self, context, ids, status):
+        LOG.debug("update_tap_flows_status() called")
+        context.session.query(TapFlow).filter(
+            TapFlow.id.in_(ids)).update({'status': status})
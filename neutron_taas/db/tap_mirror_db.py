@@ -14,7 +14,9 @@
 import sqlalchemy as sa
 from sqlalchemy.orm import exc
 
+from neutron.plugins.ml2 import models as ml2_models
 from neutron_lib.api.definitions import tap_mirror as mirror_extension
+from neutron_lib import constants
 from neutron_lib.db import api as db_api
 from neutron_lib.db import constants as db_const
 from neutron_lib.db import model_base
@@ -22,6 +24,7 @@ from neutron_lib.db import model_query
 from neutron_lib.db import utils as db_utils
 from neutron_lib.exceptions import taas as taas_exc
 from neutron_lib.plugins import directory
+from oslo_db import exception as db_exc
 from oslo_log import helpers as log_helpers
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
@@ -44,18 +47,42 @@ class TapMirror(model_base.BASEV2, model_base.HasId,
     name = sa.Column(sa.String(db_const.NAME_FIELD_SIZE))
     description = sa.Column(sa.String(db_const.DESCRIPTION_FIELD_SIZE))
     port_id = sa.Column(sa.String(db_const.UUID_FIELD_SIZE),
-                        nullable=False)
+                        nullable=False, index=True)
     directions = sa.Column(sa.String(255), nullable=False)
     remote_ip = sa.Column(sa.String(db_const.IP_ADDR_FIELD_SIZE),
                           nullable=False)
     mirror_type = sa.Column(sa.Enum('erspanv1', 'gre',
                                     name='tapmirrors_type'),
                             nullable=False)
+    status = sa.Column(sa.String(16), nullable=False,
+                       server_default=constants.ACTIVE)
     api_collections = [mirror_extension.COLLECTION_NAME]
     collection_resource_map = {
         mirror_extension.COLLECTION_NAME: mirror_extension.RESOURCE_NAME}
 
 
+class TapMirrorTunnelId(model_base.BASEV2):
+    """Represents the tunnel id of a direction of a Tap Mirror
+
+    The unique constraint lets the database reject a tunnel id already used
+    by another Tap Mirror.
+    """
+
+    __tablename__ = 'tap_mirror_tunnel_ids'
+    __table_args__ = (
+        sa.UniqueConstraint('tunnel_id',
+                            name='uniq_tap_mirror_tunnel_ids0tunnel_id'),
+        model_base.BASEV2.__table_args__
+    )
+
+    tap_mirror_id = sa.Column(sa.String(db_const.UUID_FIELD_SIZE),
+                              sa.ForeignKey('tap_mirrors.id',
+                                            ondelete='CASCADE'),
+                              primary_key=True)
+    direction = sa.Column(sa.String(16), primary_key=True)
+    tunnel_id = sa.Column(sa.Integer(), nullable=False)
+
+
 class Taas_mirror_db_mixin(tap_m_extension.TapMirrorBase):
 
     def _make_tap_mirror_dict(self, tap_mirror, fields=None):
@@ -68,6 +95,7 @@ class Taas_mirror_db_mixin(tap_m_extension.TapMirrorBase):
             'directions': jsonutils.loads(tap_mirror.get('directions')),
             'remote_ip': tap_mirror.get('remote_ip'),
             'mirror_type': tap_mirror.get('mirror_type'),
+            'status': tap_mirror.get('status'),
         }
         return db_utils.resource_fields(res, fields)
 
@@ -92,12 +120,38 @@ class Taas_mirror_db_mixin(tap_m_extension.TapMirrorBase):
                 directions=jsonutils.dumps(fields.get('directions')),
                 remote_ip=fields.get('remote_ip'),
                 mirror_type=fields.get('mirror_type'),
+                status=constants.PENDING_CREATE,
             )
-            # TODO(lajoskatona): Check tunnel_id...
             context.session.add(tap_mirror_db)
+            self._add_tap_mirror_tunnel_ids(context, tap_mirror_db.id,
+                                            fields.get('directions'))
 
             return self._make_tap_mirror_dict(tap_mirror_db)
 
+    def _add_tap_mirror_tunnel_ids(self, context, tap_mirror_id, directions):
+        tunnel_ids = {direction: tunnel_id
+                      for direction, tunnel_id in directions.items()
+                      if tunnel_id is not None}
+        conflict = context.session.query(TapMirrorTunnelId.tunnel_id).filter(
+            TapMirrorTunnelId.tunnel_id.in_(tunnel_ids.values())).first()
+        if conflict:
+            raise taas_exc.TapMirrorTunnelConflict(
+                tunnel_id=conflict.tunnel_id)
+
+        for direction, tunnel_id in tunnel_ids.items():
+            context.session.add(TapMirrorTunnelId(
+                tap_mirror_id=tap_mirror_id, direction=direction,
+                tunnel_id=tunnel_id))
+        try:
+            # Catch the tunnel ids allocated by a concurrent request, or
+            # used twice by this Tap Mirror.
+            context.session.flush()
+        except db_exc.DBDuplicateEntry as e:
+            raise taas_exc.TapMirrorTunnelConflict(
+                tunnel_id=e.value or ', '.join(
+                    str(tunnel_id) for tunnel_id in tunnel_ids.values())
+            ) from e
+
     def _get_tap_mirror(self, context, id):
         with db_api.CONTEXT_READER.using(context):
             try:
@@ -121,6 +175,20 @@ class Taas_mirror_db_mixin(tap_m_extension.TapMirrorBase):
                                               self._make_tap_mirror_dict,
                                               filters=filters, fields=fields)
 
+    @db_api.retry_if_session_inactive()
+    def get_active_tap_mirrors_by_host(self, context, host):
+        """Get the active tap mirrors whose port is bound to a host."""
+        with db_api.CONTEXT_READER.using(context):
+            query = context.session.query(TapMirror).join(
+                ml2_models.PortBinding,
+                ml2_models.PortBinding.port_id == TapMirror.port_id
+            ).filter(
+                ml2_models.PortBinding.host == host,
+                ml2_models.PortBinding.status == constants.ACTIVE,
+                TapMirror.status == constants.ACTIVE
+            )
+            return [self._make_tap_mirror_dict(tm) for tm in query]
+
     @log_helpers.log_method_call
     def delete_tap_mirror(self, context, id):
         with db_api.CONTEXT_WRITER.using(context):
@@ -137,3 +205,10 @@ class Taas_mirror_db_mixin(tap_m_extension.TapMirrorBase):
             tap_mirror_db = self._get_tap_mirror(context, id)
             tap_mirror_db.update(t_m)
             return self._make_tap_mirror_dict(tap_mirror_db)
+
+    @db_api.retry_if_session_inactive()
+    @log_helpers.log_method_call
+    def update_tap_mirrors_status(self, context, ids, status):
+        with db_api.CONTEXT_WRITER.using(context):
+            context.session.query(TapMirror).filter(
+                TapMirror.id.in_(ids)).update({'status': status})
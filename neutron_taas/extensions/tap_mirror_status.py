@@ -0,0 +1,62 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+
+from neutron_lib.api.definitions import tap_mirror
+from neutron_lib.api import extensions as api_extensions
+
+ALIAS = 'tap-mirror-status'
+IS_SHIM_EXTENSION = False
+IS_STANDARD_ATTR_EXTENSION = False
+NAME = "Tap as a Service mirror status"
+DESCRIPTION = ("Neutron Tap as a Service extension reporting the "
+               "provisioning status of tap mirrors.")
+UPDATED_TIMESTAMP = "2026-10-18T14:00:00-00:00"
+RESOURCE_ATTRIBUTE_MAP = {
+    tap_mirror.COLLECTION_NAME: {
+        'status': {
+            'allow_post': False, 'allow_put': False,
+            'is_visible': True, 'is_filter': True},
+    }
+}
+SUB_RESOURCE_ATTRIBUTE_MAP = None
+ACTION_MAP = {}
+ACTION_STATUS = {}
+REQUIRED_EXTENSIONS = [tap_mirror.ALIAS]
+OPTIONAL_EXTENSIONS = []
+
+
+class Tap_mirror_status(api_extensions.ExtensionDescriptor):
+    """Extension class adding the status of tap mirrors."""
+
+    @classmethod
+    def get_name(cls):
+        return NAME
+
+    @classmethod
+    def get_alias(cls):
+        return ALIAS
+
+    @classmethod
+    def get_description(cls):
+        return DESCRIPTION
+
+    @classmethod
+    def get_updated(cls):
+        return UPDATED_TIMESTAMP
+
+    def get_required_extensions(self):
+        return REQUIRED_EXTENSIONS
+
+    def get_extended_resources(self, version):
+        return RESOURCE_ATTRIBUTE_MAP
@@ -14,11 +14,18 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import os
+import queue
+import random
+import threading
+import time
 
 from neutron import manager
 from neutron_taas.services.taas.drivers.linux \
     import ovs_constants as taas_ovs_consts
 
+from neutron_taas.common import constants as taas_consts
 from neutron_taas.common import topics
 from neutron_taas.services.taas.agents import taas_agent_api as api
 
@@ -30,17 +37,240 @@ from oslo_config import cfg
 from oslo_log import helpers as log_helpers
 from oslo_log import log as logging
 import oslo_messaging as messaging
+from oslo_serialization import jsonutils
 from oslo_service import service
+from oslo_utils import fileutils
 
 LOG = logging.getLogger(__name__)
 
+# Upper bound of the driver calls accepted but not completed yet, the RPC
+# consumer blocks once it is reached.
+MAX_PENDING_TASKS = 1000
+# Seconds the status changes are buffered before being reported to the
+# plugin in a single message.
+STATUS_REPORT_WINDOW = 0.5
+# Ordering keys of the tasks run alone, after all the tasks submitted before
+# them and before all the tasks submitted after them.
+ALL_KEYS = ('*',)
+
+
+class _Task():
+
+    def __init__(self, keys, func, args):
+        self.keys = keys
+        self.func = func
+        self.args = args
+        self.enqueued_at = time.monotonic()
+        # Number of the keys of the task for which an earlier task is
+        # still pending.
+        self.waiting = 0
+
+
+class OrderedExecutor():
+    """Run tasks on a pool of threads, in order per key.
+
+    Every task is submitted with a set of keys. A task starts once all the
+    tasks submitted before it and sharing one of its keys are completed,
+    tasks without a common key run concurrently. A task submitted with
+    ALL_KEYS shares a key with every other task.
+    """
+
+    def __init__(self, workers, max_pending=MAX_PENDING_TASKS):
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # Pending tasks per key, the head of each chain being the only one
+        # allowed to run for that key.
+        self._chains = {}
+        self._ready = queue.Queue()
+        self._pending = 0
+        self._stats = {'tasks_processed': 0,
+                       'tasks_failed': 0,
+                       'latency_total': 0.0,
+                       'latency_max': 0.0,
+                       'wait_total': 0.0,
+                       'wait_max': 0.0}
+        self._threads = []
+        for _i in range(workers):
+            worker = threading.Thread(target=self._worker)
+            worker.daemon = True
+            worker.start()
+            self._threads.append(worker)
+
+    def submit(self, keys, func, *args):
+        self._slots.acquire()
+        with self._lock:
+            self._pending += 1
+            if keys is ALL_KEYS:
+                task = _Task(set(self._chains) | {ALL_KEYS}, func, args)
+            else:
+                task = _Task(set(keys), func, args)
+                barriers = self._chains.get(ALL_KEYS)
+                if barriers:
+                    # The keys without pending tasks are not in the chains
+                    # the last all keys task was queued on, make it the
+                    # head of their chains.
+                    for key in task.keys.difference(self._chains):
+                        self._chains[key] = collections.deque([barriers[-1]])
+                        barriers[-1].keys.add(key)
+            for key in task.keys:
+                chain = self._chains.setdefault(key, collections.deque())
+                if chain:
+                    task.waiting += 1
+                chain.append(task)
+            if not task.waiting:
+                self._ready.put(task)
+
+    def _complete(self, task):
+        with self._lock:
+            self._pending -= 1
+            for key in task.keys:
+                chain = self._chains[key]
+                chain.popleft()
+                if not chain:
+                    del self._chains[key]
+                    continue
+                chain[0].waiting -= 1
+                if not chain[0].waiting:
+                    self._ready.put(chain[0])
+        self._slots.release()
+
+    def _worker(self):
+        while True:
+            task = self._ready.get()
+            if task is None:
+                break
+            started_at = time.monotonic()
+            failed = False
+            try:
+                task.func(*task.args)
+            except Exception:
+                failed = True
+                LOG.exception('Unexpected exception running %s', task.func)
+            latency = time.monotonic() - started_at
+            self._record_task(started_at - task.enqueued_at, latency, failed)
+            self._complete(task)
+            LOG.debug('Ran %(func)s in %(latency).3fs, %(pending)d tasks '
+                      'pending', {'func': task.func, 'latency': latency,
+                                  'pending': self._pending})
+
+    def _record_task(self, wait, latency, failed):
+        with self._lock:
+            self._stats['tasks_processed'] += 1
+            if failed:
+                self._stats['tasks_failed'] += 1
+            self._stats['latency_total'] += latency
+            self._stats['latency_max'] = max(self._stats['latency_max'],
+                                             latency)
+            self._stats['wait_total'] += wait
+            self._stats['wait_max'] = max(self._stats['wait_max'], wait)
+
+    def get_stats(self):
+        """Return the counters of the executor.
+
+        The latencies are the run times of the tasks and the waits the
+        times they spent queued, in seconds.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queue_depth'] = self._pending
+            stats['ready_depth'] = self._ready.qsize()
+        processed = stats['tasks_processed']
+        stats['latency_avg'] = (
+            stats.pop('latency_total') / processed if processed else 0.0)
+        stats['wait_avg'] = (
+            stats.pop('wait_total') / processed if processed else 0.0)
+        return stats
+
+    def stop(self):
+        for _worker in self._threads:
+            self._ready.put(None)
+        for worker in self._threads:
+            worker.join()
+
+
+class AgentStateStore():
+    """Snapshot of the tap resources applied by the agent.
+
+    The messages of the tap services, tap flows and tap mirrors applied on
+    the host are kept by id and saved to a JSON file, so that a restarted
+    agent can reapply them without waiting for the plugin.
+    """
+
+    RESOURCES = ('tap_services', 'tap_flows', 'tap_mirrors')
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._state = {resources: {} for resources in self.RESOURCES}
+        self._dirty = False
+
+    def load(self):
+        if not os.path.exists(self._path):
+            return False
+        try:
+            with open(self._path) as state_file:
+                state = jsonutils.loads(state_file.read())
+        except (OSError, ValueError):
+            LOG.warning("Unable to read the TaaS agent state file %s, "
+                        "ignoring it", self._path, exc_info=True)
+            return False
+        with self._lock:
+            for resources in self.RESOURCES:
+                self._state[resources] = state.get(resources, {})
+        return True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = jsonutils.dumps(self._state)
+            self._dirty = False
+        fileutils.ensure_tree(os.path.dirname(self._path), mode=0o755)
+        # Write a new file and rename it, so that an agent stopped while
+        # saving finds the previous snapshot.
+        # The snapshot holds the details of the ports of every project, it is
+        # only readable by the agent user.
+        tmp_path = self._path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, 'w') as state_file:
+            state_file.write(data)
+        os.replace(tmp_path, self._path)
+
+    def get(self, resources):
+        with self._lock:
+            return list(self._state[resources].values())
+
+    def add(self, resources, resource_id, msg):
+        with self._lock:
+            self._state[resources][resource_id] = msg
+            self._dirty = True
+
+    def remove(self, resources, resource_id):
+        with self._lock:
+            if self._state[resources].pop(resource_id, None) is not None:
+                self._dirty = True
+
 
 class TaasPluginApi(api.TaasPluginApiMixin):
+    """RPC calls to the TaaS plugin
+
+    API version history:
+        1.0 - Initial version
+        1.1 - set_tap_resources_status, driver type and agent RPC version
+              in the sync_tap_resources requests
+    """
 
     def __init__(self, topic, host):
         super().__init__(topic, host)
-        target = messaging.Target(topic=topic, version='1.0')
-        self.client = n_rpc.get_client(target)
+        self._target = messaging.Target(topic=topic, version='1.0')
+        # Only the 1.0 messages are sent until a server answered the
+        # resync of the agent, older servers do not handle the others.
+        self.client = n_rpc.get_client(self._target, version_cap='1.0')
+
+    def set_version_cap(self, version_cap):
+        """Set the latest version of the API the plugin can be sent."""
+        self.client = n_rpc.get_client(self._target, version_cap=version_cap)
 
     def sync_tap_resources(self, sync_tap_res, host):
         """Send Rpc to plugin to recreate pre-existing tap resources."""
@@ -73,14 +303,45 @@ class TaasPluginApi(api.TaasPluginApiMixin):
         cctxt.cast(context, 'set_tap_flow_status', msg=msg, status=status,
                    host=host)
 
-    @log_helpers.log_method_call
     def set_tap_mirror_status(self, msg, status, host):
-        LOG.debug("In RPC Call for set Tap Mirror status")
-        # TODO(lajoskatona): We can have a status field to indicate that the
-        #  Neutron port is UP, is it useful?
+        LOG.debug("In RPC Call for set tap mirror status: Host=%s, MSG=%s, "
+                  "Status=%s", host, msg, status)
+
+        context = neutron_context.get_admin_context()
+
+        cctxt = self.client.prepare(fanout=False)
+        cctxt.cast(context, 'set_tap_mirror_status', msg=msg, status=status,
+                   host=host)
+
+    def set_tap_resources_status(self, statuses, host):
+        LOG.debug("In RPC Call for set tap resources status: Host=%s, "
+                  "Statuses=%s", host, statuses)
+
+        if not self.client.can_send_version('1.1'):
+            # Older servers take the status of one resource at a time.
+            for entry in statuses:
+                set_status = getattr(self,
+                                     'set_%s_status' % entry['resource'])
+                set_status({'id': entry['id']}, entry['status'], host)
+            return
+
+        context = neutron_context.get_admin_context()
+
+        cctxt = self.client.prepare(fanout=False, version='1.1')
+        cctxt.cast(context, 'set_tap_resources_status', statuses=statuses,
+                   host=host)
 
 
 class TaasAgentRpcCallback(api.TaasAgentRpcCallbackMixin):
+    """Handle the RPC messages of the TaaS plugin
+
+    API version history:
+        1.0 - Initial version, fanout casts on the TaaS agent topic
+        1.1 - Host targeted casts on the agent driver topics,
+              create_tap_flows, delete_tap_flows and sync_tap_resources_reply
+    """
+
+    target = messaging.Target(version='1.1')
 
     def __init__(self, conf, driver_type):
 
@@ -88,6 +349,14 @@ class TaasAgentRpcCallback(api.TaasAgentRpcCallbackMixin):
 
         self.conf = conf
         self.driver_type = driver_type
+        # Status changes waiting to be reported to the plugin.
+        self._statuses = []
+        self._statuses_lock = threading.Lock()
+        self._statuses_pending = threading.Event()
+        # Snapshot of the applied tap resources, None when disabled.
+        self.state_store = None
+        # Completes the resync if the plugin does not answer it.
+        self._sync_reply_timer = None
 
         super().__init__()
 
@@ -99,73 +368,184 @@ class TaasAgentRpcCallback(api.TaasAgentRpcCallbackMixin):
         self.func_dict = {
             'create_tap_service': {
                 'msg_name': 'tap_service',
-                'set_status_func_name': 'set_tap_service_status',
                 'fail_status': constants.ERROR,
                 'succ_status': constants.ACTIVE},
             'create_tap_flow': {
                 'msg_name': 'tap_flow',
-                'set_status_func_name': 'set_tap_flow_status',
                 'fail_status': constants.ERROR,
                 'succ_status': constants.ACTIVE},
             'delete_tap_service': {
                 'msg_name': 'tap_service',
-                'set_status_func_name': 'set_tap_service_status',
                 'fail_status': constants.PENDING_DELETE,
                 'succ_status': constants.INACTIVE},
             'delete_tap_flow': {
                 'msg_name': 'tap_flow',
-                'set_status_func_name': 'set_tap_flow_status',
                 'fail_status': constants.PENDING_DELETE,
                 'succ_status': constants.INACTIVE},
             'create_tap_mirror': {
                 'msg_name': 'tap_mirror',
-                'set_status_func_name': 'set_tap_mirror_status',
                 'fail_status': constants.ERROR,
                 'succ_status': constants.ACTIVE},
             'delete_tap_mirror': {
                 'msg_name': 'tap_mirror',
-                'set_status_func_name': 'set_tap_mirror_status',
                 'fail_status': constants.PENDING_DELETE,
                 'succ_status': constants.INACTIVE},
             'periodic_tasks': {
                 'msg_name': 'periodic_tasks',
             }
         }
-        self.portbind_drivers_map = {portbindings.VNIC_DIRECT: 'sriov',
-                                     portbindings.VNIC_NORMAL: 'ovs'}
+        self.portbind_drivers_map = taas_consts.VNIC_TYPE_DRIVER_TYPES
+        self.executor = OrderedExecutor(self.conf.taas_agent_workers)
+        resync_delay = 0
+        if self.conf.taas_agent_state_path:
+            self.state_store = AgentStateStore(os.path.join(
+                self.conf.taas_agent_state_path,
+                'taas-agent-%s.json' % self.driver_type))
+            if self.state_store.load():
+                # The plugin is only asked for the tap resources of the host
+                # later on, to reconcile the restored state.
+                self._restore_state()
+                resync_delay = self.conf.taas_agent_warm_resync_delay
         self._taas_rpc_setup()
-        TaasAgentService(self).start(self.taas_plugin_rpc, self.conf.host)
+        status_reporter = threading.Thread(target=self._status_reporter)
+        status_reporter.daemon = True
+        status_reporter.start()
+        TaasAgentService(self).start(self.taas_plugin_rpc, self.conf.host,
+                                     resync_delay=resync_delay)
 
     def consume_api(self, agent_api):
         self.agent_api = agent_api
 
+    @staticmethod
+    def _get_ordering_keys(args, func_name):
+        """Return the resources the driver call must be ordered against."""
+        if func_name == 'periodic_tasks':
+            return [('periodic_tasks',)]
+        if func_name in ('create_tap_service', 'delete_tap_service'):
+            return [('tap_service', args['tap_service']['id'])]
+        keys = [('port', args['port']['id'])]
+        if func_name in ('create_tap_flow', 'delete_tap_flow'):
+            keys.append(('tap_service',
+                         args['tap_flow']['tap_service_id']))
+        else:
+            keys.append(('tap_mirror', args['tap_mirror']['id']))
+        return keys
+
     def _invoke_driver_for_plugin_api(self, context, args, func_name):
+        # The driver calls of a tap service, tap mirror or source port run
+        # in order, the ones of unrelated resources concurrently, so that
+        # a slow call does not hold the RPC consumer.
+        self.executor.submit(self._get_ordering_keys(args, func_name),
+                             self._run_driver_func, args, func_name)
+
+    def _run_driver_func(self, args, func_name):
         LOG.debug("Invoking Driver for %(func_name)s from agent",
                   {'func_name': func_name})
 
-        status_msg = {}
-        if func_name != 'periodic_tasks':
-            func_dict = self.func_dict[func_name]
-            status_msg = {'id': args[func_dict['msg_name']]['id']}
-
         try:
             driver_func = getattr(self.taas_driver, func_name)
             driver_func(args)
         except Exception:
             LOG.error("Failed to invoke the driver")
-            rpc_func = getattr(
-                self.taas_plugin_rpc,
-                self.func_dict[func_name]['set_status_func_name'])
-            rpc_func(status_msg, self.func_dict[func_name]['fail_status'],
-                     self.conf.host)
-            return
+            status_key = 'fail_status'
+        else:
+            status_key = 'succ_status'
 
         if func_name != 'periodic_tasks':
-            rpc_func = getattr(
-                self.taas_plugin_rpc,
-                self.func_dict[func_name]['set_status_func_name'])
-            rpc_func(status_msg, self.func_dict[func_name]['succ_status'],
-                     self.conf.host)
+            func_dict = self.func_dict[func_name]
+            resource_id = args[func_dict['msg_name']]['id']
+            self._report_status(func_dict['msg_name'], resource_id,
+                                func_dict[status_key])
+            if status_key == 'succ_status':
+                self._update_state(func_name, func_dict['msg_name'] + 's',
+                                   resource_id, args)
+
+    def _update_state(self, func_name, resources, resource_id, msg):
+        if self.state_store is None:
+            return
+        if func_name.startswith('create_'):
+            self.state_store.add(resources, resource_id, msg)
+        else:
+            self.state_store.remove(resources, resource_id)
+        if func_name == 'delete_tap_service':
+            # The tap flows of a deleted tap service are deleted along by
+            # the plugin, without a delete_tap_flow call.
+            for tap_flow_msg in self.state_store.get('tap_flows'):
+                if tap_flow_msg['tap_flow']['tap_service_id'] == resource_id:
+                    self.state_store.remove('tap_flows',
+                                            tap_flow_msg['tap_flow']['id'])
+        self._statuses_pending.set()
+
+    def _restore_state(self):
+        """Reapply the tap resources of the last agent state snapshot."""
+        tap_resources_msg = {
+            resources: self.state_store.get(resources)
+            for resources in ('tap_services', 'tap_flows')}
+        LOG.info("Restoring %(services)d tap services, %(flows)d tap flows "
+                 "and %(mirrors)d tap mirrors from the agent state",
+                 {'services': len(tap_resources_msg['tap_services']),
+                  'flows': len(tap_resources_msg['tap_flows']),
+                  'mirrors': len(self.state_store.get('tap_mirrors'))})
+        # The status of the resources is left as is in the plugin, the
+        # resync reconciles it.
+        try:
+            self.taas_driver.sync_tap_resources(tap_resources_msg)
+        except Exception:
+            LOG.exception("Failed to restore the tap resources")
+        for tap_mirror_msg in self.state_store.get('tap_mirrors'):
+            try:
+                self.taas_driver.create_tap_mirror(tap_mirror_msg)
+            except Exception:
+                LOG.exception("Failed to restore the tap mirror %s",
+                              tap_mirror_msg['tap_mirror']['id'])
+
+    def _get_stale_resources(self, tap_resources_msg):
+        """Return the restored tap resources the plugin did not send back."""
+        stale = {resources: [] for resources in AgentStateStore.RESOURCES}
+        if self.state_store is None:
+            return stale
+        for resources in AgentStateStore.RESOURCES:
+            # Older servers do not send the tap mirrors back.
+            if resources not in tap_resources_msg:
+                continue
+            msg_name = resources[:-1]
+            ids = {msg[msg_name]['id'] for msg in tap_resources_msg[resources]}
+            stale[resources] = [msg for msg in self.state_store.get(resources)
+                                if msg[msg_name]['id'] not in ids]
+        return stale
+
+    def _report_status(self, resource, resource_id, status):
+        with self._statuses_lock:
+            self._statuses.append({'resource': resource,
+                                   'id': resource_id,
+                                   'status': status})
+            self._statuses_pending.set()
+
+    def _flush_statuses(self):
+        with self._statuses_lock:
+            statuses, self._statuses = self._statuses, []
+            self._statuses_pending.clear()
+        if statuses:
+            self.taas_plugin_rpc.set_tap_resources_status(statuses,
+                                                          self.conf.host)
+
+    def _status_reporter(self):
+        # Status changes are buffered for a short while after the first one
+        # and sent in a single message, so that a burst of driver calls
+        # results in a few bulk updates on the plugin side. The agent state
+        # snapshot is saved along.
+        while True:
+            self._statuses_pending.wait()
+            time.sleep(STATUS_REPORT_WINDOW)
+            try:
+                self._flush_statuses()
+            except Exception:
+                LOG.exception("Failed to report the tap resources status")
+            if self.state_store is not None:
+                try:
+                    self.state_store.save()
+                except Exception:
+                    LOG.exception("Failed to save the TaaS agent state")
 
     def create_tap_service(self, context, tap_service_msg, host):
         """Handle Rpc from plugin to create a tap_service."""
@@ -230,6 +610,137 @@ class TaasAgentRpcCallback(api.TaasAgentRpcCallbackMixin):
             tap_flow_msg,
             'delete_tap_flow')
 
+    def create_tap_flows(self, context, tap_flow_msgs, host):
+        LOG.debug("In RPC Call for Create Tap Flows: MSG=%s", tap_flow_msgs)
+
+        for tap_flow_msg in tap_flow_msgs:
+            self.create_tap_flow(context, tap_flow_msg, host)
+
+    def delete_tap_flows(self, context, tap_flow_msgs, host):
+        LOG.debug("In RPC Call for Delete Tap Flows: MSG=%s", tap_flow_msgs)
+
+        for tap_flow_msg in tap_flow_msgs:
+            self.delete_tap_flow(context, tap_flow_msg, host)
+
+    def sync_tap_resources_reply(self, context, tap_resources_msg, host):
+        """Handle Rpc from plugin with all the tap resources of a host."""
+        LOG.debug("In RPC Call for Sync Tap Resources Reply: MSG=%s",
+                  tap_resources_msg)
+
+        # Only the servers handling the 1.1 plugin API send the reply.
+        self.taas_plugin_rpc.set_version_cap(None)
+        if self._sync_reply_timer is not None:
+            self._sync_reply_timer.cancel()
+
+        tap_resources_msg = {
+            resources: [msg for msg in tap_resources_msg[resources]
+                        if self._driver_and_host_verification(host,
+                                                              msg['port'])]
+            for resources in AgentStateStore.RESOURCES
+            if resources in tap_resources_msg}
+        keys = [key
+                for tap_service_msg in tap_resources_msg['tap_services']
+                for key in self._get_ordering_keys(tap_service_msg,
+                                                   'create_tap_service')]
+        keys += [key
+                 for tap_flow_msg in tap_resources_msg['tap_flows']
+                 for key in self._get_ordering_keys(tap_flow_msg,
+                                                    'create_tap_flow')]
+        keys += [key
+                 for tap_mirror_msg in tap_resources_msg.get('tap_mirrors', [])
+                 for key in self._get_ordering_keys(tap_mirror_msg,
+                                                    'create_tap_mirror')]
+        stale = self._get_stale_resources(tap_resources_msg)
+        keys += [('tap_service', msg['tap_service']['id'])
+                 for msg in stale['tap_services']]
+        keys += [key for msg in stale['tap_flows']
+                 for key in self._get_ordering_keys(msg, 'delete_tap_flow')]
+        keys += [key for msg in stale['tap_mirrors']
+                 for key in self._get_ordering_keys(msg, 'delete_tap_mirror')]
+        self.executor.submit(keys, self._sync_tap_resources,
+                             tap_resources_msg, stale)
+
+    def _remove_stale_resources(self, stale):
+        # Tap resources restored from the agent state but deleted while the
+        # agent was down, the plugin does not know them anymore.
+        for func_name, resources in (('delete_tap_mirror', 'tap_mirrors'),
+                                     ('delete_tap_flow', 'tap_flows'),
+                                     ('delete_tap_service', 'tap_services')):
+            for msg in stale[resources]:
+                resource_id = msg[resources[:-1]]['id']
+                LOG.info("Removing the stale %(resource)s %(id)s",
+                         {'resource': resources[:-1], 'id': resource_id})
+                try:
+                    getattr(self.taas_driver, func_name)(msg)
+                except Exception:
+                    LOG.exception("Failed to remove the stale %s",
+                                  resource_id)
+                    continue
+                self._update_state(func_name, resources, resource_id, msg)
+
+    def _sync_tap_resources(self, tap_resources_msg, stale=None):
+        LOG.debug("Invoking Driver for sync_tap_resources from agent")
+
+        if stale:
+            self._remove_stale_resources(stale)
+
+        try:
+            self.taas_driver.sync_tap_resources(tap_resources_msg)
+        except Exception:
+            # Retry the resources one by one, so that only the failing ones
+            # are reported in error.
+            LOG.exception("Failed to sync the tap resources, creating them "
+                          "one by one")
+            for tap_service_msg in tap_resources_msg['tap_services']:
+                self._run_driver_func(tap_service_msg, 'create_tap_service')
+            for tap_flow_msg in tap_resources_msg['tap_flows']:
+                self._run_driver_func(tap_flow_msg, 'create_tap_flow')
+        else:
+            for tap_service_msg in tap_resources_msg['tap_services']:
+                self._report_status('tap_service',
+                                    tap_service_msg['tap_service']['id'],
+                                    constants.ACTIVE)
+                self._update_state('create_tap_service', 'tap_services',
+                                   tap_service_msg['tap_service']['id'],
+                                   tap_service_msg)
+            for tap_flow_msg in tap_resources_msg['tap_flows']:
+                self._report_status('tap_flow',
+                                    tap_flow_msg['tap_flow']['id'],
+                                    constants.ACTIVE)
+                self._update_state('create_tap_flow', 'tap_flows',
+                                   tap_flow_msg['tap_flow']['id'],
+                                   tap_flow_msg)
+
+        # The drivers only apply the tap services and tap flows as a whole.
+        for tap_mirror_msg in tap_resources_msg.get('tap_mirrors', []):
+            self._run_driver_func(tap_mirror_msg, 'create_tap_mirror')
+
+        # The tap resources of the host are all in place now
+        self._sync_tap_resources_done()
+
+    def _sync_tap_resources_done(self):
+        try:
+            self.taas_driver.sync_tap_resources_done()
+        except Exception:
+            LOG.exception("Failed to complete the tap resources sync")
+
+    def expect_sync_reply(self, timeout):
+        """Complete the resync if the plugin did not answer in time.
+
+        Servers only handling the 1.0 plugin API recreate the tap resources
+        with one message each instead of answering the resync, and the
+        answer of the others may be lost.
+        """
+        self._sync_reply_timer = threading.Timer(timeout,
+                                                 self._sync_reply_timeout)
+        self._sync_reply_timer.daemon = True
+        self._sync_reply_timer.start()
+
+    def _sync_reply_timeout(self):
+        LOG.warning("No tap resources resync reply received from the "
+                    "plugin, completing the resync")
+        self.executor.submit(ALL_KEYS, self._sync_tap_resources_done)
+
     @log_helpers.log_method_call
     def create_tap_mirror(self, context, tap_mirror_msg, host):
         """Handle Rpc from plugin to create a tap_mirror."""
@@ -272,6 +783,11 @@ class TaasAgentRpcCallback(api.TaasAgentRpcCallbackMixin):
         endpoints = [self]
         conn = n_rpc.Connection()
         conn.create_consumer(topics.TAAS_AGENT, endpoints, fanout=False)
+        # The plugin casts the messages of a port to the agent of its host
+        # using the port driver type, so that only one of the TaaS agents
+        # of a host gets them.
+        conn.create_consumer(topics.get_agent_topic(self.driver_type),
+                             endpoints, fanout=False)
         conn.consume_in_threads()
 
     def periodic_tasks(self):
@@ -299,7 +815,7 @@ class TaasAgentService(service.Service):
         super().__init__()
         self.driver = driver
 
-    def start(self, taas_plugin_rpc, host):
+    def start(self, taas_plugin_rpc, host, resync_delay=0):
         super().start()
 
         if self.driver.get_driver_type() == \
@@ -311,5 +827,18 @@ class TaasAgentService(service.Service):
             )
 
         # Indicate the TaaS plugin to recreate the taas resources
-        rpc_msg = {'host_id': host}
-        taas_plugin_rpc.sync_tap_resources(rpc_msg, host)
+        rpc_msg = {'host_id': host,
+                   'driver_type': self.driver.get_driver_type(),
+                   'rpc_version': self.driver.target.version}
+        resync_delay += random.uniform(  # nosec B311
+            0, cfg.CONF.taas_agent_resync_jitter)
+        self.driver.expect_sync_reply(
+            resync_delay + cfg.CONF.taas_agent_sync_reply_timeout)
+        if not resync_delay:
+            taas_plugin_rpc.sync_tap_resources(rpc_msg, host)
+            return
+        resync_timer = threading.Timer(resync_delay,
+                                       taas_plugin_rpc.sync_tap_resources,
+                                       args=(rpc_msg, host))
+        resync_timer.daemon = True
+        resync_timer.start()
@@ -29,6 +29,56 @@ OPTS = [
         'taas_agent_periodic_interval',
         default=5,
         help=_('Seconds between periodic task runs')
+    ),
+    cfg.IntOpt(
+        'taas_agent_workers',
+        default=4,
+        min=1,
+        help=_('Number of threads of the TaaS agent running the driver '
+               'calls. The calls of a tap service, tap mirror or port are '
+               'run in order, the ones of unrelated resources concurrently.')
+    ),
+    cfg.StrOpt(
+        'taas_agent_state_path',
+        default='$state_path/taas',
+        help=_('Directory where the TaaS agent saves a snapshot of the tap '
+               'resources it applied, reapplied when the agent restarts. '
+               'An empty value disables the snapshot.')
+    ),
+    cfg.IntOpt(
+        'taas_agent_warm_resync_delay',
+        default=5,
+        min=0,
+        help=_('Seconds the TaaS agent waits, after restoring the tap '
+               'resources of its snapshot, before requesting them from the '
+               'server to reconcile its state.')
+    ),
+    cfg.IntOpt(
+        'taas_agent_sync_reply_timeout',
+        default=120,
+        min=1,
+        help=_('Seconds the TaaS agent waits for the server to answer its '
+               'tap resources request before completing the resync anyway, '
+               'which removes the flows left behind by previous agent '
+               'runs. Servers older than the agent never answer it.')
+    ),
+    cfg.IntOpt(
+        'taas_agent_resync_jitter',
+        default=10,
+        min=0,
+        help=_('Maximum number of seconds, picked at random, the TaaS agent '
+               'waits before requesting its tap resources from the server, '
+               'so that agents restarted together spread their requests.')
+    ),
+    cfg.StrOpt(
+        'taas_of_interface',
+        default='ovs-ofctl',
+        choices=['ovs-ofctl', 'native'],
+        help=_('OpenFlow interface used by the TaaS OVS driver to program '
+               'flows. "ovs-ofctl" runs the ovs-ofctl command line tool, '
+               '"native" sends OpenFlow messages over the connection the '
+               'OVS agent keeps with its bridges, br-tap being connected to '
+               'the OVS agent OpenFlow controller too.')
     )
 ]
 cfg.CONF.register_opts(OPTS)
@@ -47,6 +97,18 @@ class TaasAgentDriver(metaclass=abc.ABCMeta):
         :param agent_api: An instance of an agent specific API
         """
 
+    def handle_port(self, port):
+        """Handle a port added or updated on the agent's host.
+
+        :param port: the port details handled by the L2 agent
+        """
+
+    def delete_port(self, port):
+        """Handle a port removed from the agent's host.
+
+        :param port: the port details handled by the L2 agent
+        """
+
     @abc.abstractmethod
     def create_tap_service(self, tap_service_msg):
         """Create a Tap Service request in driver."""
@@ -63,6 +125,29 @@ class TaasAgentDriver(metaclass=abc.ABCMeta):
     def delete_tap_flow(self, tap_flow_msg):
         """Delete a tap flow request in driver."""
 
+    def sync_tap_resources(self, tap_resources_msg):
+        """Create all the tap services and tap flows of the host.
+
+        Drivers able to apply the whole set at once should override it.
+
+        :param tap_resources_msg: a dict of the messages of the tap
+                                  services and tap flows of the host:
+                                  {tap_services: [], tap_flows: []}
+        """
+        for tap_service_msg in tap_resources_msg['tap_services']:
+            self.create_tap_service(tap_service_msg)
+        for tap_flow_msg in tap_resources_msg['tap_flows']:
+            self.create_tap_flow(tap_flow_msg)
+
+    def sync_tap_resources_done(self):
+        """Handle the end of a resync of the tap resources of the host.
+
+        Called once the tap resources sent back by the plugin in reply to
+        sync_tap_resources have been applied, or when no reply arrived in
+        time, for drivers to drop the state left behind by previous agent
+        runs.
+        """
+
 
 class TaasAgentExtension(l2_extension.L2AgentExtension):
 
@@ -82,7 +167,7 @@ class TaasAgentExtension(l2_extension.L2AgentExtension):
         self.agent_api = agent_api
 
     def handle_port(self, context, data):
-        pass
+        self.taas_agent.taas_driver.handle_port(data)
 
     def delete_port(self, context, data):
-        pass
+        self.taas_agent.taas_driver.delete_port(data)
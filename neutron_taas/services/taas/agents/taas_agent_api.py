@@ -58,6 +58,18 @@ class TaasAgentRpcCallbackMixin:
         """Handle RPC cast from plugin to delete a tap flow"""
         pass
 
+    def create_tap_flows(self, context, tap_flow_msgs, host):
+        """Handle RPC cast from plugin to create tap flows"""
+        pass
+
+    def delete_tap_flows(self, context, tap_flow_msgs, host):
+        """Handle RPC cast from plugin to delete tap flows"""
+        pass
+
+    def sync_tap_resources_reply(self, context, tap_resources_msg, host):
+        """Handle RPC cast from plugin with the tap resources of a host"""
+        pass
+
     def create_tap_mirror(self, context, tap_mirror_msg, host):
         """Handle RPC cast from plugin to create a Tap Mirror."""
         pass
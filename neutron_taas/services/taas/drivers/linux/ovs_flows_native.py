@@ -0,0 +1,375 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from neutron.agent.common import ovs_lib
+from neutron.plugins.ml2.drivers.openvswitch.agent.openflow.native \
+    import ovs_bridge
+from neutron_lib.plugins.ml2 import ovs_constants as n_ovs_consts
+from oslo_config import cfg
+
+import neutron_taas.services.taas.drivers.linux.ovs_constants \
+    as taas_ovs_consts
+
+
+class TapBridge(ovs_bridge.OVSAgentBridge):
+    """br-tap, connected to the OpenFlow controller of the OVS agent."""
+
+
+class TaasNativeFlows:
+    """TaaS flows programmed through the native OpenFlow interface.
+
+    Flow mods are sent as os-ken OFPFlowMod messages over the OpenFlow
+    connection the OVS agent keeps with its bridges, br-tap being
+    connected to the same controller.
+
+    As OpenFlow 1.3 has no counterpart to the mod_vlan_vid action of
+    OpenFlow 1.0, which pushes a VLAN header only if the packet has none,
+    flows tagging packets that may or may not be tagged yet are installed
+    twice, once for each case.
+    """
+
+    @staticmethod
+    def _get_dp(br):
+        # Bundled bridges only expose the install and uninstall methods of
+        # the bridge they wrap
+        return getattr(br, 'br', br)._get_dp()
+
+    def setup_tap_bridge(self, tap_br):
+        tap_br.set_secure_mode()
+        tap_br.setup_controllers(cfg.CONF)
+
+    def deferred(self, br):
+        return br.bundled(atomic=True, ordered=True)
+
+    def get_flow_cookies(self, br, table_id):
+        return {flow.cookie for flow in br.dump_flows(table_id)}
+
+    def delete_flows_by_cookie(self, br, table_id, cookie):
+        br.uninstall_flows(table_id=table_id, cookie=cookie,
+                           cookie_mask=ovs_lib.UINT64_BITMASK)
+
+    def _install_tagging_flows(self, br, vlan_id, table_id, priority,
+                               pre_actions, post_actions, **match_kwargs):
+        (_dp, ofp, ofpp) = self._get_dp(br)
+        set_vlan = ofpp.OFPActionSetField(
+            vlan_vid=vlan_id | ofp.OFPVID_PRESENT)
+        br.install_apply_actions(
+            table_id=table_id, priority=priority,
+            vlan_vid=(ofp.OFPVID_PRESENT, ofp.OFPVID_PRESENT),
+            actions=pre_actions + [set_vlan] + post_actions,
+            **match_kwargs)
+        br.install_apply_actions(
+            table_id=table_id, priority=priority,
+            vlan_vid=ofp.OFPVID_NONE,
+            actions=(pre_actions + [ofpp.OFPActionPushVlan(), set_vlan] +
+                     post_actions),
+            **match_kwargs)
+
+    def setup_tap_br_flows(self, tap_br, patch_tap_int_id,
+                           patch_tap_tun_id=None):
+        (_dp, ofp, ofpp) = self._get_dp(tap_br)
+        tap_br.install_apply_actions(
+            table_id=0, priority=1, in_port=patch_tap_int_id,
+            actions=[ofpp.NXActionResubmitTable(
+                table_id=taas_ovs_consts.TAAS_RECV_LOC)])
+
+        if patch_tap_tun_id is not None:
+            tap_br.install_apply_actions(
+                table_id=0, priority=1, in_port=patch_tap_tun_id,
+                actions=[ofpp.NXActionResubmitTable(
+                    table_id=taas_ovs_consts.TAAS_RECV_REM)])
+
+        tap_br.install_drop(table_id=0, priority=0)
+
+        if patch_tap_tun_id is not None:
+            tap_br.install_apply_actions(
+                table_id=taas_ovs_consts.TAAS_RECV_LOC, priority=0,
+                actions=[ofpp.OFPActionOutput(patch_tap_tun_id, 0)])
+
+        tap_br.install_drop(table_id=taas_ovs_consts.TAAS_RECV_REM,
+                            priority=0)
+
+    def setup_tun_br_flows(self, tun_br, patch_tun_tap_id, tunnel_ofports):
+        (_dp, ofp, ofpp) = self._get_dp(tun_br)
+        tun_br.install_apply_actions(
+            table_id=0, priority=1, in_port=patch_tun_tap_id,
+            actions=[ofpp.NXActionResubmitTable(
+                table_id=taas_ovs_consts.TAAS_SEND_UCAST)])
+
+        tun_br.install_apply_actions(
+            table_id=taas_ovs_consts.TAAS_SEND_UCAST, priority=0,
+            actions=[ofpp.NXActionResubmitTable(
+                table_id=taas_ovs_consts.TAAS_SEND_FLOOD)])
+
+        self.update_tunnel_flood_flow(tun_br, tunnel_ofports)
+
+        for priority, reg0, table_id in (
+                (2, 0, taas_ovs_consts.TAAS_DST_CHECK),
+                (1, 1, taas_ovs_consts.TAAS_DST_CHECK),
+                (1, 2, taas_ovs_consts.TAAS_SRC_CHECK)):
+            tun_br.install_apply_actions(
+                table_id=taas_ovs_consts.TAAS_CLASSIFY, priority=priority,
+                reg0=reg0,
+                actions=[ofpp.NXActionResubmitTable(table_id=table_id)])
+
+        tun_br.install_drop(table_id=taas_ovs_consts.TAAS_DST_CHECK,
+                            priority=0)
+
+        tun_br.install_drop(table_id=taas_ovs_consts.TAAS_SRC_CHECK,
+                            priority=0)
+
+        tun_br.install_apply_actions(
+            table_id=taas_ovs_consts.TAAS_DST_RESPOND, priority=2, reg0=0,
+            actions=[ofpp.OFPActionOutput(patch_tun_tap_id, 0)])
+
+        tun_br.install_apply_actions(
+            table_id=taas_ovs_consts.TAAS_DST_RESPOND, priority=1, reg0=1,
+            actions=[
+                ofpp.OFPActionOutput(patch_tun_tap_id, 0),
+                ofpp.NXActionRegMove(src_field='vlan_tci',
+                                     dst_field='tunnel_id', n_bits=12),
+                ofpp.OFPActionSetField(vlan_vid=2 | ofp.OFPVID_PRESENT),
+                ofpp.OFPActionOutput(ofp.OFPP_IN_PORT, 0),
+            ])
+
+        specs = [
+            ofpp.NXFlowSpecMatch(src=('vlan_tci', 0),
+                                 dst=('vlan_tci', 0),
+                                 n_bits=12),
+            ofpp.NXFlowSpecLoad(src=('vlan_tci', 0),
+                                dst=('tunnel_id', 0),
+                                n_bits=12),
+            ofpp.NXFlowSpecLoad(src=0,
+                                dst=('vlan_tci', 0),
+                                n_bits=12),
+            ofpp.NXFlowSpecOutput(src=('in_port', 0),
+                                  dst='',
+                                  n_bits=32),
+        ]
+        tun_br.install_apply_actions(
+            table_id=taas_ovs_consts.TAAS_SRC_RESPOND, priority=1,
+            actions=[ofpp.NXActionLearn(
+                table_id=taas_ovs_consts.TAAS_SEND_UCAST, priority=1,
+                hard_timeout=60, specs=specs)])
+
+    def update_tunnel_flood_flow(self, tun_br, tunnel_ofports):
+        if not tunnel_ofports:
+            return
+
+        (_dp, ofp, ofpp) = self._get_dp(tun_br)
+        actions = [
+            ofpp.NXActionRegMove(src_field='vlan_tci',
+                                 dst_field='tunnel_id', n_bits=12),
+            ofpp.OFPActionSetField(vlan_vid=1 | ofp.OFPVID_PRESENT),
+        ]
+        actions += [ofpp.OFPActionOutput(ofport, 0)
+                    for ofport in tunnel_ofports]
+        tun_br.install_apply_actions(
+            table_id=taas_ovs_consts.TAAS_SEND_FLOOD, priority=0,
+            actions=actions)
+
+    def _install_tun_classify_flows(self, tun_br, taas_id):
+        (_dp, ofp, ofpp) = self._get_dp(tun_br)
+        for tunnel_type in n_ovs_consts.TUNNEL_NETWORK_TYPES:
+            tun_br.install_apply_actions(
+                table_id=n_ovs_consts.TUN_TABLE[tunnel_type], priority=1,
+                tunnel_id=taas_id,
+                actions=[
+                    ofpp.NXActionRegMove(src_field='vlan_tci',
+                                         dst_field='reg0', n_bits=12),
+                    ofpp.NXActionRegMove(src_field='tunnel_id',
+                                         dst_field='vlan_tci', n_bits=12),
+                    ofpp.NXActionResubmitTable(
+                        table_id=taas_ovs_consts.TAAS_CLASSIFY),
+                ])
+
+    def install_tap_service(self, int_br, tap_br, tun_br, taas_id,
+                            port_vlan_id, ovs_port_id, patch_int_tap_id,
+                            patch_tap_int_id):
+        (_dp, ofp, ofpp) = self._get_dp(int_br)
+        # Add flow(s) in br-int
+        int_br.install_apply_actions(
+            table_id=0, priority=25, in_port=patch_int_tap_id,
+            vlan_vid=taas_id | ofp.OFPVID_PRESENT,
+            actions=[
+                ofpp.OFPActionSetField(
+                    vlan_vid=port_vlan_id | ofp.OFPVID_PRESENT),
+                ofpp.OFPActionOutput(ovs_port_id, 0),
+            ])
+
+        # Add flow(s) in br-tap
+        tap_br.install_apply_actions(
+            table_id=taas_ovs_consts.TAAS_RECV_LOC, priority=1,
+            vlan_vid=taas_id | ofp.OFPVID_PRESENT,
+            actions=[ofpp.OFPActionOutput(ofp.OFPP_IN_PORT, 0)])
+
+        tap_br.install_apply_actions(
+            table_id=taas_ovs_consts.TAAS_RECV_REM, priority=1,
+            vlan_vid=taas_id | ofp.OFPVID_PRESENT,
+            actions=[ofpp.OFPActionOutput(patch_tap_int_id, 0)])
+
+        # Add flow(s) in br-tun
+        if tun_br:
+            self._install_tun_classify_flows(tun_br, taas_id)
+
+            tun_br.install_apply_actions(
+                table_id=taas_ovs_consts.TAAS_DST_CHECK, priority=1,
+                tunnel_id=taas_id,
+                actions=[ofpp.NXActionResubmitTable(
+                    table_id=taas_ovs_consts.TAAS_DST_RESPOND)])
+
+    def remove_tap_service(self, int_br, tap_br, tun_br, taas_id,
+                           patch_int_tap_id):
+        (_dp, ofp, _ofpp) = self._get_dp(int_br)
+        vlan_vid = taas_id | ofp.OFPVID_PRESENT
+        # Delete flow(s) from br-int
+        int_br.uninstall_flows(table_id=0, in_port=patch_int_tap_id,
+                               vlan_vid=vlan_vid)
+
+        # Delete flow(s) from br-tap
+        tap_br.uninstall_flows(table_id=taas_ovs_consts.TAAS_RECV_LOC,
+                               vlan_vid=vlan_vid)
+
+        tap_br.uninstall_flows(table_id=taas_ovs_consts.TAAS_RECV_REM,
+                               vlan_vid=vlan_vid)
+
+        if tun_br:
+            # Delete flow(s) from br-tun
+            for tunnel_type in n_ovs_consts.TUNNEL_NETWORK_TYPES:
+                tun_br.uninstall_flows(
+                    table_id=n_ovs_consts.TUN_TABLE[tunnel_type],
+                    tunnel_id=taas_id)
+
+            tun_br.uninstall_flows(table_id=taas_ovs_consts.TAAS_DST_CHECK,
+                                   tunnel_id=taas_id)
+
+            tun_br.uninstall_flows(table_id=taas_ovs_consts.TAAS_SRC_CHECK,
+                                   tunnel_id=taas_id)
+
+    def install_tap_flow(self, int_br, tun_br, taas_id, direction,
+                         ovs_port_id, port_mac, patch_int_tap_id,
+                         physical_network=None, network_type=None):
+        (_dp, ofp, ofpp) = self._get_dp(int_br)
+        normal = ofpp.OFPActionOutput(ofp.OFPP_NORMAL, 0)
+        to_tap = ofpp.OFPActionOutput(patch_int_tap_id, 0)
+
+        # Add flow(s) in br-int
+        if direction in ('OUT', 'BOTH'):
+            # Packets entering br-int from an access port are untagged
+            int_br.install_apply_actions(
+                table_id=0, priority=20, in_port=ovs_port_id,
+                actions=[
+                    normal,
+                    ofpp.OFPActionPushVlan(),
+                    ofpp.OFPActionSetField(
+                        vlan_vid=taas_id | ofp.OFPVID_PRESENT),
+                    to_tap,
+                ])
+
+        if direction in ('IN', 'BOTH'):
+            # The VLAN id of the port network is not checked, please see
+            # the comment in the ovs-ofctl flows for details.
+            if not physical_network:
+                self._install_tagging_flows(
+                    int_br, taas_id, table_id=0, priority=20,
+                    pre_actions=[normal], post_actions=[to_tap],
+                    eth_dst=port_mac)
+            elif network_type == 'vlan':
+                int_br.install_apply_actions(
+                    table_id=0, priority=20, eth_dst=port_mac,
+                    actions=[
+                        ofpp.OFPActionPopVlan(),
+                        ofpp.OFPActionOutput(ovs_port_id, 0),
+                        ofpp.OFPActionPushVlan(),
+                        ofpp.OFPActionSetField(
+                            vlan_vid=taas_id | ofp.OFPVID_PRESENT),
+                        to_tap,
+                    ])
+            else:
+                self._install_tagging_flows(
+                    int_br, taas_id, table_id=0, priority=20,
+                    pre_actions=[ofpp.OFPActionOutput(ovs_port_id, 0)],
+                    post_actions=[to_tap],
+                    eth_dst=port_mac)
+
+        # Add flow(s) in br-tun
+        if tun_br:
+            self._install_tun_classify_flows(tun_br, taas_id)
+
+            tun_br.install_apply_actions(
+                table_id=taas_ovs_consts.TAAS_SRC_CHECK, priority=1,
+                tunnel_id=taas_id,
+                actions=[ofpp.NXActionResubmitTable(
+                    table_id=taas_ovs_consts.TAAS_SRC_RESPOND)])
+
+    def remove_tap_flow(self, int_br, direction, ovs_port_id, port_mac):
+        # Delete flow(s) from br-int
+        if direction in ('OUT', 'BOTH'):
+            int_br.uninstall_flows(table_id=0, in_port=ovs_port_id)
+
+        if direction in ('IN', 'BOTH'):
+            int_br.uninstall_flows(table_id=0, eth_dst=port_mac)
+
+    def install_tap_mirror_direction(self, int_br, tap_br, direction,
+                                     port_mac, ovs_port_id, mirror_of_port,
+                                     patch_int_tap_id):
+        (_dp, ofp, ofpp) = self._get_dp(int_br)
+        int_actions = [
+            ofpp.OFPActionOutput(patch_int_tap_id, 0),
+            ofpp.NXActionResubmitTable(
+                table_id=n_ovs_consts.PACKET_RATE_LIMIT),
+        ]
+        if direction == 'IN':
+            tap_br.install_apply_actions(
+                table_id=taas_ovs_consts.TAAS_RECV_LOC, priority=20,
+                eth_dst=port_mac,
+                actions=[ofpp.OFPActionOutput(mirror_of_port, 0)])
+            int_br.install_apply_actions(
+                table_id=0, priority=20, eth_dst=port_mac,
+                actions=int_actions)
+        if direction == 'OUT':
+            tap_br.install_apply_actions(
+                table_id=taas_ovs_consts.TAAS_RECV_LOC, priority=20,
+                eth_src=port_mac,
+                actions=[ofpp.OFPActionOutput(mirror_of_port, 0)])
+            int_br.install_apply_actions(
+                table_id=0, priority=20, in_port=ovs_port_id,
+                actions=int_actions)
+
+    def install_tap_mirror(self, tap_br, port_mac, patch_tap_int_id):
+        (_dp, ofp, ofpp) = self._get_dp(tap_br)
+        # Add flow(s) in br-tap
+        tap_br.install_apply_actions(
+            table_id=taas_ovs_consts.TAAS_RECV_LOC, priority=1,
+            eth_dst=port_mac,
+            actions=[ofpp.OFPActionOutput(ofp.OFPP_IN_PORT, 0)])
+
+        tap_br.install_apply_actions(
+            table_id=taas_ovs_consts.TAAS_RECV_REM, priority=1,
+            eth_dst=port_mac,
+            actions=[ofpp.OFPActionOutput(patch_tap_int_id, 0)])
+
+    def remove_tap_mirror(self, int_br, tap_br, directions, port_mac,
+                          ovs_port_id):
+        tap_br.uninstall_flows(table_id=taas_ovs_consts.TAAS_RECV_REM,
+                               eth_dst=port_mac)
+        tap_br.uninstall_flows(table_id=taas_ovs_consts.TAAS_RECV_LOC,
+                               eth_dst=port_mac)
+
+        for direction in directions:
+            if direction == 'IN':
+                int_br.uninstall_flows(table_id=0, eth_dst=port_mac)
+            if direction == 'OUT':
+                int_br.uninstall_flows(table_id=0, in_port=ovs_port_id)
+                tap_br.uninstall_flows(
+                    table_id=taas_ovs_consts.TAAS_RECV_LOC,
+                    eth_src=port_mac)
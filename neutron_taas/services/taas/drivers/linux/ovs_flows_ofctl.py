@@ -0,0 +1,372 @@
+# Copyright (C) 2015 Ericsson AB
+# Copyright (c) 2015 Gigamon
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from neutron_lib.plugins.ml2 import ovs_constants as n_ovs_consts
+
+import neutron_taas.services.taas.drivers.linux.ovs_constants \
+    as taas_ovs_consts
+
+
+class TaasOfctlFlows:
+    """TaaS flows programmed through ovs-ofctl.
+
+    Flows are passed to ovs-ofctl as strings, every call on a bridge
+    spawning an ovs-ofctl process.
+    """
+
+    def setup_tap_bridge(self, tap_br):
+        # Flow mods are applied as OpenFlow bundles, which need at least
+        # OpenFlow 1.4 on the bridge.
+        tap_br.use_at_least_protocol(n_ovs_consts.OPENFLOW14)
+
+    def deferred(self, br):
+        return br.deferred(full_ordered=True, use_bundle=True)
+
+    def get_flow_cookies(self, br, table_id):
+        cookies = set()
+        for flow in (br.dump_flows_for_table(table_id) or '').splitlines():
+            for field in flow.strip().split(','):
+                if field.startswith('cookie='):
+                    cookies.add(int(field[len('cookie='):], 16))
+                    break
+        return cookies
+
+    def delete_flows_by_cookie(self, br, table_id, cookie):
+        br.delete_flows(table=table_id, cookie='%d/-1' % cookie)
+
+    def setup_tap_br_flows(self, tap_br, patch_tap_int_id,
+                           patch_tap_tun_id=None):
+        tap_br.add_flow(table=0,
+                        priority=1,
+                        in_port=patch_tap_int_id,
+                        actions="resubmit(,%s)" %
+                        taas_ovs_consts.TAAS_RECV_LOC)
+
+        if patch_tap_tun_id is not None:
+            tap_br.add_flow(table=0,
+                            priority=1,
+                            in_port=patch_tap_tun_id,
+                            actions="resubmit(,%s)" %
+                            taas_ovs_consts.TAAS_RECV_REM)
+
+        tap_br.add_flow(table=0,
+                        priority=0,
+                        actions="drop")
+
+        if patch_tap_tun_id is not None:
+            tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_LOC,
+                            priority=0,
+                            actions="output:%s" % str(patch_tap_tun_id))
+
+        tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_REM,
+                        priority=0,
+                        actions="drop")
+
+    def setup_tun_br_flows(self, tun_br, patch_tun_tap_id, tunnel_ofports):
+        tun_br.add_flow(table=0,
+                        priority=1,
+                        in_port=patch_tun_tap_id,
+                        actions="resubmit(,%s)" %
+                        taas_ovs_consts.TAAS_SEND_UCAST)
+
+        tun_br.add_flow(table=taas_ovs_consts.TAAS_SEND_UCAST,
+                        priority=0,
+                        actions="resubmit(,%s)" %
+                        taas_ovs_consts.TAAS_SEND_FLOOD)
+
+        flow_action = self._create_tunnel_flood_flow_action(tunnel_ofports)
+        if flow_action != "":
+            tun_br.add_flow(table=taas_ovs_consts.TAAS_SEND_FLOOD,
+                            priority=0,
+                            actions=flow_action)
+
+        tun_br.add_flow(table=taas_ovs_consts.TAAS_CLASSIFY,
+                        priority=2,
+                        reg0=0,
+                        actions="resubmit(,%s)" %
+                        taas_ovs_consts.TAAS_DST_CHECK)
+
+        tun_br.add_flow(table=taas_ovs_consts.TAAS_CLASSIFY,
+                        priority=1,
+                        reg0=1,
+                        actions="resubmit(,%s)" %
+                        taas_ovs_consts.TAAS_DST_CHECK)
+
+        tun_br.add_flow(table=taas_ovs_consts.TAAS_CLASSIFY,
+                        priority=1,
+                        reg0=2,
+                        actions="resubmit(,%s)" %
+                        taas_ovs_consts.TAAS_SRC_CHECK)
+
+        tun_br.add_flow(table=taas_ovs_consts.TAAS_DST_CHECK,
+                        priority=0,
+                        actions="drop")
+
+        tun_br.add_flow(table=taas_ovs_consts.TAAS_SRC_CHECK,
+                        priority=0,
+                        actions="drop")
+
+        tun_br.add_flow(table=taas_ovs_consts.TAAS_DST_RESPOND,
+                        priority=2,
+                        reg0=0,
+                        actions="output:%s" % str(patch_tun_tap_id))
+
+        tun_br.add_flow(
+            table=taas_ovs_consts.TAAS_DST_RESPOND,
+            priority=1, reg0=1,
+            actions=("output:%s,"
+                     "move:NXM_OF_VLAN_TCI[0..11]->NXM_NX_TUN_ID"
+                     "[0..11],mod_vlan_vid:2,output:in_port" %
+                     str(patch_tun_tap_id)))
+
+        tun_br.add_flow(
+            table=taas_ovs_consts.TAAS_SRC_RESPOND,
+            priority=1,
+            actions=("learn(table=%s,hard_timeout=60,"
+                     "priority=1,NXM_OF_VLAN_TCI[0..11],"
+                     "load:NXM_OF_VLAN_TCI[0..11]->NXM_NX_TUN_ID"
+                     "[0..11],load:0->NXM_OF_VLAN_TCI[0..11],"
+                     "output:NXM_OF_IN_PORT[])" %
+                     taas_ovs_consts.TAAS_SEND_UCAST))
+
+    def update_tunnel_flood_flow(self, tun_br, tunnel_ofports):
+        flow_action = self._create_tunnel_flood_flow_action(tunnel_ofports)
+        if flow_action != "":
+            tun_br.mod_flow(table=taas_ovs_consts.TAAS_SEND_FLOOD,
+                            actions=flow_action)
+
+    def _create_tunnel_flood_flow_action(self, tunnel_ofports):
+        if not tunnel_ofports:
+            return ""
+
+        flow_action = ("move:NXM_OF_VLAN_TCI[0..11]->NXM_NX_TUN_ID[0..11],"
+                       "mod_vlan_vid:1")
+        for ofport in tunnel_ofports:
+            flow_action += ",output:%d" % ofport
+
+        return flow_action
+
+    def install_tap_service(self, int_br, tap_br, tun_br, taas_id,
+                            port_vlan_id, ovs_port_id, patch_int_tap_id,
+                            patch_tap_int_id):
+        # Add flow(s) in br-int
+        int_br.add_flow(table=0,
+                        priority=25,
+                        in_port=patch_int_tap_id,
+                        dl_vlan=taas_id,
+                        actions="mod_vlan_vid:%s,output:%s" %
+                        (str(port_vlan_id), str(ovs_port_id)))
+
+        # Add flow(s) in br-tap
+        tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_LOC,
+                        priority=1,
+                        dl_vlan=taas_id,
+                        actions="output:in_port")
+
+        tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_REM,
+                        priority=1,
+                        dl_vlan=taas_id,
+                        actions="output:%s" % str(patch_tap_int_id))
+
+        # Add flow(s) in br-tun
+        if tun_br:
+            for tunnel_type in n_ovs_consts.TUNNEL_NETWORK_TYPES:
+                tun_br.add_flow(
+                    table=n_ovs_consts.TUN_TABLE[tunnel_type],
+                    priority=1,
+                    tun_id=taas_id,
+                    actions=("move:NXM_OF_VLAN_TCI[0..11]->"
+                             "NXM_NX_REG0[0..11],move:NXM_NX_TUN_ID"
+                             "[0..11]->NXM_OF_VLAN_TCI[0..11],"
+                             "resubmit(,%s)" %
+                             taas_ovs_consts.TAAS_CLASSIFY))
+
+            tun_br.add_flow(table=taas_ovs_consts.TAAS_DST_CHECK,
+                            priority=1,
+                            tun_id=taas_id,
+                            actions="resubmit(,%s)" %
+                            taas_ovs_consts.TAAS_DST_RESPOND)
+
+    def remove_tap_service(self, int_br, tap_br, tun_br, taas_id,
+                           patch_int_tap_id):
+        # Delete flow(s) from br-int
+        int_br.delete_flows(table=0,
+                            in_port=patch_int_tap_id,
+                            dl_vlan=taas_id)
+
+        # Delete flow(s) from br-tap
+        tap_br.delete_flows(table=taas_ovs_consts.TAAS_RECV_LOC,
+                            dl_vlan=taas_id)
+
+        tap_br.delete_flows(table=taas_ovs_consts.TAAS_RECV_REM,
+                            dl_vlan=taas_id)
+
+        if tun_br:
+            # Delete flow(s) from br-tun
+            for tunnel_type in n_ovs_consts.TUNNEL_NETWORK_TYPES:
+                tun_br.delete_flows(
+                    table=n_ovs_consts.TUN_TABLE[tunnel_type],
+                    tun_id=taas_id)
+
+            tun_br.delete_flows(table=taas_ovs_consts.TAAS_DST_CHECK,
+                                tun_id=taas_id)
+
+            tun_br.delete_flows(table=taas_ovs_consts.TAAS_SRC_CHECK,
+                                tun_id=taas_id)
+
+    def install_tap_flow(self, int_br, tun_br, taas_id, direction,
+                         ovs_port_id, port_mac, patch_int_tap_id,
+                         physical_network=None, network_type=None):
+        # Add flow(s) in br-int
+        if direction in ('OUT', 'BOTH'):
+            int_br.add_flow(table=0,
+                            priority=20,
+                            in_port=ovs_port_id,
+                            actions="normal,mod_vlan_vid:%s,output:%s" %
+                            (str(taas_id), str(patch_int_tap_id)))
+
+        if direction in ('IN', 'BOTH'):
+            #
+            # Note: The ingress side flow (for unicast traffic) should
+            #       include a check for the 'VLAN id of the Neutron
+            #       network the port belongs to' + 'MAC address of the
+            #       port', to comply with the requirement that port MAC
+            #       addresses are unique only within a Neutron network.
+            #       Unfortunately, at the moment there is no clean way
+            #       to implement such a check, given OVS's handling of
+            #       VLAN tags and Neutron's use of the NORMAL action in
+            #       br-int.
+            #
+            #       We are therefore temporarily disabling the VLAN id
+            #       check until a mechanism is available to implement
+            #       it correctly. The {broad,multi}cast flow, which is
+            #       also dependent on the VLAN id, has been disabled
+            #       for the same reason.
+            #
+            if not physical_network:
+                int_br.add_flow(
+                    table=0,
+                    priority=20,
+                    # dl_vlan=port_vlan_id,
+                    dl_dst=port_mac,
+                    actions="normal,mod_vlan_vid:%s,output:%s" %
+                    (str(taas_id), str(patch_int_tap_id))
+                )
+
+            else:
+                actions = "output:{},mod_vlan_vid:{},output:{}".format(
+                    str(ovs_port_id), str(taas_id), str(patch_int_tap_id)
+                )
+                if network_type == 'vlan':
+                    actions = 'strip_vlan,' + actions
+                int_br.add_flow(
+                    table=0,
+                    priority=20,
+                    # dl_vlan=port_vlan_id,
+                    dl_dst=port_mac,
+                    actions=actions
+                )
+
+        # Add flow(s) in br-tun
+        if tun_br:
+            for tunnel_type in n_ovs_consts.TUNNEL_NETWORK_TYPES:
+                tun_br.add_flow(
+                    table=n_ovs_consts.TUN_TABLE[tunnel_type],
+                    priority=1,
+                    tun_id=taas_id,
+                    actions=("move:NXM_OF_VLAN_TCI[0..11]->"
+                             "NXM_NX_REG0[0..11],move:NXM_NX_TUN_ID"
+                             "[0..11]->NXM_OF_VLAN_TCI[0..11],"
+                             "resubmit(,%s)" %
+                             taas_ovs_consts.TAAS_CLASSIFY))
+
+            tun_br.add_flow(table=taas_ovs_consts.TAAS_SRC_CHECK,
+                            priority=1,
+                            tun_id=taas_id,
+                            actions="resubmit(,%s)" %
+                            taas_ovs_consts.TAAS_SRC_RESPOND)
+
+    def remove_tap_flow(self, int_br, direction, ovs_port_id, port_mac):
+        # Delete flow(s) from br-int
+        if direction in ('OUT', 'BOTH'):
+            int_br.delete_flows(table=0,
+                                in_port=ovs_port_id)
+
+        if direction in ('IN', 'BOTH'):
+            #
+            # The VLAN id related checks have been temporarily disabled.
+            # Please see comment in install_tap_flow() for details.
+            #
+            int_br.delete_flows(table=0,
+                                # dl_vlan=port_vlan_id,
+                                dl_dst=port_mac)
+
+    def install_tap_mirror_direction(self, int_br, tap_br, direction,
+                                     port_mac, ovs_port_id, mirror_of_port,
+                                     patch_int_tap_id):
+        if direction == 'IN':
+            tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_LOC,
+                            priority=20,
+                            dl_dst=port_mac,
+                            actions="output:%s" % str(mirror_of_port))
+            int_br.add_flow(
+                table=0,
+                priority=20,
+                dl_dst=port_mac,
+                actions="output:%s,resubmit(,%s)" %
+                        (str(patch_int_tap_id),
+                         str(n_ovs_consts.PACKET_RATE_LIMIT)))
+        if direction == 'OUT':
+            tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_LOC,
+                            priority=20,
+                            dl_src=port_mac,
+                            actions="output:%s" % str(mirror_of_port))
+            int_br.add_flow(
+                table=0,
+                priority=20,
+                in_port=ovs_port_id,
+                actions="output:%s,resubmit(,%s)" %
+                        (str(patch_int_tap_id),
+                         str(n_ovs_consts.PACKET_RATE_LIMIT)))
+
+    def install_tap_mirror(self, tap_br, port_mac, patch_tap_int_id):
+        # Add flow(s) in br-tap
+        tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_LOC,
+                        priority=1,
+                        dl_dst=port_mac,
+                        actions="output:in_port")
+
+        tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_REM,
+                        priority=1,
+                        dl_dst=port_mac,
+                        actions="output:%s" % str(patch_tap_int_id))
+
+    def remove_tap_mirror(self, int_br, tap_br, directions, port_mac,
+                          ovs_port_id):
+        tap_br.delete_flows(table=taas_ovs_consts.TAAS_RECV_REM,
+                            dl_dst=port_mac)
+        tap_br.delete_flows(table=taas_ovs_consts.TAAS_RECV_LOC,
+                            dl_dst=port_mac)
+
+        for direction in directions:
+            if direction == 'IN':
+                int_br.delete_flows(table=0,
+                                    dl_dst=port_mac)
+                tap_br.delete_flows(table=taas_ovs_consts.TAAS_RECV_LOC,
+                                    dl_dst=port_mac)
+            if direction == 'OUT':
+                int_br.delete_flows(table=0, in_port=ovs_port_id)
+                tap_br.delete_flows(table=taas_ovs_consts.TAAS_RECV_LOC,
+                                    dl_src=port_mac)
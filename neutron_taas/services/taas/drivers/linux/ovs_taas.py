@@ -14,6 +14,8 @@
 # under the License.
 
 import collections
+import contextlib
+import threading
 
 from neutron.agent.common import ovs_lib
 from neutron.agent.linux import utils
@@ -24,10 +26,12 @@ from neutron_lib.plugins.ml2 import ovs_constants as n_ovs_consts
 from neutron_taas.services.taas.agents.extensions import taas as taas_base
 import neutron_taas.services.taas.drivers.linux.ovs_constants \
     as taas_ovs_consts
-import neutron_taas.services.taas.drivers.linux.ovs_utils as taas_ovs_utils
+from neutron_taas.services.taas.drivers.linux import ovs_flows_native
+from neutron_taas.services.taas.drivers.linux import ovs_flows_ofctl
 from oslo_config import cfg
 from oslo_log import helpers as log_helpers
 from oslo_log import log as logging
+from ovsdbapp.backend.ovs_idl import event as idl_event
 
 
 LOG = logging.getLogger(__name__)
@@ -42,6 +46,27 @@ class OVSBridge_tap_extension(ovs_lib.OVSBridge):
         super().__init__(br_name, datapath_type=datapath_type)
 
 
+class TunnelInterfaceEvent(idl_event.RowEvent):
+    """Flag the tunnel flood flow for update on tunnel port changes."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        events = (self.ROW_CREATE, self.ROW_UPDATE, self.ROW_DELETE)
+        super().__init__(events, 'Interface', None)
+        self.event_name = 'TunnelInterfaceEvent'
+
+    def match_fn(self, event, row, old=None):
+        if row.type not in n_ovs_consts.TUNNEL_NETWORK_TYPES:
+            return False
+        # Only a change of the OpenFlow port number of an existing tunnel
+        # port affects the flood flow
+        return event != self.ROW_UPDATE or hasattr(old, 'ofport')
+
+    def run(self, event, row, old):
+        LOG.debug('%s, tunnel port name: %s', self.event_name, row.name)
+        self.driver.tunnel_ports_changed = True
+
+
 class OvsTaasDriver(taas_base.TaasAgentDriver):
     def __init__(self):
         super().__init__()
@@ -51,26 +76,46 @@ class OvsTaasDriver(taas_base.TaasAgentDriver):
         ovs_conf.register_ovs_agent_opts(cfg.CONF)
         self.datapath_type = cfg.CONF.OVS.datapath_type
         self.tunnel_types = cfg.CONF.AGENT.tunnel_types
+        # Caches of the OVS port details needed to build the TaaS flows,
+        # kept up to date from the port events of the OVS agent. The agent
+        # runs the driver calls of unrelated resources concurrently, the
+        # caches are only accessed with the lock held.
+        self._cache_lock = threading.Lock()
+        self._patch_ofports = {}
+        self._vif_ports = {}
+        self._port_vlans = {}
+        # OpenFlow port numbers of the tunnel ports the flood flow in br-tun
+        # currently outputs to, updated on tunnel port events
+        self._tunnel_ofports = None
+        self.tunnel_ports_changed = True
 
     def initialize(self):
         self.int_br = self.agent_api.request_int_br()
         self.tun_br = self.agent_api.request_tun_br()
-        self.tap_br = OVSBridge_tap_extension('br-tap',
-                                              self.root_helper,
-                                              datapath_type=self.datapath_type)
+        if cfg.CONF.taas_of_interface == 'native':
+            self.flows = ovs_flows_native.TaasNativeFlows()
+            self.tap_br = ovs_flows_native.TapBridge(
+                'br-tap', os_ken_app=self.int_br._app,
+                datapath_type=self.datapath_type)
+        else:
+            self.flows = ovs_flows_ofctl.TaasOfctlFlows()
+            self.tap_br = OVSBridge_tap_extension(
+                'br-tap', self.root_helper, datapath_type=self.datapath_type)
 
         # Prepare OVS bridges for TaaS
         self.setup_ovs_bridges()
 
-        # Setup key-value manager for ingress BCMC flows
-        self.bcmc_kvm = taas_ovs_utils.key_value_mgr(4096)
+        # Track the tunnel ports of br-tun to keep the flood flow up to date
+        if self.tunnel_types:
+            self.tun_br.ovsdb.idl_monitor.notify_handler.watch_event(
+                TunnelInterfaceEvent(self))
 
     def periodic_tasks(self, args=None):
         #
         # Regenerate the flow in br-tun's TAAS_SEND_FLOOD table
         # to ensure all existing tunnel ports are included.
         #
-        if self.tunnel_types:
+        if self.tunnel_types and self.tunnel_ports_changed:
             self.update_tunnel_flood_flow()
 
     def setup_ovs_bridges(self):
@@ -82,6 +127,7 @@ class OvsTaasDriver(taas_base.TaasAgentDriver):
 
         # Create br-tap
         self.tap_br.create()
+        self.flows.setup_tap_bridge(self.tap_br)
 
         # Connect br-tap to br-int and br-tun
         self.int_br.add_patch_port('patch-int-tap', 'patch-tap-int')
@@ -91,133 +137,154 @@ class OvsTaasDriver(taas_base.TaasAgentDriver):
             self.tap_br.add_patch_port('patch-tap-tun', 'patch-tun-tap')
 
         # Get patch port IDs
-        patch_tap_int_id = self.tap_br.get_port_ofport('patch-tap-int')
-        if self.tunnel_types:
-            patch_tap_tun_id = self.tap_br.get_port_ofport('patch-tap-tun')
-            patch_tun_tap_id = self.tun_br.get_port_ofport('patch-tun-tap')
-
-        # Purge all existing Taas flows from br-tap and br-tun
-        self.tap_br.delete_flows(table=0)
-        self.tap_br.delete_flows(table=taas_ovs_consts.TAAS_RECV_LOC)
-        self.tap_br.delete_flows(table=taas_ovs_consts.TAAS_RECV_REM)
-
+        with self._cache_lock:
+            self._patch_ofports.clear()
+        patch_tap_int_id = self._get_patch_ofport(self.tap_br,
+                                                  'patch-tap-int')
         if self.tunnel_types:
-            self.tun_br.delete_flows(table=0,
-                                     in_port=patch_tun_tap_id)
-            self.tun_br.delete_flows(table=taas_ovs_consts.TAAS_SEND_UCAST)
-            self.tun_br.delete_flows(table=taas_ovs_consts.TAAS_SEND_FLOOD)
-            self.tun_br.delete_flows(table=taas_ovs_consts.TAAS_CLASSIFY)
-            self.tun_br.delete_flows(table=taas_ovs_consts.TAAS_DST_CHECK)
-            self.tun_br.delete_flows(table=taas_ovs_consts.TAAS_SRC_CHECK)
-            self.tun_br.delete_flows(table=taas_ovs_consts.TAAS_DST_RESPOND)
-            self.tun_br.delete_flows(table=taas_ovs_consts.TAAS_SRC_RESPOND)
-
+            patch_tap_tun_id = self._get_patch_ofport(self.tap_br,
+                                                      'patch-tap-tun')
+            patch_tun_tap_id = self._get_patch_ofport(self.tun_br,
+                                                      'patch-tun-tap')
+
+        # Existing TaaS flows are left in place: the flows below and the
+        # ones replayed by the server resync are installed under this agent
+        # generation's cookies, replacing identical flows in place, and only
+        # the flows left behind by previous generations are removed
+        # afterwards by cleanup_stale_flows().
+        with self._deferred_bridges() as (int_br, tap_br, tun_br):
+            if self.tunnel_types:
+                #
+                # Configure standard TaaS flows in br-tun
+                #
+                self.tunnel_ports_changed = False
+                self._tunnel_ofports = self._get_tunnel_ofports()
+                self.flows.setup_tun_br_flows(tun_br, patch_tun_tap_id,
+                                              self._tunnel_ofports)
+            else:
+                patch_tap_tun_id = None
             #
-            # Configure standard TaaS flows in br-tun
+            # Configure standard TaaS flows in br-tap
             #
-            self._setup_flows_for_tun_br(patch_tun_tap_id)
-        #
-        # Configure standard TaaS flows in br-tap
-        #
-        self.tap_br.add_flow(table=0,
-                             priority=1,
-                             in_port=patch_tap_int_id,
-                             actions="resubmit(,%s)" %
-                             taas_ovs_consts.TAAS_RECV_LOC)
+            self.flows.setup_tap_br_flows(tap_br, patch_tap_int_id,
+                                          patch_tap_tun_id)
 
-        if self.tunnel_types:
-            self.tap_br.add_flow(table=0,
-                                 priority=1,
-                                 in_port=patch_tap_tun_id,
-                                 actions="resubmit(,%s)" %
-                                 taas_ovs_consts.TAAS_RECV_REM)
-
-        self.tap_br.add_flow(table=0,
-                             priority=0,
-                             actions="drop")
+    @contextlib.contextmanager
+    def _deferred_bridges(self):
+        """Collect the flow mods issued within the block per bridge.
 
+        Yields deferred (br-int, br-tap, br-tun) handles. On a clean exit
+        the flow mods of each bridge are applied as a single OpenFlow
+        bundle, so every bridge is updated atomically and, with ovs-ofctl,
+        in one round trip. br-tun is None when tunneling is disabled.
+        """
+        with contextlib.ExitStack() as stack:
+            yield tuple(
+                stack.enter_context(self.flows.deferred(br)) if br else None
+                for br in (self.int_br, self.tap_br,
+                           self.tun_br if self.tunnel_types else None))
+
+    def sync_tap_resources_done(self):
+        # The flows of the tap resources of the host have all been installed
+        # again under this agent generation's cookies.
+        self.cleanup_stale_flows()
+
+    def cleanup_stale_flows(self):
+        """Remove the TaaS flows not owned by this agent generation.
+
+        Every flow is installed with the cookie of the bridge handle it is
+        issued on, so flows carrying any other cookie in the tables owned by
+        TaaS were left behind by a previous agent run. Flows learned in
+        br-tun carry no cookie and are left to expire. The TaaS flows in
+        the br-int and br-tun tables shared with Neutron are cleaned up by
+        the OVS agent itself, as their cookies are not reserved anymore.
+        """
+        tables = [(self.tap_br, (0,
+                                 taas_ovs_consts.TAAS_RECV_LOC,
+                                 taas_ovs_consts.TAAS_RECV_REM))]
         if self.tunnel_types:
-            self.tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_LOC,
-                                 priority=0,
-                                 actions="output:%s" % str(patch_tap_tun_id))
-
-        self.tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_REM,
-                             priority=0,
-                             actions="drop")
-
-    def _setup_flows_for_tun_br(self, patch_tun_tap_id):
-        #
-        # Configure standard Taas flows in tun_br
-        #
-        self.tun_br.add_flow(table=0,
-                             priority=1,
-                             in_port=patch_tun_tap_id,
-                             actions="resubmit(,%s)" %
-                             taas_ovs_consts.TAAS_SEND_UCAST)
-
-        self.tun_br.add_flow(table=taas_ovs_consts.TAAS_SEND_UCAST,
-                             priority=0,
-                             actions="resubmit(,%s)" %
-                             taas_ovs_consts.TAAS_SEND_FLOOD)
-
-        flow_action = self._create_tunnel_flood_flow_action()
-        if flow_action != "":
-            self.tun_br.add_flow(table=taas_ovs_consts.TAAS_SEND_FLOOD,
-                                 priority=0,
-                                 actions=flow_action)
-
-        self.tun_br.add_flow(table=taas_ovs_consts.TAAS_CLASSIFY,
-                             priority=2,
-                             reg0=0,
-                             actions="resubmit(,%s)" %
-                             taas_ovs_consts.TAAS_DST_CHECK)
-
-        self.tun_br.add_flow(table=taas_ovs_consts.TAAS_CLASSIFY,
-                             priority=1,
-                             reg0=1,
-                             actions="resubmit(,%s)" %
-                             taas_ovs_consts.TAAS_DST_CHECK)
-
-        self.tun_br.add_flow(table=taas_ovs_consts.TAAS_CLASSIFY,
-                             priority=1,
-                             reg0=2,
-                             actions="resubmit(,%s)" %
-                             taas_ovs_consts.TAAS_SRC_CHECK)
-
-        self.tun_br.add_flow(table=taas_ovs_consts.TAAS_DST_CHECK,
-                             priority=0,
-                             actions="drop")
-
-        self.tun_br.add_flow(table=taas_ovs_consts.TAAS_SRC_CHECK,
-                             priority=0,
-                             actions="drop")
-
-        self.tun_br.add_flow(table=taas_ovs_consts.TAAS_DST_RESPOND,
-                             priority=2,
-                             reg0=0,
-                             actions="output:%s" % str(patch_tun_tap_id))
-
-        self.tun_br.add_flow(
-            table=taas_ovs_consts.TAAS_DST_RESPOND,
-            priority=1, reg0=1,
-            actions=("output:%s,"
-                     "move:NXM_OF_VLAN_TCI[0..11]->NXM_NX_TUN_ID"
-                     "[0..11],mod_vlan_vid:2,output:in_port" %
-                     str(patch_tun_tap_id)))
-
-        self.tun_br.add_flow(
-            table=taas_ovs_consts.TAAS_SRC_RESPOND,
-            priority=1,
-            actions=("learn(table=%s,hard_timeout=60,"
-                     "priority=1,NXM_OF_VLAN_TCI[0..11],"
-                     "load:NXM_OF_VLAN_TCI[0..11]->NXM_NX_TUN_ID"
-                     "[0..11],load:0->NXM_OF_VLAN_TCI[0..11],"
-                     "output:NXM_OF_IN_PORT[])" %
-                     taas_ovs_consts.TAAS_SEND_UCAST))
+            tables.append((self.tun_br, (taas_ovs_consts.TAAS_SEND_UCAST,
+                                         taas_ovs_consts.TAAS_SEND_FLOOD,
+                                         taas_ovs_consts.TAAS_CLASSIFY,
+                                         taas_ovs_consts.TAAS_DST_CHECK,
+                                         taas_ovs_consts.TAAS_SRC_CHECK,
+                                         taas_ovs_consts.TAAS_DST_RESPOND,
+                                         taas_ovs_consts.TAAS_SRC_RESPOND)))
+
+        for br, table_ids in tables:
+            with self.flows.deferred(br) as dbr:
+                for table_id in table_ids:
+                    for cookie in self._get_stale_cookies(br, table_id):
+                        LOG.debug("Removing stale TaaS flows with cookie "
+                                  "%(cookie)#x from table %(table)s of "
+                                  "%(br)s", {'cookie': cookie,
+                                             'table': table_id,
+                                             'br': br.br_name})
+                        self.flows.delete_flows_by_cookie(dbr, table_id,
+                                                          cookie)
+
+    def _get_stale_cookies(self, br, table_id):
+        cookies = self.flows.get_flow_cookies(br, table_id)
+        cookies.discard(0)
+        cookies.discard(br.default_cookie)
+        return cookies
 
     def consume_api(self, agent_api):
         self.agent_api = agent_api
 
+    # The port events are handled in the L2 agent thread, concurrently with
+    # the driver calls.
+    def handle_port(self, port):
+        vif_port = port.get('vif_port')
+        if not vif_port:
+            return
+        with self._cache_lock:
+            self._vif_ports[port['port_id']] = vif_port
+            if port.get('local_vlan') is not None:
+                self._port_vlans[vif_port.port_name] = port['local_vlan']
+            else:
+                self._port_vlans.pop(vif_port.port_name, None)
+
+    def delete_port(self, port):
+        with self._cache_lock:
+            vif_port = self._vif_ports.pop(port['port_id'], None)
+            if vif_port:
+                self._port_vlans.pop(vif_port.port_name, None)
+
+    # The cache misses are looked up in OVSDB without the lock held, the
+    # details cached in the meantime, by a port event or another driver
+    # call, are kept.
+    def _get_patch_ofport(self, br, port_name):
+        key = (br.br_name, port_name)
+        with self._cache_lock:
+            ofport = self._patch_ofports.get(key)
+        if ofport is None:
+            ofport = br.get_port_ofport(port_name)
+            with self._cache_lock:
+                ofport = self._patch_ofports.setdefault(key, ofport)
+        return ofport
+
+    def _get_vif_port(self, port_id):
+        with self._cache_lock:
+            vif_port = self._vif_ports.get(port_id)
+        if vif_port is None:
+            vif_port = self.int_br.get_vif_port_by_id(port_id)
+            if vif_port:
+                with self._cache_lock:
+                    vif_port = self._vif_ports.setdefault(port_id, vif_port)
+        return vif_port
+
+    def _get_port_vlan(self, vif_port):
+        with self._cache_lock:
+            port_vlan_id = self._port_vlans.get(vif_port.port_name)
+        if port_vlan_id is None:
+            port_vlan_id = self.int_br.db_get_val('Port', vif_port.port_name,
+                                                  'tag')
+            with self._cache_lock:
+                port_vlan_id = self._port_vlans.setdefault(
+                    vif_port.port_name, port_vlan_id)
+        return port_vlan_id
+
     @log_helpers.log_method_call
     def create_tap_service(self, tap_service_msg):
         """Create a tap service
@@ -228,59 +295,38 @@ class OvsTaasDriver(taas_base.TaasAgentDriver):
                                 port of the tap-service:
                                 {tap_service: {}, taas_id: VID, port: {}}
         """
+        # Get patch port IDs
+        patch_int_tap_id = self._get_patch_ofport(self.int_br,
+                                                  'patch-int-tap')
+        patch_tap_int_id = self._get_patch_ofport(self.tap_br,
+                                                  'patch-tap-int')
+
+        with self._deferred_bridges() as bridges:
+            ovs_port = self._install_tap_service(
+                bridges, tap_service_msg, patch_int_tap_id, patch_tap_int_id)
+
+        self._disable_hybrid_plug_ageing(tap_service_msg['port'], ovs_port)
+
+    def _install_tap_service(self, bridges, tap_service_msg,
+                             patch_int_tap_id, patch_tap_int_id):
+        int_br, tap_br, tun_br = bridges
         taas_id = tap_service_msg['taas_id']
         port = tap_service_msg['port']
 
         # Get OVS port id for tap service port
-        ovs_port = self.int_br.get_vif_port_by_id(port['id'])
+        ovs_port = self._get_vif_port(port['id'])
         ovs_port_id = ovs_port.ofport
 
         # Get VLAN id for tap service port
-        port_dict = self.int_br.get_port_tag_dict()
-        port_vlan_id = port_dict[ovs_port.port_name]
+        port_vlan_id = self._get_port_vlan(ovs_port)
 
-        # Get patch port IDs
-        patch_int_tap_id = self.int_br.get_port_ofport('patch-int-tap')
-        patch_tap_int_id = self.tap_br.get_port_ofport('patch-tap-int')
-
-        # Add flow(s) in br-int
-        self.int_br.add_flow(table=0,
-                             priority=25,
-                             in_port=patch_int_tap_id,
-                             dl_vlan=taas_id,
-                             actions="mod_vlan_vid:%s,output:%s" %
-                             (str(port_vlan_id), str(ovs_port_id)))
-
-        # Add flow(s) in br-tap
-        self.tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_LOC,
-                             priority=1,
-                             dl_vlan=taas_id,
-                             actions="output:in_port")
-
-        self.tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_REM,
-                             priority=1,
-                             dl_vlan=taas_id,
-                             actions="output:%s" % str(patch_tap_int_id))
-
-        # Add flow(s) in br-tun
-        if self.tunnel_types:
-            for tunnel_type in n_ovs_consts.TUNNEL_NETWORK_TYPES:
-                self.tun_br.add_flow(
-                    table=n_ovs_consts.TUN_TABLE[tunnel_type],
-                    priority=1,
-                    tun_id=taas_id,
-                    actions=("move:NXM_OF_VLAN_TCI[0..11]->"
-                             "NXM_NX_REG0[0..11],move:NXM_NX_TUN_ID"
-                             "[0..11]->NXM_OF_VLAN_TCI[0..11],"
-                             "resubmit(,%s)" %
-                             taas_ovs_consts.TAAS_CLASSIFY))
-
-            self.tun_br.add_flow(table=taas_ovs_consts.TAAS_DST_CHECK,
-                                 priority=1,
-                                 tun_id=taas_id,
-                                 actions="resubmit(,%s)" %
-                                 taas_ovs_consts.TAAS_DST_RESPOND)
+        self.flows.install_tap_service(
+            int_br, tap_br, tun_br, taas_id, port_vlan_id, ovs_port_id,
+            patch_int_tap_id, patch_tap_int_id)
+        return ovs_port
 
+    @staticmethod
+    def _disable_hybrid_plug_ageing(port, ovs_port):
         # Get hybrid plug info
         vif_details = port.get('binding:vif_details')
         is_hybrid_plug = vif_details.get('ovs_hybrid_plug')
@@ -305,32 +351,12 @@ class OvsTaasDriver(taas_base.TaasAgentDriver):
         taas_id = tap_service_msg['taas_id']
 
         # Get patch port ID
-        patch_int_tap_id = self.int_br.get_port_ofport('patch-int-tap')
-
-        # Delete flow(s) from br-int
-        self.int_br.delete_flows(table=0,
-                                 in_port=patch_int_tap_id,
-                                 dl_vlan=taas_id)
-
-        # Delete flow(s) from br-tap
-        self.tap_br.delete_flows(table=taas_ovs_consts.TAAS_RECV_LOC,
-                                 dl_vlan=taas_id)
-
-        self.tap_br.delete_flows(table=taas_ovs_consts.TAAS_RECV_REM,
-                                 dl_vlan=taas_id)
-
-        if self.tunnel_types:
-            # Delete flow(s) from br-tun
-            for tunnel_type in n_ovs_consts.TUNNEL_NETWORK_TYPES:
-                self.tun_br.delete_flows(
-                    table=n_ovs_consts.TUN_TABLE[tunnel_type],
-                    tun_id=taas_id)
-
-            self.tun_br.delete_flows(table=taas_ovs_consts.TAAS_DST_CHECK,
-                                     tun_id=taas_id)
+        patch_int_tap_id = self._get_patch_ofport(self.int_br,
+                                                  'patch-int-tap')
 
-            self.tun_br.delete_flows(table=taas_ovs_consts.TAAS_SRC_CHECK,
-                                     tun_id=taas_id)
+        with self._deferred_bridges() as (int_br, tap_br, tun_br):
+            self.flows.remove_tap_service(int_br, tap_br, tun_br, taas_id,
+                                          patch_int_tap_id)
 
     @log_helpers.log_method_call
     def create_tap_flow(self, tap_flow_msg):
@@ -345,6 +371,15 @@ class OvsTaasDriver(taas_base.TaasAgentDriver):
                              {tap_flow: {}, port_mac: '', taas_id: VID,
                              port: {}, tap_service_port: {}}
         """
+        # Get patch port ID
+        patch_int_tap_id = self._get_patch_ofport(self.int_br,
+                                                  'patch-int-tap')
+
+        with self._deferred_bridges() as bridges:
+            self._install_tap_flow(bridges, tap_flow_msg, patch_int_tap_id)
+
+    def _install_tap_flow(self, bridges, tap_flow_msg, patch_int_tap_id):
+        int_br, _tap_br, tun_br = bridges
         taas_id = tap_flow_msg['taas_id']
         port = tap_flow_msg['port']
         direction = tap_flow_msg['tap_flow']['direction']
@@ -354,90 +389,47 @@ class OvsTaasDriver(taas_base.TaasAgentDriver):
             if 'tf_nw' in tap_flow_msg else None
 
         # Get OVS port id for tap flow port
-        ovs_port = self.int_br.get_vif_port_by_id(port['id'])
+        ovs_port = self._get_vif_port(port['id'])
         ovs_port_id = ovs_port.ofport
 
-        # Get patch port ID
-        patch_int_tap_id = self.int_br.get_port_ofport('patch-int-tap')
-
-        # Add flow(s) in br-int
-        if direction in ('OUT', 'BOTH'):
-            self.int_br.add_flow(table=0,
-                                 priority=20,
-                                 in_port=ovs_port_id,
-                                 actions="normal,mod_vlan_vid:%s,output:%s" %
-                                 (str(taas_id), str(patch_int_tap_id)))
-
-        if direction in ('IN', 'BOTH'):
-            port_mac = tap_flow_msg['port_mac']
+        self.flows.install_tap_flow(
+            int_br, tun_br, taas_id, direction, ovs_port_id,
+            tap_flow_msg.get('port_mac'), patch_int_tap_id,
+            physical_network=physical_network,
+            network_type=network_type)
 
-            #
-            # Note: The ingress side flow (for unicast traffic) should
-            #       include a check for the 'VLAN id of the Neutron
-            #       network the port belongs to' + 'MAC address of the
-            #       port', to comply with the requirement that port MAC
-            #       addresses are unique only within a Neutron network.
-            #       Unfortunately, at the moment there is no clean way
-            #       to implement such a check, given OVS's handling of
-            #       VLAN tags and Neutron's use of the NORMAL action in
-            #       br-int.
-            #
-            #       We are therefore temporarily disabling the VLAN id
-            #       check until a mechanism is available to implement
-            #       it correctly. The {broad,multi}cast flow, which is
-            #       also dependent on the VLAN id, has been disabled
-            #       for the same reason.
-            #
+    @log_helpers.log_method_call
+    def sync_tap_resources(self, tap_resources_msg):
+        """Install the flows of all the tap resources of the host
 
-            # Get VLAN id for tap flow port
-            # port_dict = self.int_br.get_port_tag_dict()
-            # port_vlan_id = port_dict[ovs_port.port_name]
-            if not physical_network:
-                self.int_br.add_flow(
-                    table=0,
-                    priority=20,
-                    # dl_vlan=port_vlan_id,
-                    dl_dst=port_mac,
-                    actions="normal,mod_vlan_vid:%s,output:%s" %
-                    (str(taas_id), str(patch_int_tap_id))
-                )
+        The flows of all the tap services and tap flows are computed first
+        and applied with a single bundle per bridge, so the bridges are
+        either fully converged or left untouched.
 
-            else:
-                actions = "output:{},mod_vlan_vid:{},output:{}".format(
-                    str(ovs_port_id), str(taas_id), str(patch_int_tap_id)
-                )
-                if network_type == 'vlan':
-                    actions = 'strip_vlan,' + actions
-                self.int_br.add_flow(
-                    table=0,
-                    priority=20,
-                    # dl_vlan=port_vlan_id,
-                    dl_dst=port_mac,
-                    actions=actions
-                )
-
-            # self._add_update_ingress_bcmc_flow(port_vlan_id,
-            #                                    taas_id,
-            #                                    patch_int_tap_id)
-
-        # Add flow(s) in br-tun
-        if self.tunnel_types:
-            for tunnel_type in n_ovs_consts.TUNNEL_NETWORK_TYPES:
-                self.tun_br.add_flow(
-                    table=n_ovs_consts.TUN_TABLE[tunnel_type],
-                    priority=1,
-                    tun_id=taas_id,
-                    actions=("move:NXM_OF_VLAN_TCI[0..11]->"
-                             "NXM_NX_REG0[0..11],move:NXM_NX_TUN_ID"
-                             "[0..11]->NXM_OF_VLAN_TCI[0..11],"
-                             "resubmit(,%s)" %
-                             taas_ovs_consts.TAAS_CLASSIFY))
-
-            self.tun_br.add_flow(table=taas_ovs_consts.TAAS_SRC_CHECK,
-                                 priority=1,
-                                 tun_id=taas_id,
-                                 actions="resubmit(,%s)" %
-                                 taas_ovs_consts.TAAS_SRC_RESPOND)
+        :param tap_resources_msg: a dict of the messages of the tap
+                                  services and tap flows of the host:
+                                  {tap_services: [], tap_flows: []}
+        """
+        # Get patch port IDs
+        patch_int_tap_id = self._get_patch_ofport(self.int_br,
+                                                  'patch-int-tap')
+        patch_tap_int_id = self._get_patch_ofport(self.tap_br,
+                                                  'patch-tap-int')
+
+        ovs_ports = []
+        with self._deferred_bridges() as bridges:
+            for tap_service_msg in tap_resources_msg['tap_services']:
+                ovs_ports.append(self._install_tap_service(
+                    bridges, tap_service_msg, patch_int_tap_id,
+                    patch_tap_int_id))
+            for tap_flow_msg in tap_resources_msg['tap_flows']:
+                self._install_tap_flow(bridges, tap_flow_msg,
+                                       patch_int_tap_id)
+
+        for tap_service_msg, ovs_port in zip(
+                tap_resources_msg['tap_services'], ovs_ports):
+            self._disable_hybrid_plug_ageing(tap_service_msg['port'],
+                                             ovs_port)
 
     @log_helpers.log_method_call
     def delete_tap_flow(self, tap_flow_msg):
@@ -458,127 +450,31 @@ class OvsTaasDriver(taas_base.TaasAgentDriver):
         direction = tap_flow_msg['tap_flow']['direction']
 
         # Get OVS port id for tap flow port
-        ovs_port = self.int_br.get_vif_port_by_id(port['id'])
+        ovs_port = self._get_vif_port(port['id'])
         ovs_port_id = ovs_port.ofport
 
-        # Delete flow(s) from br-int
-        if direction in ('OUT', 'BOTH'):
-            self.int_br.delete_flows(table=0,
-                                     in_port=ovs_port_id)
-
-        if direction in ('IN', 'BOTH'):
-            port_mac = tap_flow_msg['port_mac']
-
-            #
-            # The VLAN id related checks have been temporarily disabled.
-            # Please see comment in create_tap_flow() for details.
-            #
-
-            # taas_id = tap_flow['taas_id']
-
-            # Get VLAN id for tap flow port
-            # port_dict = self.int_br.get_port_tag_dict()
-            # port_vlan_id = port_dict[ovs_port.port_name]
-
-            # Get patch port ID
-            # patch_int_tap_id = self.int_br.get_port_ofport('patch-int-tap')
-
-            self.int_br.delete_flows(table=0,
-                                     # dl_vlan=port_vlan_id,
-                                     dl_dst=port_mac)
-
-            # self._del_update_ingress_bcmc_flow(port_vlan_id,
-            #                                    taas_id,
-            #                                    patch_int_tap_id)
+        with self._deferred_bridges() as (int_br, tap_br, tun_br):
+            self.flows.remove_tap_flow(int_br, direction, ovs_port_id,
+                                       tap_flow_msg.get('port_mac'))
 
     def update_tunnel_flood_flow(self):
-        flow_action = self._create_tunnel_flood_flow_action()
-        if flow_action != "":
-            self.tun_br.mod_flow(table=taas_ovs_consts.TAAS_SEND_FLOOD,
-                                 actions=flow_action)
-
-    def _create_tunnel_flood_flow_action(self):
-        port_name_list = self.tun_br.get_port_name_list()
-
-        flow_action = ("move:NXM_OF_VLAN_TCI[0..11]->NXM_NX_TUN_ID[0..11],"
-                       "mod_vlan_vid:1")
-
-        tunnel_ports_exist = False
-
-        for port_name in port_name_list:
-            if port_name not in ('patch-int', 'patch-tun-tap'):
-                flow_action += (",output:%d" %
-                                self.tun_br.get_port_ofport(port_name))
-                tunnel_ports_exist = True
-
-        if tunnel_ports_exist:
-            return flow_action
-        else:
-            return ""
-
-    def _create_ingress_bcmc_flow_action(self, taas_id_list, out_port_id):
-        flow_action = "normal"
-        for taas_id in taas_id_list:
-            flow_action += (",mod_vlan_vid:%d,output:%d" %
-                            (taas_id, out_port_id))
-
-        return flow_action
-
-    #
-    # Adds or updates a special flow in br-int to mirror (duplicate and
-    # redirect to 'out_port_id') all ingress broadcast/multicast traffic,
-    # associated with a VLAN, to possibly multiple tap service instances.
-    #
-    def _add_update_ingress_bcmc_flow(self, vlan_id, taas_id, out_port_id):
-        # Add a tap service instance affiliation with VLAN
-        self.bcmc_kvm.affiliate(vlan_id, taas_id)
-
-        # Find all tap service instances affiliated with VLAN
-        taas_id_list = self.bcmc_kvm.list_affiliations(vlan_id)
-
-        #
-        # Add/update flow to mirror ingress BCMC traffic, associated
-        # with VLAN, to all affiliated tap-service instances.
-        #
-        flow_action = self._create_ingress_bcmc_flow_action(taas_id_list,
-                                                            out_port_id)
-        self.int_br.add_flow(table=0,
-                             priority=20,
-                             dl_vlan=vlan_id,
-                             dl_dst="01:00:00:00:00:00/01:00:00:00:00:00",
-                             actions=flow_action)
-
-    #
-    # Removes or updates a special flow in br-int to mirror (duplicate
-    # and redirect to 'out_port_id') all ingress broadcast/multicast
-    # traffic, associated with a VLAN, to possibly multiple tap-service
-    # instances.
-    #
-    def _del_update_ingress_bcmc_flow(self, vlan_id, taas_id, out_port_id):
-        # Remove a tap-service instance affiliation with VLAN
-        self.bcmc_kvm.unaffiliate(vlan_id, taas_id)
-
-        # Find all tap-service instances affiliated with VLAN
-        taas_id_list = self.bcmc_kvm.list_affiliations(vlan_id)
-
-        #
-        # If there are tap service instances affiliated with VLAN, update
-        # the flow to mirror ingress BCMC traffic, associated with VLAN,
-        # to all of them. Otherwise, remove the flow.
-        #
-        if taas_id_list:
-            flow_action = self._create_ingress_bcmc_flow_action(taas_id_list,
-                                                                out_port_id)
-            self.int_br.add_flow(table=0,
-                                 priority=20,
-                                 dl_vlan=vlan_id,
-                                 dl_dst="01:00:00:00:00:00/01:00:00:00:00:00",
-                                 actions=flow_action)
-        else:
-            self.int_br.delete_flows(table=0,
-                                     dl_vlan=vlan_id,
-                                     dl_dst=("01:00:00:00:00:00/"
-                                             "01:00:00:00:00:00"))
+        # Reset the flag first, so that a tunnel port change occurring
+        # while the flow is updated triggers another update
+        self.tunnel_ports_changed = False
+        tunnel_ofports = self._get_tunnel_ofports()
+        if tunnel_ofports == self._tunnel_ofports:
+            return
+        self._tunnel_ofports = tunnel_ofports
+
+        self.flows.update_tunnel_flood_flow(self.tun_br, tunnel_ofports)
+
+    def _get_tunnel_ofports(self):
+        ports = self.tun_br.get_ports_attributes(
+            'Interface', columns=['name', 'ofport'], if_exists=True)
+        return sorted(
+            port['ofport'] for port in ports
+            if port['name'] not in ('patch-int', 'patch-tun-tap') and
+            isinstance(port['ofport'], int) and port['ofport'] > 0)
 
     @log_helpers.log_method_call
     def create_tap_mirror(self, tap_mirror_msg):
@@ -586,11 +482,13 @@ class OvsTaasDriver(taas_base.TaasAgentDriver):
         tap_mirror = tap_mirror_msg['tap_mirror']
 
         type = ''
-        patch_int_tap_id = self.int_br.get_port_ofport('patch-int-tap')
-        patch_tap_int_id = self.tap_br.get_port_ofport('patch-tap-int')
+        patch_int_tap_id = self._get_patch_ofport(self.int_br,
+                                                  'patch-int-tap')
+        patch_tap_int_id = self._get_patch_ofport(self.tap_br,
+                                                  'patch-tap-int')
 
         # Get OVS port id for tap flow port
-        ovs_port = self.int_br.get_vif_port_by_id(source_port['id'])
+        ovs_port = self._get_vif_port(source_port['id'])
         ovs_port_id = ovs_port.ofport
 
         options = collections.OrderedDict()
@@ -604,54 +502,26 @@ class OvsTaasDriver(taas_base.TaasAgentDriver):
             type = 'gre'
         directions = tap_mirror['directions']
 
-        for direction, tunnel_id in directions.items():
-            options['erspan_idx'] = str(tunnel_id)
-            # Note(lajoskatona): this is treated as hexa, so
-            # spanId will be d102, and Index will be d258 in the packet.
-            # As OVN doesn't care about this let's have OVS driver the same
-            # behaviour.
-            options['key'] = str(tunnel_id)
-            port_name = 'tm_%s_%s' % (direction.lower(),
-                                      tap_mirror['id'][0:6])
-            attrs = [('type', type),
-                     ('options', options)]
-            mirror_of_port = self.tap_br.add_port(port_name, *attrs)
-
-            if direction == 'IN':
-                self.tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_LOC,
-                                     priority=20,
-                                     dl_dst=source_port['mac_address'],
-                                     actions="output:%s" % str(mirror_of_port))
-                self.int_br.add_flow(
-                    table=0,
-                    priority=20,
-                    dl_dst=source_port['mac_address'],
-                    actions="output:%s,resubmit(,%s)" %
-                            (str(patch_int_tap_id),
-                             str(n_ovs_consts.PACKET_RATE_LIMIT)))
-            if direction == 'OUT':
-                self.tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_LOC,
-                                     priority=20,
-                                     dl_src=source_port['mac_address'],
-                                     actions="output:%s" % str(mirror_of_port))
-                self.int_br.add_flow(
-                    table=0,
-                    priority=20,
-                    in_port=ovs_port_id,
-                    actions="output:%s,resubmit(,%s)" %
-                            (str(patch_int_tap_id),
-                             str(n_ovs_consts.PACKET_RATE_LIMIT)))
-
-        # Add flow(s) in br-tap
-        self.tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_LOC,
-                             priority=1,
-                             dl_dst=source_port['mac_address'],
-                             actions="output:in_port")
-
-        self.tap_br.add_flow(table=taas_ovs_consts.TAAS_RECV_REM,
-                             priority=1,
-                             dl_dst=source_port['mac_address'],
-                             actions="output:%s" % str(patch_tap_int_id))
+        with self._deferred_bridges() as (int_br, tap_br, tun_br):
+            for direction, tunnel_id in directions.items():
+                options['erspan_idx'] = str(tunnel_id)
+                # Note(lajoskatona): this is treated as hexa, so
+                # spanId will be d102, and Index will be d258 in the packet.
+                # As OVN doesn't care about this let's have OVS driver the same
+                # behaviour.
+                options['key'] = str(tunnel_id)
+                port_name = 'tm_%s_%s' % (direction.lower(),
+                                          tap_mirror['id'][0:6])
+                attrs = [('type', type),
+                         ('options', options)]
+                mirror_of_port = self.tap_br.add_port(port_name, *attrs)
+
+                self.flows.install_tap_mirror_direction(
+                    int_br, tap_br, direction, source_port['mac_address'],
+                    ovs_port_id, mirror_of_port, patch_int_tap_id)
+
+            self.flows.install_tap_mirror(tap_br, source_port['mac_address'],
+                                          patch_tap_int_id)
 
     @log_helpers.log_method_call
     def delete_tap_mirror(self, tap_mirror_msg):
@@ -660,24 +530,16 @@ class OvsTaasDriver(taas_base.TaasAgentDriver):
         directions = tap_mirror['directions']
 
         # Get OVS port id for tap flow port
-        ovs_port = self.int_br.get_vif_port_by_id(source_port['id'])
+        ovs_port = self._get_vif_port(source_port['id'])
         ovs_port_id = ovs_port.ofport
 
-        self.tap_br.delete_flows(table=taas_ovs_consts.TAAS_RECV_REM,
-                                 dl_dst=source_port['mac_address'])
-        self.tap_br.delete_flows(table=taas_ovs_consts.TAAS_RECV_LOC,
-                                 dl_dst=source_port['mac_address'])
-
-        for direction, tunnel_id in directions.items():
-            if direction == 'IN':
-                self.int_br.delete_flows(table=0,
-                                         dl_dst=source_port['mac_address'])
-                self.tap_br.delete_flows(table=taas_ovs_consts.TAAS_RECV_LOC,
-                                         dl_dst=source_port['mac_address'])
-            if direction == 'OUT':
-                self.int_br.delete_flows(table=0, in_port=ovs_port_id)
-                self.tap_br.delete_flows(table=taas_ovs_consts.TAAS_RECV_LOC,
-                                         dl_src=source_port['mac_address'])
+        with self._deferred_bridges() as (int_br, tap_br, tun_br):
+            self.flows.remove_tap_mirror(int_br, tap_br, directions,
+                                         source_port['mac_address'],
+                                         ovs_port_id)
+
+        # Remove the mirror ports only once no flow points to them anymore
+        for direction in directions:
             port_name = 'tm_%s_%s' % (direction.lower(),
                                       tap_mirror['id'][0:6])
             self.tap_br.delete_port(port_name)
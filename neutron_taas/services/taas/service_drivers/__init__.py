@@ -56,6 +56,22 @@ class TaasBaseDriver(metaclass=abc.ABCMeta):
     def delete_tap_flow_postcommit(self, context):
         pass
 
+    def create_tap_flows_precommit(self, contexts):
+        for context in contexts:
+            self.create_tap_flow_precommit(context)
+
+    def create_tap_flows_postcommit(self, contexts):
+        for context in contexts:
+            self.create_tap_flow_postcommit(context)
+
+    def delete_tap_flows_precommit(self, contexts):
+        for context in contexts:
+            self.delete_tap_flow_precommit(context)
+
+    def delete_tap_flows_postcommit(self, contexts):
+        for context in contexts:
+            self.delete_tap_flow_postcommit(context)
+
     @abc.abstractmethod
     def create_tap_mirror_precommit(self, context):
         pass
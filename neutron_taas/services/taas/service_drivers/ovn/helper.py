@@ -12,44 +12,114 @@
 
 import queue
 import threading
+import time
+import zlib
 
 from neutron.conf.plugins.ml2.drivers.ovn import ovn_conf
 from neutron_lib.callbacks import events
+from neutron_lib.callbacks import priority_group
 from neutron_lib.callbacks import registry
 from neutron_lib.callbacks import resources
+from neutron_lib import constants
+from neutron_lib.plugins import directory
 from oslo_config import cfg
 from oslo_log import helpers as log_helpers
 from oslo_log import log as logging
 from ovs.stream import Stream
+from ovsdbapp.backend.ovs_idl import idlutils
 
+from neutron_taas.common import config
 from neutron_taas.services.taas.service_drivers.ovn.ovsdb import impl_idl_taas
 
 
 LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
 
+# Upper bound of queued requests committed in a single NB transaction.
+MAX_REQUESTS_PER_TXN = 500
+# Prefix of the names of the Mirror rows managed by TaaS.
+MIRROR_NAME_PREFIX = 'tm_'
+
+_shared_nb_idl = None
+_shared_nb_idl_lock = threading.Lock()
+
+
+def _get_shared_nb_idl_api():
+    """Return the NB API of the TaaS connection shared by the process."""
+    global _shared_nb_idl
+    with _shared_nb_idl_lock:
+        if _shared_nb_idl is None:
+            nb_idl = impl_idl_taas.OvnNbIdlForTaas()
+            _shared_nb_idl = (nb_idl, nb_idl.start())
+        return _shared_nb_idl[1]
+
 
 class TaasOvnProviderHelper():
 
-    def __init__(self):
+    def __init__(self, status_callback=None):
         ovn_conf.register_opts()
-        self._requests = queue.Queue()
-        self._helper_thread = threading.Thread(target=self._request_handler)
-        self._helper_thread.daemon = True
+        config.register()
+        # Requests are sharded by port, each worker has its own queue so the
+        # operations on a port are applied in order while a slow commit only
+        # delays the ports of its own shard.
+        self._request_queues = [
+            queue.Queue() for _i in range(CONF.taas.ovn_mirror_workers)]
+        self._helper_threads = []
+        for request_queue in self._request_queues:
+            helper_thread = threading.Thread(target=self._request_handler,
+                                             args=(request_queue,))
+            helper_thread.daemon = True
+            self._helper_threads.append(helper_thread)
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests_processed': 0,
+                       'requests_failed': 0,
+                       'latency_total': 0.0,
+                       'latency_max': 0.0}
+        # Called with the ids of the tap mirrors and their new status once
+        # their requests are applied.
+        self._status_callback = status_callback
         self._check_and_set_ssl_files()
         self._taas_mirror_func_map = {
             'mirror_del': self.mirror_del,
             'mirror_add': self.mirror_add,
         }
         self._subscribe()
-        self._helper_thread.start()
+        for helper_thread in self._helper_threads:
+            helper_thread.start()
 
     def _subscribe(self):
+        # Run after the default priority callbacks, which include the post
+        # fork initialization of the ML2/OVN mechanism driver.
         registry.subscribe(self._post_fork_initialize,
                            resources.PROCESS,
-                           events.AFTER_INIT)
+                           events.AFTER_INIT,
+                           priority=priority_group.PRIORITY_DEFAULT + 100)
+
+    @staticmethod
+    def _get_ml2_nb_api():
+        mech_drivers = getattr(getattr(directory.get_plugin(),
+                                       'mechanism_manager', None),
+                               'mech_drivers', {})
+        for name in ('ovn', 'ovn-sync'):
+            if name in mech_drivers:
+                # Not set in the workers where the mechanism driver skips
+                # its post fork initialization.
+                return mech_drivers[name].obj._nb_ovn
+        return None
 
     def _post_fork_initialize(self, resource, event, trigger, payload=None):
+        nb_idl_mode = CONF.taas.ovn_nb_idl_mode
+        if nb_idl_mode == 'ml2':
+            nb_api = self._get_ml2_nb_api()
+            if nb_api is not None:
+                self.ovn_nbdb_api = nb_api
+                return
+            LOG.info('The ML2/OVN Northbound connection is not available in '
+                     'this process, using the shared TaaS connection')
+            nb_idl_mode = 'shared'
+        if nb_idl_mode == 'shared':
+            self.ovn_nbdb_api = _get_shared_nb_idl_api()
+            return
         self.ovn_nbdb = impl_idl_taas.OvnNbIdlForTaas()
         self.ovn_nbdb_api = self.ovn_nbdb.start()
 
@@ -67,69 +137,272 @@ class TaasOvnProviderHelper():
         if ca_cert_file:
             Stream.ssl_set_ca_cert_file(ca_cert_file)
 
-    def _request_handler(self):
-        while True:
-            request = self._requests.get()
-            request_type = request['type']
-            if request_type == 'exit':
+    @staticmethod
+    def _get_pending_requests(request_queue):
+        """Block for one request, then drain whatever else is queued."""
+        requests = [request_queue.get()]
+        while (requests[-1]['type'] != 'exit' and
+               len(requests) < MAX_REQUESTS_PER_TXN):
+            try:
+                requests.append(request_queue.get_nowait())
+            except queue.Empty:
                 break
+        return requests
+
+    def _request_handler(self, request_queue):
+        while True:
+            requests = self._get_pending_requests(request_queue)
+            exit_requested = requests[-1]['type'] == 'exit'
 
-            request_handler = self._taas_mirror_func_map.get(request_type)
             try:
-                if request_handler:
-                    request_handler(request['info'])
-                self._requests.task_done()
+                self._process_requests(requests)
             except Exception:
                 # If any unexpected exception happens we don't want the
                 # notify_loop to exit.
                 LOG.exception('Unexpected exception in request_handler')
+            for _request in requests:
+                request_queue.task_done()
+            LOG.debug('Processed %d mirror requests, %d still queued',
+                      len(requests), request_queue.qsize())
+
+            if exit_requested:
+                break
+
+    @staticmethod
+    def _coalesce_requests(requests):
+        """Merge the pending requests targeting the same mirror.
+
+        A mirror added and deleted before reaching the Northbound database
+        is dropped, duplicate requests are merged, and a mirror deleted and
+        added again is updated in place.
+        """
+        pending = {}
+        for request in requests:
+            if request['type'] not in ('mirror_add', 'mirror_del'):
+                continue
+            name = request['info']['name']
+            previous = pending.pop(name, None)
+            if previous is None:
+                pending[name] = request
+            elif request['type'] == 'mirror_add':
+                if (previous['type'] == 'mirror_del' or
+                        previous['info'].get('may_exist')):
+                    request['info']['may_exist'] = True
+                pending[name] = request
+            elif (previous['type'] == 'mirror_add' and
+                    not previous['info'].get('may_exist')):
+                LOG.debug('Mirror %s is deleted before being created, '
+                          'skipping both requests', name)
+            else:
+                pending[name] = request
+        return list(pending.values())
+
+    def _process_requests(self, requests):
+        requests = self._coalesce_requests(requests)
+        batch = []
+        failed = []
+        for request in requests:
+            request_handler = self._taas_mirror_func_map.get(request['type'])
+            if not request_handler:
+                continue
+            try:
+                batch.append((request, request_handler(request['info'])))
+            except Exception:
+                LOG.exception('Failed to build the commands of request %s',
+                              request)
+                failed.append(request)
+        failed.extend(self._commit_batch(batch))
+        self._report_status(requests, failed)
+
+    def _report_status(self, requests, failed):
+        """Report the status of the tap mirrors created by the requests."""
+        if not self._status_callback:
+            return
+
+        def _tap_mirror_ids(reqs):
+            return {request['tap_mirror_id'] for request in reqs
+                    if request['type'] == 'mirror_add' and
+                    'tap_mirror_id' in request}
+
+        error_ids = _tap_mirror_ids(failed)
+        active_ids = _tap_mirror_ids(requests) - error_ids
+        for ids, status in ((active_ids, constants.ACTIVE),
+                            (error_ids, constants.ERROR)):
+            if not ids:
+                continue
+            try:
+                self._status_callback(sorted(ids), status)
+            except Exception:
+                LOG.exception('Failed to set the status of tap mirrors %s '
+                              'to %s', ids, status)
+
+    def _record_requests(self, batch, failed=False):
+        now = time.monotonic()
+        latencies = [now - request['enqueued_at'] for request, _cmds in batch
+                     if 'enqueued_at' in request]
+        with self._stats_lock:
+            if failed:
+                self._stats['requests_failed'] += len(batch)
+            else:
+                self._stats['requests_processed'] += len(batch)
+            self._stats['latency_total'] += sum(latencies)
+            self._stats['latency_max'] = max(
+                [self._stats['latency_max']] + latencies)
+
+    def get_stats(self):
+        """Return the queue depth and request latency of the helper."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        finished = stats['requests_processed'] + stats['requests_failed']
+        stats['latency_avg'] = (
+            stats.pop('latency_total') / finished if finished else 0.0)
+        stats['queue_depths'] = [request_queue.qsize()
+                                 for request_queue in self._request_queues]
+        stats['queue_depth'] = sum(stats['queue_depths'])
+        return stats
+
+    def _commit_batch(self, batch):
+        """Commit the commands of a batch of requests in one transaction.
+
+        If the transaction fails, the batch is split in halves which are
+        retried separately, until the failing request is isolated and
+        logged. The requests of the other halves are still committed.
+
+        :returns: the list of the requests which failed.
+        """
+        if not batch:
+            return []
+        try:
+            self._execute_commands(
+                [command for _request, commands in batch
+                 for command in commands])
+        except Exception:
+            if len(batch) == 1:
+                LOG.exception('Failed to process request %s', batch[0][0])
+                self._record_requests(batch, failed=True)
+                return [batch[0][0]]
+            middle = len(batch) // 2
+            LOG.debug('Transaction of %d requests failed, retrying it in '
+                      'two halves', len(batch))
+            return (self._commit_batch(batch[:middle]) +
+                    self._commit_batch(batch[middle:]))
+        self._record_requests(batch)
+        return []
 
     def _execute_commands(self, commands):
         with self.ovn_nbdb_api.transaction(check_error=True) as txn:
             for command in commands:
                 txn.add(command)
 
+    def _is_mirror_in_sync(self, mirror, info):
+        if not (mirror.filter == info['direction_filter'] and
+                mirror.type == info['mirror_type'] and
+                mirror.sink == info['dest'] and
+                mirror.index == info['index']):
+            return False
+        try:
+            ovn_port = self.ovn_nbdb_api.lookup('Logical_Switch_Port',
+                                                info['port_id'])
+        except idlutils.RowNotFound:
+            return False
+        return mirror.uuid in {rule.uuid for rule in ovn_port.mirror_rules}
+
+    def sync_mirrors(self, expected, pending=()):
+        """Apply the differences between the expected and the NB mirrors.
+
+        :param expected: dict of the ``mirror_add`` request of every mirror
+                         which should exist, keyed by mirror name.
+        :param pending: names of the mirrors whose requests are still
+                        queued, they are left untouched.
+
+        The current state is read from the local IDL cache and the missing,
+        outdated and stale mirrors are fixed in a single transaction. The
+        tap mirrors of the repaired mirrors are set back to ACTIVE.
+        """
+        if not hasattr(self, 'ovn_nbdb_api'):
+            return
+        mirror_rows = self.ovn_nbdb_api.tables['Mirror'].rows.values()
+        mirrors = {mirror.name: mirror for mirror in mirror_rows
+                   if mirror.name.startswith(MIRROR_NAME_PREFIX)}
+
+        batch = []
+        failed = []
+        for name, request in expected.items():
+            mirror = mirrors.get(name)
+            if mirror is not None and self._is_mirror_in_sync(
+                    mirror, request['info']):
+                continue
+            request = dict(request, info=dict(request['info'],
+                                              may_exist=True))
+            try:
+                batch.append((request, self.mirror_add(dict(request['info']))))
+            except Exception:
+                LOG.exception('Failed to build the commands of request %s',
+                              request)
+                failed.append(request)
+        for name, mirror in mirrors.items():
+            if name in expected or name in pending:
+                continue
+            # The ports reference their mirrors weakly, deleting the mirror
+            # detaches it from its port.
+            batch.append(({'type': 'mirror_del', 'info': {'name': name}},
+                          [self.ovn_nbdb_api.mirror_del(mirror.uuid)]))
+
+        if batch:
+            LOG.info('Fixing %d inconsistent OVN mirrors', len(batch))
+        failed.extend(self._commit_batch(batch))
+        self._report_status([request for request, _commands in batch],
+                            failed)
+
     def shutdown(self):
-        self._requests.put({'type': 'exit'})
-        self._helper_thread.join()
+        for request_queue in self._request_queues:
+            request_queue.put({'type': 'exit'})
+        for helper_thread in self._helper_threads:
+            helper_thread.join()
         if hasattr(self, 'ovn_nbdb'):
             self.ovn_nbdb.stop()
         if hasattr(self, 'ovn_nbdb_api'):
             del self.ovn_nbdb_api
 
+    def _get_request_queue(self, port_id):
+        shard = zlib.crc32(port_id.encode()) % len(self._request_queues)
+        return self._request_queues[shard]
+
     def add_request(self, req):
-        self._requests.put(req)
+        req['enqueued_at'] = time.monotonic()
+        self._get_request_queue(req['info']['port_id']).put(req)
 
-    @log_helpers.log_method_call
-    def mirror_del(self, request):
-        port_id = request.pop('port_id')
-        ovn_port = self.ovn_nbdb_api.lookup('Logical_Switch_Port', port_id)
-        mirror = self.ovn_nbdb_api.mirror_get(
-            request['name']).execute(check_error=True)
+    def _lsp_detach_mirror(self, port_name, mirror_uuid):
         try:
             # pylint: disable=unexpected-keyword-arg
-            self.ovn_nbdb_api.lsp_detach_mirror(
-                ovn_port.name, mirror.uuid,
-                if_exists=True).execute(check_error=True)
+            return self.ovn_nbdb_api.lsp_detach_mirror(
+                port_name, mirror_uuid, if_exists=True)
         except TypeError:
             # Remove when ovsdbapp>2.17.0, the method will use ``if_exists``
             # instead of ``if_exist``.
             # pylint: disable=unexpected-keyword-arg
-            self.ovn_nbdb_api.lsp_detach_mirror(
-                ovn_port.name, mirror.uuid,
-                if_exist=True).execute(check_error=True)
-        self.ovn_nbdb_api.mirror_del(
-            mirror.uuid).execute(check_error=True)
+            return self.ovn_nbdb_api.lsp_detach_mirror(
+                port_name, mirror_uuid, if_exist=True)
 
     @log_helpers.log_method_call
-    def mirror_add(self, request):
+    def mirror_del(self, request):
+        """Return the commands removing a mirror and detaching its port."""
         port_id = request.pop('port_id')
         ovn_port = self.ovn_nbdb_api.lookup('Logical_Switch_Port', port_id)
+        mirror = self.ovn_nbdb_api.mirror_get(
+            request['name']).execute(check_error=True)
+        return [self._lsp_detach_mirror(ovn_port.name, mirror.uuid),
+                self.ovn_nbdb_api.mirror_del(mirror.uuid)]
 
-        mirror = self.ovn_nbdb_api.mirror_add(
-            **request).execute(check_error=True)
-        self.ovn_nbdb_api.lsp_attach_mirror(
-            ovn_port.name, mirror.uuid,
-            may_exist=True).execute(check_error=True)
+    @log_helpers.log_method_call
+    def mirror_add(self, request):
+        """Return the commands creating a mirror and attaching its port."""
+        port_id = request.pop('port_id')
+        ovn_port = self.ovn_nbdb_api.lookup('Logical_Switch_Port', port_id)
 
-        return mirror
+        # The attach command resolves the mirror from the add command, so
+        # both can be committed in the same transaction.
+        mirror_command = self.ovn_nbdb_api.mirror_add(**request)
+        return [mirror_command,
+                self.ovn_nbdb_api.lsp_attach_mirror(
+                    ovn_port.name, mirror_command, may_exist=True)]
@@ -0,0 +1,43 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.plugins.ml2.drivers.ovn.mech_driver.ovsdb import maintenance
+from neutron_lib import context as n_context
+from oslo_log import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+# Seconds between two runs of the tap mirror consistency check.
+TAP_MIRROR_CONSISTENCY_CHECK_INTERVAL = 600
+
+
+class TaasOvnMaintenance:
+    """Periodic tasks of the TaaS OVN driver.
+
+    The tasks are run by the maintenance worker of the ML2/OVN mechanism
+    driver, which only runs them in the worker holding the NB IDL lock.
+    """
+
+    def __init__(self, driver, ovn_client):
+        self._driver = driver
+        self._nb_idl = ovn_client._nb_idl
+
+    @property
+    def has_lock(self):
+        return self._nb_idl.has_lock
+
+    @maintenance.has_lock_periodic(
+        spacing=TAP_MIRROR_CONSISTENCY_CHECK_INTERVAL, run_immediately=True)
+    def check_for_tap_mirror_inconsistencies(self):
+        LOG.debug('Checking the consistency of the OVN tap mirrors')
+        self._driver.sync_tap_mirrors(n_context.get_admin_context())
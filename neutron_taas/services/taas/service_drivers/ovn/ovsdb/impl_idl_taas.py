@@ -121,14 +121,19 @@ class OvsdbNbOvnIdl(nb_impl_idl.OvnNbApiIdlImpl, Backend):
 class OvnNbIdlForTaas(connection.OvsdbIdl):
 
     SCHEMA = "OVN_Northbound"
-    TABLES = ('Logical_Switch_Port', 'Mirror')
+    # Only the columns read or written by TaaS are replicated.
+    TABLES = {
+        'Logical_Switch_Port': ['name', 'mirror_rules'],
+        'Mirror': ['name', 'filter', 'sink', 'type', 'index',
+                   'external_ids'],
+    }
 
     def __init__(self):
         ovn_conf.register_opts()
         self.conn_string = ovn_conf.get_ovn_nb_connection()
         helper = self._get_ovsdb_helper(self.conn_string)
-        for table in OvnNbIdlForTaas.TABLES:
-            helper.register_table(table)
+        for table, columns in OvnNbIdlForTaas.TABLES.items():
+            helper.register_columns(table, columns)
         super().__init__(self.conn_string, helper)
         atexit.register(self.stop)
 
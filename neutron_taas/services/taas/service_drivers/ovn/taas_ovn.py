@@ -11,15 +11,21 @@
 # under the License.
 
 from neutron_lib.api.definitions import tap_mirror as tap_m_api_def
+from neutron_lib import constants
+from neutron_lib import context as n_context
 from oslo_log import helpers as log_helpers
 from oslo_log import log as logging
 
 from neutron_taas.services.taas import service_drivers
 from neutron_taas.services.taas.service_drivers.ovn import helper
+from neutron_taas.services.taas.service_drivers.ovn import maintenance
 
 
 LOG = logging.getLogger(__name__)
 
+PENDING_STATUSES = (constants.PENDING_CREATE, constants.PENDING_UPDATE,
+                    constants.PENDING_DELETE)
+
 
 class TaasOvnDriver(service_drivers.TaasBaseDriver):
     """Taas OVN Service Driver class"""
@@ -30,7 +36,8 @@ class TaasOvnDriver(service_drivers.TaasBaseDriver):
     def __init__(self, service_plugin):
         LOG.debug("Loading Taas OVN Driver.")
         super().__init__(service_plugin)
-        self._ovn_helper = helper.TaasOvnProviderHelper()
+        self._ovn_helper = helper.TaasOvnProviderHelper(
+            status_callback=self._set_tap_mirrors_status)
 
     def __del__(self):
         self._ovn_helper.shutdown()
@@ -79,25 +86,35 @@ class TaasOvnDriver(service_drivers.TaasBaseDriver):
     def create_tap_mirror_precommit(self, context):
         pass
 
-    @log_helpers.log_method_call
-    def create_tap_mirror_postcommit(self, context):
-        LOG.info('create_tap_mirror_postcommit %s', context.tap_mirror)
-        t_m = context.tap_mirror
-        type = 'erspan' if 'erspan' in t_m['mirror_type'] else 'gre'
-        directions = t_m['directions']
-        for direction, tunnel_id in directions.items():
-            mirror_port_name = 'tm_%s_%s' % (direction.lower(), t_m['id'][0:6])
+    @staticmethod
+    def _get_mirror_name(tap_mirror, direction):
+        return '%s%s_%s' % (helper.MIRROR_NAME_PREFIX, direction.lower(),
+                            tap_mirror['id'][0:6])
+
+    def _get_mirror_add_infos(self, tap_mirror):
+        type = 'erspan' if 'erspan' in tap_mirror['mirror_type'] else 'gre'
+        infos = []
+        for direction, tunnel_id in tap_mirror['directions'].items():
             ovn_direction = ('from-lport' if direction == 'OUT'
                              else 'to-lport' if direction == 'IN'
                              else 'both')
-            request = {'type': 'mirror_add',
-                       'info': {'name': mirror_port_name,
-                                'direction_filter': ovn_direction,
-                                'dest': t_m['remote_ip'],
-                                'mirror_type': type,
-                                'index': int(tunnel_id),
-                                'port_id': t_m['port_id']}}
-            self._ovn_helper.add_request(request)
+            infos.append({'name': self._get_mirror_name(tap_mirror,
+                                                        direction),
+                          'direction_filter': ovn_direction,
+                          'dest': tap_mirror['remote_ip'],
+                          'mirror_type': type,
+                          'index': int(tunnel_id),
+                          'port_id': tap_mirror['port_id']})
+        return infos
+
+    @log_helpers.log_method_call
+    def create_tap_mirror_postcommit(self, context):
+        LOG.info('create_tap_mirror_postcommit %s', context.tap_mirror)
+        for info in self._get_mirror_add_infos(context.tap_mirror):
+            self._ovn_helper.add_request(
+                {'type': 'mirror_add',
+                 'tap_mirror_id': context.tap_mirror['id'],
+                 'info': info})
 
     @log_helpers.log_method_call
     def delete_tap_mirror_precommit(self, context):
@@ -105,7 +122,7 @@ class TaasOvnDriver(service_drivers.TaasBaseDriver):
         t_m = context.tap_mirror
         directions = t_m['directions']
         for direction, tunnel_id in directions.items():
-            mirror_port_name = 'tm_%s_%s' % (direction.lower(), t_m['id'][0:6])
+            mirror_port_name = self._get_mirror_name(t_m, direction)
             request = {
                 'type': 'mirror_del',
                 'info': {'id': t_m['id'],
@@ -118,3 +135,26 @@ class TaasOvnDriver(service_drivers.TaasBaseDriver):
     @log_helpers.log_method_call
     def delete_tap_mirror_postcommit(self, context):
         pass
+
+    def _set_tap_mirrors_status(self, ids, status):
+        self.service_plugin.update_tap_mirrors_status(
+            n_context.get_admin_context(), ids, status)
+
+    def sync_tap_mirrors(self, context):
+        """Make the OVN Mirror rows match the tap mirrors of the DB."""
+        expected = {}
+        pending = set()
+        for tap_mirror in self.service_plugin.get_tap_mirrors(context):
+            for info in self._get_mirror_add_infos(tap_mirror):
+                # The requests of the pending tap mirrors are still queued
+                # in the helper, they are left to it.
+                if tap_mirror['status'] in PENDING_STATUSES:
+                    pending.add(info['name'])
+                    continue
+                expected[info['name']] = {'type': 'mirror_add',
+                                          'tap_mirror_id': tap_mirror['id'],
+                                          'info': info}
+        self._ovn_helper.sync_mirrors(expected, pending)
+
+    def ovn_maintenance_periodics(self, ovn_client):
+        return [maintenance.TaasOvnMaintenance(self, ovn_client)]
@@ -14,27 +14,118 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import time
+
+from neutron_lib.api.definitions import portbindings
 from neutron_lib import rpc as n_rpc
 from oslo_log import helpers as log_helpers
 from oslo_log import log as logging
 import oslo_messaging as messaging
 
+from neutron_taas.common import constants as taas_consts
+from neutron_taas.common import topics
+
 LOG = logging.getLogger(__name__)
 
+# Latest version of the agent API, the agents report the one they support.
+AGENT_RPC_VERSION = '1.1'
+# Seconds the version of an agent not upgraded yet is cached before being
+# read again.
+OLDER_AGENT_VERSION_TTL = 60
+
+
+def _get_driver_type(port):
+    if not port:
+        return None
+    return taas_consts.VNIC_TYPE_DRIVER_TYPES.get(
+        port.get(portbindings.VNIC_TYPE))
+
 
 class TaasAgentApi:
-    """RPC calls to agent APIs"""
+    """RPC calls to agent APIs
+
+    API version history:
+        1.0 - Initial version, fanout casts on the TaaS agent topic
+        1.1 - Host targeted casts on the agent driver topics,
+              create_tap_flows, delete_tap_flows and sync_tap_resources_reply
+    """
 
-    def __init__(self, topic, host):
+    def __init__(self, topic, host, plugin=None):
         self.host = host
+        self.plugin = plugin
         target = messaging.Target(topic=topic, version='1.0')
         self.client = n_rpc.get_client(target)
+        # Versions reported by the agents and their expiration time, by
+        # host and driver type.
+        self._agent_versions = {}
+
+    def set_agent_versions(self, host, driver_types, version):
+        """Cache the version of the agent API reported by agents."""
+        # The latest version is kept, the version of an agent not upgraded
+        # yet is read again once in a while until it reports the latest.
+        expires_at = (float('inf') if version == AGENT_RPC_VERSION else
+                      time.monotonic() + OLDER_AGENT_VERSION_TTL)
+        for driver_type in driver_types:
+            self._agent_versions[(host, driver_type)] = (version, expires_at)
+
+    def _get_agent_version(self, context, host, driver_type):
+        version, expires_at = self._agent_versions.get((host, driver_type),
+                                                       (None, 0))
+        if expires_at <= time.monotonic() and self.plugin is not None:
+            # Agents not upgraded since the server was do not report theirs.
+            version = self.plugin.get_agent_rpc_version(
+                context, host, driver_type) or '1.0'
+            self.set_agent_versions(host, [driver_type], version)
+        return version or '1.0'
+
+    def _can_send_version(self, context, host, driver_type, version):
+        """Check if the agent of a host handles a version of the API."""
+        if not host or not driver_type:
+            return False
+        version_cap = self._get_agent_version(context, host, driver_type)
+        return self.client.prepare(version_cap=version_cap).can_send_version(
+            version)
+
+    def _prepare(self, context, host, driver_type, version='1.0'):
+        """Prepare a cast to the TaaS agent of a host.
+
+        Only the agent of the host using the given driver type gets the
+        message. It is sent to all the agents if the host or the driver
+        type are not known, for them to clean up what they have, or if the
+        agent does not listen to its driver topic yet.
+        """
+        if not self._can_send_version(context, host, driver_type, '1.1'):
+            return self.client.prepare(fanout=True)
+        return self.client.prepare(
+            topic=topics.get_agent_topic(driver_type), server=host,
+            version=version)
+
+    def _cast_tap_flows(self, context, method, legacy_method, tap_flow_msgs,
+                        host):
+        msgs_by_driver = collections.defaultdict(list)
+        for tap_flow_msg in tap_flow_msgs:
+            msgs_by_driver[_get_driver_type(tap_flow_msg['port'])].append(
+                tap_flow_msg)
+
+        for driver_type, msgs in msgs_by_driver.items():
+            if self._can_send_version(context, host, driver_type, '1.1'):
+                cctxt = self._prepare(context, host, driver_type,
+                                      version='1.1')
+                cctxt.cast(context, method, tap_flow_msgs=msgs, host=host)
+                continue
+            # Older agents handle the tap flows one by one.
+            cctxt = self.client.prepare(fanout=True)
+            for msg in msgs:
+                cctxt.cast(context, legacy_method, tap_flow_msg=msg,
+                           host=host)
 
     def create_tap_service(self, context, tap_service_msg, host):
         LOG.debug("In RPC Call for Create Tap Service: Host=%s, MSG=%s",
                   host, tap_service_msg)
 
-        cctxt = self.client.prepare(fanout=True)
+        cctxt = self._prepare(context, host,
+                              _get_driver_type(tap_service_msg['port']))
         cctxt.cast(context, 'create_tap_service',
                    tap_service_msg=tap_service_msg, host=host)
 
@@ -42,7 +133,8 @@ class TaasAgentApi:
         LOG.debug("In RPC Call for Create Tap Flow: Host=%s, MSG=%s",
                   host, tap_flow_msg)
 
-        cctxt = self.client.prepare(fanout=True)
+        cctxt = self._prepare(context, host,
+                              _get_driver_type(tap_flow_msg['port']))
         cctxt.cast(context, 'create_tap_flow', tap_flow_msg=tap_flow_msg,
                    host=host)
 
@@ -50,6 +142,8 @@ class TaasAgentApi:
         LOG.debug("In RPC Call for Delete Tap Service: Host=%s, MSG=%s",
                   host, tap_service_msg)
 
+        # The flows of a tap service are spread over all the hosts where its
+        # tap flows and tunnels are, every agent has to clean them up.
         cctxt = self.client.prepare(fanout=True)
         cctxt.cast(context, 'delete_tap_service',
                    tap_service_msg=tap_service_msg, host=host)
@@ -58,18 +152,56 @@ class TaasAgentApi:
         LOG.debug("In RPC Call for Delete Tap Flow: Host=%s, MSG=%s",
                   host, tap_flow_msg)
 
-        cctxt = self.client.prepare(fanout=True)
+        cctxt = self._prepare(context, host,
+                              _get_driver_type(tap_flow_msg['port']))
         cctxt.cast(context, 'delete_tap_flow', tap_flow_msg=tap_flow_msg,
                    host=host)
 
+    def create_tap_flows(self, context, tap_flow_msgs, host):
+        LOG.debug("In RPC Call for Create Tap Flows: Host=%s, MSG=%s",
+                  host, tap_flow_msgs)
+
+        self._cast_tap_flows(context, 'create_tap_flows', 'create_tap_flow',
+                             tap_flow_msgs, host)
+
+    def delete_tap_flows(self, context, tap_flow_msgs, host):
+        LOG.debug("In RPC Call for Delete Tap Flows: Host=%s, MSG=%s",
+                  host, tap_flow_msgs)
+
+        self._cast_tap_flows(context, 'delete_tap_flows', 'delete_tap_flow',
+                             tap_flow_msgs, host)
+
+    def sync_tap_resources_reply(self, context, tap_resources_msg, host,
+                                 driver_type):
+        LOG.debug("In RPC Call for Sync Tap Resources Reply: Host=%s, "
+                  "MSG=%s", host, tap_resources_msg)
+
+        if not self._can_send_version(context, host, driver_type, '1.1'):
+            # Older agents recreate the tap resources one by one, as they
+            # do not know their driver type all of them get the messages.
+            cctxt = self.client.prepare(fanout=True)
+            for tap_service_msg in tap_resources_msg['tap_services']:
+                cctxt.cast(context, 'create_tap_service',
+                           tap_service_msg=tap_service_msg, host=host)
+            for tap_flow_msg in tap_resources_msg['tap_flows']:
+                cctxt.cast(context, 'create_tap_flow',
+                           tap_flow_msg=tap_flow_msg, host=host)
+            return
+
+        cctxt = self._prepare(context, host, driver_type, version='1.1')
+        cctxt.cast(context, 'sync_tap_resources_reply',
+                   tap_resources_msg=tap_resources_msg, host=host)
+
     @log_helpers.log_method_call
     def create_tap_mirror(self, context, tap_mirror_msg, host):
-        cctxt = self.client.prepare(fanout=True)
+        cctxt = self._prepare(context, host,
+                              _get_driver_type(tap_mirror_msg['port']))
         cctxt.cast(context, 'create_tap_mirror', tap_mirror_msg=tap_mirror_msg,
                    host=host)
 
     @log_helpers.log_method_call
     def delete_tap_mirror(self, context, tap_mirror_msg, host):
-        cctxt = self.client.prepare(fanout=True)
+        cctxt = self._prepare(context, host,
+                              _get_driver_type(tap_mirror_msg['port']))
         cctxt.cast(context, 'delete_tap_mirror', tap_mirror_msg=tap_mirror_msg,
                    host=host)
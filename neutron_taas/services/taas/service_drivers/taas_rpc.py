@@ -15,14 +15,26 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import queue
+import threading
+import time
+
 from neutron_lib.api.definitions import portbindings
+from neutron_lib.api.definitions import taas as taas_api_def
+from neutron_lib.api.definitions import tap_mirror as t_m_api_def
 from neutron_lib import constants
+from neutron_lib import context as n_context
 from neutron_lib.db import api as db_api
 from neutron_lib import exceptions as n_exc
+from neutron_lib.exceptions import taas as taas_exc
+from neutron_lib.plugins import directory
 from neutron_lib import rpc as n_rpc
 
+from neutron_taas.common import config
 from neutron_taas.common import constants as taas_consts
 from neutron_taas.common import topics
+from neutron_taas.common import utils as common_utils
 from neutron_taas.services.taas import service_drivers
 from neutron_taas.services.taas.service_drivers import (service_driver_context
                                                         as sd_context)
@@ -32,66 +44,123 @@ from neutron_taas.services.taas import taas_plugin
 from oslo_config import cfg
 from oslo_log import helpers as log_helpers
 from oslo_log import log as logging
-from oslo_utils import excutils
+import oslo_messaging as messaging
 
 LOG = logging.getLogger(__name__)
 
 
+class TokenBucket():
+    """Allow ``rate`` acquisitions per second, up to ``burst`` at once."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+
+    def acquire(self):
+        """Take a token, waiting for one to be available."""
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            time.sleep((1 - self._tokens) / self.rate)
+
+
 class TaasCallbacks:
+    """Handle the RPC messages of the TaaS agents
+
+    API version history:
+        1.0 - Initial version
+        1.1 - set_tap_resources_status, driver type and agent RPC version
+              in the sync_tap_resources requests
+    """
+
+    target = messaging.Target(version='1.1')
 
     def __init__(self, rpc_driver, plugin):
         super().__init__()
         self.rpc_driver = rpc_driver
         self.plugin = plugin
+        config.register()
+        # Resync requests waiting for a token, answered in order by a
+        # thread started on the first request, after the API workers fork.
+        self._sync_bucket = None
+        if cfg.CONF.taas.sync_tap_resources_rate:
+            self._sync_bucket = TokenBucket(
+                cfg.CONF.taas.sync_tap_resources_rate,
+                cfg.CONF.taas.sync_tap_resources_burst)
+        self._sync_queue = queue.Queue()
+        self._sync_pending = set()
+        self._sync_lock = threading.Lock()
+        self._sync_thread = None
 
     def sync_tap_resources(self, context, sync_tap_res, host):
-        """Handle Rpc from Agent to sync up Tap resources."""
-        LOG.debug("In RPC Call for Sync Tap Resources: MSG=%s", sync_tap_res)
+        """Handle Rpc from Agent to sync up Tap resources.
 
-        # Get list of configured tap-services
-        active_tss = self.plugin.get_tap_services(
-            context,
-            filters={'status': [constants.ACTIVE]})
+        All the active tap resources of the host are sent back to the agent
+        in a single message. The requests are answered at the rate allowed
+        by the ``[taas] sync_tap_resources_rate`` option, in order. The rate
+        applies to each RPC worker.
+        """
+        LOG.debug("In RPC Call for Sync Tap Resources: MSG=%s", sync_tap_res)
 
-        for ts in active_tss:
-            # If tap-service port is bound to a different host than the one
-            # which sent this RPC, then continue.
-            ts_port = self.plugin.get_port_details(
-                context, ts['port_id'])
-            if ts_port['binding:host_id'] != host:
-                continue
+        driver_type = sync_tap_res.get('driver_type')
+        # Older agents do not tell their driver type, nor the version of
+        # the agent API they handle.
+        driver_types = (
+            [driver_type] if driver_type else
+            sorted(set(taas_consts.VNIC_TYPE_DRIVER_TYPES.values())))
+        rpc_version = sync_tap_res.get('rpc_version', '1.0')
+        self.plugin.update_agent_rpc_version(context, host, driver_types,
+                                             rpc_version)
+        self.rpc_driver.agent_rpc.set_agent_versions(host, driver_types,
+                                                     rpc_version)
+        if self._sync_bucket is None:
+            self._send_tap_resources(context, host, driver_type)
+            return
+        with self._sync_lock:
+            # The reply to a queued request answers the new one as well.
+            if (host, driver_type) in self._sync_pending:
+                LOG.debug("Resync of host %s already queued", host)
+                return
+            self._sync_pending.add((host, driver_type))
+            self._sync_queue.put((host, driver_type))
+            if self._sync_thread is None:
+                self._sync_thread = threading.Thread(
+                    target=self._sync_handler)
+                self._sync_thread.daemon = True
+                self._sync_thread.start()
+        LOG.debug("Resync of host %(host)s queued, %(depth)d pending",
+                  {'host': host, 'depth': self._sync_queue.qsize()})
+
+    def _sync_handler(self):
+        while True:
+            self._process_sync_request()
+
+    def _process_sync_request(self):
+        host, driver_type = self._sync_queue.get()
+        self._sync_bucket.acquire()
+        with self._sync_lock:
+            self._sync_pending.discard((host, driver_type))
+        # The context of the request belongs to the RPC consumer, its
+        # session is not shared with this thread.
+        context = n_context.get_admin_context()
+        try:
+            self._send_tap_resources(context, host, driver_type)
+        except Exception:
+            LOG.exception("Failed to resync the tap resources of host %s",
+                          host)
 
-            driver_context = sd_context.TapServiceContext(self.plugin,
-                                                          context, ts)
-            try:
-                self.rpc_driver.create_tap_service_postcommit(driver_context)
-            except Exception:
-                with excutils.save_and_reraise_exception():
-                    LOG.error("Failed to create tap service on driver,"
-                              "deleting tap_service %s", ts['id'])
-                    # pylint: disable=E1003
-                    super(taas_plugin.TaasPlugin,
-                          self.plugin).delete_tap_service(context, ts['id'])
-
-            # Get all the active tap flows for current tap-service
-            active_tfs = self.plugin.get_tap_flows(
-                context,
-                filters={'tap_service_id': [ts['id']],
-                         'status': [constants.ACTIVE]})
-
-            # Filter out the tap flows associated with distinct tap services
-            for tf in active_tfs:
-                driver_context = sd_context.TapFlowContext(self.plugin,
-                                                           context, tf)
-                try:
-                    self.rpc_driver.create_tap_flow_postcommit(driver_context)
-                except Exception:
-                    with excutils.save_and_reraise_exception():
-                        LOG.error("Failed to create tap flow on driver,"
-                                  "deleting tap_flow %s", tf['id'])
-                        # pylint: disable=E1003
-                        super(taas_plugin.TaasPlugin,
-                              self.plugin).delete_tap_flow(context, tf['id'])
+    def _send_tap_resources(self, context, host, driver_type):
+        tap_resources_msg = self.rpc_driver.get_tap_resources_msg(
+            context, host, driver_type)
+        self.rpc_driver.agent_rpc.sync_tap_resources_reply(
+            context, tap_resources_msg, host, driver_type)
 
     @db_api.CONTEXT_WRITER
     def set_tap_service_status(self, context, msg, status, host=None):
@@ -146,6 +215,79 @@ class TaasCallbacks:
         super(taas_plugin.TaasPlugin, self.plugin).update_tap_flow(
             context, msg['id'], {'tap_flow': tf})
 
+    def set_tap_mirror_status(self, context, msg, status, host=None):
+        """Handle Rpc from Agent to set the status of Tap Mirrors.
+
+        ``msg`` holds either the ``id`` of one tap mirror or the ``ids`` of
+        several tap mirrors sharing the same status.
+        """
+        LOG.info("In RPC Call to set tap mirror status: Host=%s, "
+                 "MSG=%s, STATUS=%s", host, msg, status)
+
+        # Tap mirrors are removed from the DB when they are deleted, only
+        # the result of their creation is recorded.
+        if status not in (constants.ACTIVE, constants.ERROR):
+            return
+        ids = msg['ids'] if 'ids' in msg else [msg['id']]
+        tap_mirror_plugin = directory.get_plugin(t_m_api_def.ALIAS)
+        tap_mirror_plugin.update_tap_mirrors_status(context, ids, status)
+
+    @db_api.CONTEXT_WRITER
+    def set_tap_resources_status(self, context, statuses, host=None):
+        """Handle Rpc from Agent to set the status of several Tap resources.
+
+        ``statuses`` is a list of ``{'resource': ..., 'id': ..., 'status':
+        ...}`` dicts, ``resource`` being one of ``tap_service``,
+        ``tap_flow`` or ``tap_mirror``. The resources whose deletion
+        succeeded are removed, and the others updated, in bulk.
+        """
+        LOG.info("In RPC Call to set tap resources status: Host=%s, "
+                 "STATUSES=%s", host, statuses)
+
+        # Only the last status reported for a resource matters.
+        latest = {}
+        for entry in statuses:
+            latest[(entry['resource'], entry['id'])] = entry['status']
+        updated = collections.defaultdict(list)
+        deleted = collections.defaultdict(list)
+        for (resource, resource_id), status in latest.items():
+            if status == constants.INACTIVE:
+                deleted[resource].append(resource_id)
+            else:
+                updated[(resource, status)].append(resource_id)
+
+        # Both the TaaS and the Tap Mirror plugins consume the messages of
+        # the agents, look the plugins of the resources up.
+        plugin = directory.get_plugin(taas_api_def.ALIAS)
+        # pylint: disable=E1003
+        taas_db = super(taas_plugin.TaasPlugin, plugin)
+        for (resource, status), ids in updated.items():
+            if resource == 'tap_service':
+                taas_db.update_tap_services_status(context, ids, status)
+            elif resource == 'tap_flow':
+                taas_db.update_tap_flows_status(context, ids, status)
+            elif status in (constants.ACTIVE, constants.ERROR):
+                tap_mirror_plugin = directory.get_plugin(t_m_api_def.ALIAS)
+                tap_mirror_plugin.update_tap_mirrors_status(context, ids,
+                                                            status)
+
+        # Clear the resources from DB once agent indicates successful
+        # deletion by mech driver.
+        if deleted['tap_flow']:
+            tfs = plugin.get_tap_flows(
+                context, filters={'id': deleted['tap_flow']})
+            taas_db.delete_tap_flows(context, deleted['tap_flow'])
+            plugin.driver.delete_tap_flows_postcommit(
+                [sd_context.TapFlowContext(plugin, context, tf)
+                 for tf in tfs])
+        if deleted['tap_service']:
+            tss = plugin.get_tap_services(
+                context, filters={'id': deleted['tap_service']})
+            taas_db.delete_tap_services(context, deleted['tap_service'])
+            for ts in tss:
+                plugin.driver.delete_tap_service_postcommit(
+                    sd_context.TapServiceContext(plugin, context, ts))
+
 
 class TaasRpcDriver(service_drivers.TaasBaseDriver):
     """Taas Rpc Service Driver class"""
@@ -162,7 +304,8 @@ class TaasRpcDriver(service_drivers.TaasBaseDriver):
 
         self.agent_rpc = taas_agent_api.TaasAgentApi(
             topics.TAAS_AGENT,
-            cfg.CONF.host
+            cfg.CONF.host,
+            service_plugin
         )
 
     def _get_taas_id(self, context, tf):
@@ -173,6 +316,129 @@ class TaasRpcDriver(service_drivers.TaasBaseDriver):
             tap_service_id=ts['id']))['taas_id']
         return taas_id
 
+    def _get_tap_flows_data(self, context, tfs):
+        """Fetch the tap services, taas ids and ports of tap flows.
+
+        Everything is read with one query per resource type, whatever the
+        number of tap flows.
+        """
+        ts_ids = list({tf['tap_service_id'] for tf in tfs})
+        tss = {ts['id']: ts for ts in self.service_plugin.get_tap_services(
+            context, filters={'id': ts_ids})}
+        tap_id_associations = self.service_plugin.get_tap_id_associations(
+            context, ts_ids)
+        for ts_id in ts_ids:
+            if ts_id not in tss or ts_id not in tap_id_associations:
+                raise taas_exc.TapServiceNotFound(tap_id=ts_id)
+
+        port_ids = ({tf['source_port'] for tf in tfs} |
+                    {ts['port_id'] for ts in tss.values()})
+        ports = self.service_plugin.get_ports_details(context, port_ids)
+        for port_id in port_ids:
+            if port_id not in ports:
+                raise n_exc.PortNotFound(port_id=port_id)
+
+        return tss, tap_id_associations, ports
+
+    def _get_tap_service_vlans(self, context, tap_service_id):
+        """Get the source VLANs and VLAN filters of a tap service.
+
+        Used by SR-IOV ports, they are collected from all the active tap
+        flows of the tap service.
+        """
+        src_vlans_list = []
+        vlan_filter_list = []
+
+        # The source VLANs are recorded with the tap flows, only the tap
+        # flows created by older releases need their source port.
+        flows_vlans = self.service_plugin.get_tap_service_flows_vlans(
+            context, tap_service_id)
+        source_ports = self.service_plugin.get_ports_details(
+            context, {source_port for source_port, src_vlans, _vlan_filter
+                      in flows_vlans if src_vlans is None})
+
+        for source_port_id, src_vlans, vlan_filter in flows_vlans:
+            if src_vlans is None:
+                source_port = source_ports.get(source_port_id)
+                if source_port is None:
+                    raise n_exc.PortNotFound(port_id=source_port_id)
+                src_vlans = common_utils.get_port_source_vlans(source_port)
+
+            src_vlans_list.append(src_vlans)
+
+            # If no VLAN filter configured for tap-flow,
+            # then include all vlans
+            if not vlan_filter:
+                vlan_filter = taas_consts.VLAN_RANGE
+
+            vlan_filter_list.append(vlan_filter)
+
+        return src_vlans_list, vlan_filter_list
+
+    @staticmethod
+    def _make_create_tap_flow_msg(tf, taas_id, port, ts_port, tf_nw):
+        return {'tap_flow': tf,
+                'port_mac': port['mac_address'],
+                'taas_id': taas_id,
+                'port': port,
+                'tap_service_port': ts_port,
+                'tf_nw': tf_nw}
+
+    def get_tap_resources_msg(self, context, host, driver_type=None):
+        """Build the message with the active tap resources of a host.
+
+        If driver_type is given, only the resources whose port is handled
+        by agents using this driver type are included.
+        """
+        tap_services, tap_flows = (
+            self.service_plugin.get_active_tap_resources_by_host(context,
+                                                                 host))
+        tap_mirror_plugin = directory.get_plugin(t_m_api_def.ALIAS)
+        tap_mirrors = (
+            tap_mirror_plugin.get_active_tap_mirrors_by_host(context, host)
+            if tap_mirror_plugin else [])
+        port_ids = ({ts['port_id'] for ts, _taas_id in tap_services} |
+                    {tf['source_port'] for tf, _ts_port_id, _taas_id
+                     in tap_flows} |
+                    {ts_port_id for _tf, ts_port_id, _taas_id in tap_flows} |
+                    {tm['port_id'] for tm in tap_mirrors})
+        ports = self.service_plugin.get_ports_details(context, port_ids)
+
+        def _port_wanted(port_id):
+            port = ports.get(port_id)
+            if port is None:
+                LOG.debug("Port %s not found, skipping its tap resources",
+                          port_id)
+                return False
+            return driver_type is None or (
+                taas_consts.VNIC_TYPE_DRIVER_TYPES.get(
+                    port.get(portbindings.VNIC_TYPE)) == driver_type)
+
+        tap_services = [(ts, taas_id) for ts, taas_id in tap_services
+                        if _port_wanted(ts['port_id'])]
+        tap_flows = [(tf, ts_port_id, taas_id)
+                     for tf, ts_port_id, taas_id in tap_flows
+                     if _port_wanted(tf['source_port']) and
+                     ts_port_id in ports]
+        # Get network data where the tap flow ports are located
+        tfs_nw = self.service_plugin.get_ports_network_data(
+            context, [ports[tf['source_port']] for tf, _ts_port_id, _taas_id
+                      in tap_flows])
+
+        return {
+            'tap_services': [{'tap_service': ts,
+                              'taas_id': taas_id,
+                              'port': ports[ts['port_id']]}
+                             for ts, taas_id in tap_services],
+            'tap_flows': [self._make_create_tap_flow_msg(
+                tf, taas_id, ports[tf['source_port']], ports[ts_port_id],
+                tfs_nw[tf['source_port']])
+                for tf, ts_port_id, taas_id in tap_flows],
+            'tap_mirrors': [{'tap_mirror': tm, 'port': ports[tm['port_id']]}
+                            for tm in tap_mirrors
+                            if _port_wanted(tm['port_id'])],
+        }
+
     def create_tap_service_precommit(self, context):
         ts = context.tap_service
         tap_id_association = context._plugin.create_tap_id_association(
@@ -241,7 +507,6 @@ class TaasRpcDriver(service_drivers.TaasBaseDriver):
         port = self.service_plugin.get_port_details(context._plugin_context,
                                                     tf['source_port'])
         host = port['binding:host_id']
-        port_mac = port['mac_address']
         # Extract the tap-service port
         ts = self.service_plugin.get_tap_service(context._plugin_context,
                                                  tf['tap_service_id'])
@@ -252,13 +517,8 @@ class TaasRpcDriver(service_drivers.TaasBaseDriver):
             context._plugin_context, port)
         # Send RPC message to both the source port host and
         # tap service(destination) port host
-        rpc_msg = {'tap_flow': tf,
-                   'port_mac': port_mac,
-                   'taas_id': taas_id,
-                   'port': port,
-                   'tap_service_port': ts_port,
-                   'tf_nw': tf_nw
-                   }
+        rpc_msg = self._make_create_tap_flow_msg(tf, taas_id, port, ts_port,
+                                                 tf_nw)
 
         self.agent_rpc.create_tap_flow(context._plugin_context, rpc_msg, host)
 
@@ -281,39 +541,8 @@ class TaasRpcDriver(service_drivers.TaasBaseDriver):
         vlan_filter_list = []
 
         if port.get(portbindings.VNIC_TYPE) == portbindings.VNIC_DIRECT:
-            # Get all the tap Flows that are associated with the Tap service
-            active_tfs = self.service_plugin.get_tap_flows(
-                context._plugin_context,
-                filters={'tap_service_id': [tf['tap_service_id']],
-                         'status': [constants.ACTIVE]},
-                fields=['source_port', 'vlan_filter'])
-
-            for tap_flow in active_tfs:
-                source_port = self.service_plugin.get_port_details(
-                    context._plugin_context, tap_flow['source_port'])
-
-                LOG.debug("taas: active TF's source_port %(source_port)s",
-                          {'source_port': source_port})
-
-                src_vlans = ""
-                if source_port.get(portbindings.VIF_DETAILS):
-                    src_vlans = source_port[portbindings.VIF_DETAILS].get(
-                        portbindings.VIF_DETAILS_VLAN)
-
-                # If no VLAN filter configured on source port,
-                # then include all vlans
-                if not src_vlans or src_vlans == '0':
-                    src_vlans = taas_consts.VLAN_RANGE
-
-                src_vlans_list.append(src_vlans)
-
-                vlan_filter = tap_flow['vlan_filter']
-                # If no VLAN filter configured for tap-flow,
-                # then include all vlans
-                if not vlan_filter:
-                    vlan_filter = taas_consts.VLAN_RANGE
-
-                vlan_filter_list.append(vlan_filter)
+            src_vlans_list, vlan_filter_list = self._get_tap_service_vlans(
+                context._plugin_context, tf['tap_service_id'])
 
         # Send RPC message to both the source port host and
         # tap service(destination) port host
@@ -330,6 +559,70 @@ class TaasRpcDriver(service_drivers.TaasBaseDriver):
     def delete_tap_flow_postcommit(self, context):
         pass
 
+    def create_tap_flows_postcommit(self, contexts):
+        """Send one tap flows creation RPC message per host to agents."""
+        if not contexts:
+            return
+        plugin_context = contexts[0]._plugin_context
+        tfs = [context.tap_flow for context in contexts]
+        tss, tap_id_associations, ports = self._get_tap_flows_data(
+            plugin_context, tfs)
+        # Get network data where the tap flow ports are located
+        tfs_nw = self.service_plugin.get_ports_network_data(
+            plugin_context, [ports[tf['source_port']] for tf in tfs])
+
+        rpc_msgs = collections.defaultdict(list)
+        for tf in tfs:
+            port = ports[tf['source_port']]
+            ts = tss[tf['tap_service_id']]
+            rpc_msgs[port['binding:host_id']].append(
+                self._make_create_tap_flow_msg(
+                    tf, tap_id_associations[ts['id']]['taas_id'], port,
+                    ports[ts['port_id']], tfs_nw[port['id']]))
+
+        for host, tap_flow_msgs in rpc_msgs.items():
+            self.agent_rpc.create_tap_flows(plugin_context, tap_flow_msgs,
+                                            host)
+
+    def delete_tap_flows_precommit(self, contexts):
+        """Send one tap flows deletion RPC message per host to agents."""
+        if not contexts:
+            return
+        plugin_context = contexts[0]._plugin_context
+        tfs = [context.tap_flow for context in contexts]
+        tss, tap_id_associations, ports = self._get_tap_flows_data(
+            plugin_context, tfs)
+
+        ts_vlans = {}
+        rpc_msgs = collections.defaultdict(list)
+        for tf in tfs:
+            port = ports[tf['source_port']]
+            ts = tss[tf['tap_service_id']]
+
+            src_vlans_list = []
+            vlan_filter_list = []
+            if port.get(portbindings.VNIC_TYPE) == portbindings.VNIC_DIRECT:
+                if ts['id'] not in ts_vlans:
+                    ts_vlans[ts['id']] = self._get_tap_service_vlans(
+                        plugin_context, ts['id'])
+                src_vlans_list, vlan_filter_list = ts_vlans[ts['id']]
+
+            rpc_msgs[port['binding:host_id']].append(
+                {'tap_flow': tf,
+                 'port_mac': port['mac_address'],
+                 'taas_id': tap_id_associations[ts['id']]['taas_id'],
+                 'port': port,
+                 'tap_service_port': ports[ts['port_id']],
+                 'source_vlans_list': src_vlans_list,
+                 'vlan_filter_list': vlan_filter_list})
+
+        for host, tap_flow_msgs in rpc_msgs.items():
+            self.agent_rpc.delete_tap_flows(plugin_context, tap_flow_msgs,
+                                            host)
+
+    def delete_tap_flows_postcommit(self, contexts):
+        pass
+
     @log_helpers.log_method_call
     def create_tap_mirror_precommit(self, context):
         pass
@@ -26,6 +26,7 @@ from neutron_lib import exceptions as n_exc
 from neutron_lib.exceptions import taas as taas_exc
 
 from neutron_taas.common import constants as taas_consts
+from neutron_taas.common import utils as common_utils
 from neutron_taas.db import taas_db
 from neutron_taas.services.taas.service_drivers import (service_driver_context
                                                         as sd_context)
@@ -48,7 +49,10 @@ class TaasPlugin(taas_db.Taas_db_Mixin):
                                    "taas-vlan-filter"]
     path_prefix = "/taas"
 
+    __native_bulk_support = True
+
     def __init__(self):
+        super().__init__()
 
         LOG.debug("TAAS PLUGIN INITIALIZATION")
         self.service_type_manager = st_db.ServiceTypeManager.get_instance()
@@ -104,6 +108,13 @@ class TaasPlugin(taas_db.Taas_db_Mixin):
 
         return ts
 
+    @db_api.CONTEXT_WRITER
+    def create_tap_service_bulk(self, context, tap_services):
+        LOG.debug("create_tap_service_bulk() called")
+
+        return [self.create_tap_service(context, tap_service)
+                for tap_service in tap_services['tap_services']]
+
     @db_api.CONTEXT_WRITER
     def delete_tap_service(self, context, id):
         LOG.debug("delete_tap_service() called")
@@ -114,8 +125,7 @@ class TaasPlugin(taas_db.Taas_db_Mixin):
             context,
             filters={'tap_service_id': [id]}, fields=['id'])
 
-        for t_f in t_f_collection:
-            self.delete_tap_flow(context, t_f['id'])
+        self.delete_tap_flows(context, [t_f['id'] for t_f in t_f_collection])
 
         ts = self.get_tap_service(context, id)
         driver_context = sd_context.TapServiceContext(self, context, ts)
@@ -146,14 +156,58 @@ class TaasPlugin(taas_db.Taas_db_Mixin):
         if tenant_id != ts_tenant_id:
             raise taas_exc.TapServiceNotBelongToTenant()
 
+        port = self.get_port_details(context, t_f['source_port'])
+
         # create tap flow in the db model
-        tf = super().create_tap_flow(context, tap_flow)
+        tf = super().create_tap_flow(
+            context, tap_flow,
+            source_vlans=common_utils.get_port_source_vlans(port))
         driver_context = sd_context.TapFlowContext(self, context, tf)
         self.driver.create_tap_flow_precommit(driver_context)
 
         self.driver.create_tap_flow_postcommit(driver_context)
         return tf
 
+    @db_api.CONTEXT_WRITER
+    def create_tap_flow_bulk(self, context, tap_flows):
+        LOG.debug("create_tap_flow_bulk() called")
+
+        t_fs = [tap_flow['tap_flow'] for tap_flow in tap_flows['tap_flows']]
+
+        # Check the tenant of all the tap services at once, the same way
+        # create_tap_flow does it for a single tap flow.
+        ts_ids = {t_f['tap_service_id'] for t_f in t_fs}
+        tss = {ts['id']: ts for ts in self.get_tap_services(
+            context, filters={'id': list(ts_ids)},
+            fields=['id', 'tenant_id'])}
+
+        for t_f in t_fs:
+            ts = tss.get(t_f['tap_service_id'])
+            if ts is None:
+                raise taas_exc.TapServiceNotFound(tap_id=t_f['tap_service_id'])
+            if t_f['tenant_id'] != ts['tenant_id']:
+                raise taas_exc.TapServiceNotBelongToTenant()
+
+        ports = self.get_ports_details(
+            context, {t_f['source_port'] for t_f in t_fs})
+        for t_f in t_fs:
+            if t_f['source_port'] not in ports:
+                raise n_exc.PortNotFound(port_id=t_f['source_port'])
+
+        # create tap flows in the db model
+        tfs = []
+        for tap_flow in tap_flows['tap_flows']:
+            tfs.append(super().create_tap_flow(
+                context, tap_flow,
+                source_vlans=common_utils.get_port_source_vlans(
+                    ports[tap_flow['tap_flow']['source_port']])))
+        driver_contexts = [sd_context.TapFlowContext(self, context, tf)
+                           for tf in tfs]
+        self.driver.create_tap_flows_precommit(driver_contexts)
+
+        self.driver.create_tap_flows_postcommit(driver_contexts)
+        return tfs
+
     @db_api.CONTEXT_WRITER
     def delete_tap_flow(self, context, id):
         LOG.debug("delete_tap_flow() called")
@@ -170,6 +224,66 @@ class TaasPlugin(taas_db.Taas_db_Mixin):
 
         method(driver_context)
 
+    @db_api.CONTEXT_WRITER
+    def delete_tap_flows(self, context, ids):
+        LOG.debug("delete_tap_flows() called")
+
+        if not ids:
+            return
+        tfs = self.get_tap_flows(context, filters={'id': ids})
+
+        active_tfs = [tf for tf in tfs if tf['status'] == constants.ACTIVE]
+        inactive_tfs = [tf for tf in tfs if tf['status'] != constants.ACTIVE]
+        if active_tfs:
+            super().update_tap_flows_status(
+                context, [tf['id'] for tf in active_tfs],
+                constants.PENDING_DELETE)
+            for tf in active_tfs:
+                tf['status'] = constants.PENDING_DELETE
+            self.driver.delete_tap_flows_precommit(
+                [sd_context.TapFlowContext(self, context, tf)
+                 for tf in active_tfs])
+
+        if inactive_tfs:
+            super().delete_tap_flows(context,
+                                     [tf['id'] for tf in inactive_tfs])
+            self.driver.delete_tap_flows_postcommit(
+                [sd_context.TapFlowContext(self, context, tf)
+                 for tf in inactive_tfs])
+
+    @registry.receives(resources.AGENT, [events.AFTER_DELETE])
+    def handle_delete_agent(self, resource, event, trigger, payload):
+        agent = payload.latest_state
+        driver_type = taas_consts.AGENT_TYPE_DRIVER_TYPES.get(
+            agent['agent_type'])
+        if driver_type is None:
+            return
+
+        LOG.info("TaaS: Handle Delete Agent: %(type)s agent of host %(host)s",
+                 {'type': driver_type, 'host': agent['host']})
+        self.delete_agent_rpc_version(payload.context, agent['host'],
+                                      driver_type)
+
+    @registry.receives(resources.PORT, [events.AFTER_UPDATE])
+    def handle_update_port(self, resource, event, trigger, payload):
+        if len(payload.states) < 2:
+            return
+        original_port, port = payload.states[0], payload.latest_state
+        source_vlans = common_utils.get_port_source_vlans(port)
+        if source_vlans == common_utils.get_port_source_vlans(original_port):
+            return
+
+        # Most ports are not mirrored, only take the write lock for the
+        # source ports of tap flows.
+        context = payload.context
+        if not self.is_tap_flow_source_port(context, payload.resource_id):
+            return
+        LOG.debug("TaaS: Handle Update Port: source VLANs of port %(port)s "
+                  "changed to %(vlans)s",
+                  {'port': payload.resource_id, 'vlans': source_vlans})
+        self.update_tap_flows_source_vlans(context, payload.resource_id,
+                                           source_vlans)
+
     @registry.receives(resources.PORT, [events.PRECOMMIT_DELETE])
     def handle_delete_port(self, resource, event, trigger, payload):
         context = payload.context
@@ -196,8 +310,4 @@ class TaasPlugin(taas_db.Taas_db_Mixin):
             context,
             filters={'source_port': [deleted_port_id]}, fields=['id'])
 
-        for t_f in t_f_collection:
-            try:
-                self.delete_tap_flow(context, t_f['id'])
-            except taas_exc.TapFlowNotFound:
-                LOG.debug("Not found tap_flow: %s", t_f['id'])
+        self.delete_tap_flows(context, [t_f['id'] for t_f in t_f_collection])
@@ -18,6 +18,7 @@ from neutron_lib.api.definitions import tap_mirror as t_m_api_def
 from neutron_lib.callbacks import events
 from neutron_lib.callbacks import registry
 from neutron_lib.callbacks import resources
+from neutron_lib import constants
 from neutron_lib.db import api as db_api
 from neutron_lib import exceptions as n_exc
 from neutron_lib.exceptions import taas as taas_exc
@@ -28,6 +29,7 @@ from oslo_utils import excutils
 from neutron_taas.common import constants as taas_consts
 from neutron_taas.db import tap_mirror_db
 from neutron_taas.extensions import tap_mirror_both_direction as t_m_b_api_def
+from neutron_taas.extensions import tap_mirror_status as t_m_s_api_def
 from neutron_taas.services.taas.service_drivers import (service_driver_context
                                                         as sd_context)
 
@@ -39,6 +41,7 @@ class TapMirrorPlugin(tap_mirror_db.Taas_mirror_db_mixin):
 
     supported_extension_aliases = [t_m_api_def.ALIAS,
                                    t_m_b_api_def.ALIAS,
+                                   t_m_s_api_def.ALIAS,
                                    ]
 
     path_prefix = "/taas"
@@ -70,6 +73,12 @@ class TapMirrorPlugin(tap_mirror_db.Taas_mirror_db_mixin):
         raise n_exc.Invalid("Error retrieving driver for provider %s" %
                             provider)
 
+    def ovn_maintenance_periodics(self, ovn_client):
+        """Periodic tasks run by the ML2/OVN maintenance worker."""
+        get_periodics = getattr(self.driver, 'ovn_maintenance_periodics',
+                                None)
+        return get_periodics(ovn_client) if get_periodics else []
+
     @log_helpers.log_method_call
     def create_tap_mirror(self, context, tap_mirror):
         t_m = tap_mirror['tap_mirror']
@@ -91,28 +100,25 @@ class TapMirrorPlugin(tap_mirror_db.Taas_mirror_db_mixin):
                 # port that is not bound?
 
         with db_api.CONTEXT_WRITER.using(context):
-            self._validate_tap_tunnel_id(context, t_m['directions'])
+            # The tunnel ids are checked by the unique constraint of the
+            # tap_mirror_tunnel_ids table.
             tm = super().create_tap_mirror(context, tap_mirror)
-            # Precommit phase, is it necessary? tunnel id check should be in
-            # it....
+            # Precommit phase
             driver_context = sd_context.TapMirrorContext(self, context, tm)
             self.driver.create_tap_mirror_precommit(driver_context)
 
-            # Postcommit phase, do the backend stuff, or fail.
-            try:
-                self.driver.create_tap_mirror_postcommit(driver_context)
-            except Exception:
-                pass
+        # Postcommit phase, the backend reports the result asynchronously
+        # with the status of the tap mirror.
+        try:
+            self.driver.create_tap_mirror_postcommit(driver_context)
+        except Exception:
+            LOG.exception("Failed to create Tap Mirror on driver. "
+                          "tap_mirror: %s", tm['id'])
+            self.update_tap_mirrors_status(context, [tm['id']],
+                                           constants.ERROR)
+            tm['status'] = constants.ERROR
         return tm
 
-    def _validate_tap_tunnel_id(self, context, mirror_directions):
-        mirrors = self.get_tap_mirrors(context)
-        for mirror in mirrors:
-            for direction, tunnel_id in mirror['directions'].items():
-                if tunnel_id in mirror_directions.values():
-                    raise taas_exc.TapMirrorTunnelConflict(
-                        tunnel_id=tunnel_id)
-
     @log_helpers.log_method_call
     def delete_tap_mirror(self, context, id):
         with db_api.CONTEXT_WRITER.using(context):
@@ -13,11 +13,20 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from unittest import mock
+
+import netaddr
+from neutron.objects import network as network_obj
+from neutron.objects import ports as port_obj
 from neutron.tests.unit import testlib_api
 
+from neutron_lib import constants
 from neutron_lib import context
 from neutron_lib.exceptions import taas as taas_exc
+from neutron_lib.utils import net as net_utils
 
+from oslo_config import cfg
+from oslo_db import exception as db_exc
 from oslo_utils import importutils
 from oslo_utils import uuidutils
 
@@ -85,6 +94,12 @@ class TaaSDbTestCase(testlib_api.SqlTestCase):
         with self.ctx.session.begin():
             return self.mixin.delete_tap_service(self.ctx, tap_service_id)
 
+    def _create_tap_id_association(self, tap_service_id):
+        """Helper method to allocate a taas id to a tap service."""
+        with self.ctx.session.begin():
+            return self.mixin.create_tap_id_association(self.ctx,
+                                                        tap_service_id)
+
     def _get_tap_flow(self, tap_flow_id):
         """Helper method to retrieve tap flow."""
         with self.ctx.session.begin():
@@ -95,10 +110,11 @@ class TaaSDbTestCase(testlib_api.SqlTestCase):
         with self.ctx.session.begin():
             return self.mixin.get_tap_flows(self.ctx)
 
-    def _create_tap_flow(self, tap_flow):
+    def _create_tap_flow(self, tap_flow, source_vlans=None):
         """Helper method to create tap flow."""
         with self.ctx.session.begin():
-            return self.mixin.create_tap_flow(self.ctx, tap_flow)
+            return self.mixin.create_tap_flow(self.ctx, tap_flow,
+                                              source_vlans=source_vlans)
 
     def _update_tap_flow(self, tap_flow_id, tap_flow):
         """Helper method to update tap flow."""
@@ -110,6 +126,23 @@ class TaaSDbTestCase(testlib_api.SqlTestCase):
         with self.ctx.session.begin():
             return self.mixin.delete_tap_flow(self.ctx, tap_flow_id)
 
+    def _create_bound_port(self, host, status=constants.ACTIVE):
+        """Helper method to create a port bound to a host."""
+        if not hasattr(self, '_network'):
+            self._network = network_obj.Network(self.ctx)
+            self._network.create()
+        port = port_obj.Port(
+            self.ctx, network_id=self._network.id,
+            mac_address=netaddr.EUI(net_utils.get_random_mac(
+                'fa:16:3e:00:00:00'.split(':'))),
+            admin_state_up=True, status=constants.PORT_STATUS_ACTIVE,
+            device_id='', device_owner='')
+        port.create()
+        port_obj.PortBinding(self.ctx, port_id=port.id, host=host,
+                             vif_type='ovs', vnic_type='normal',
+                             status=status).create()
+        return port.id
+
     def test_tap_service_get(self):
         """Test to retrieve a tap service from the database."""
         name = 'test-tap-service'
@@ -228,3 +261,225 @@ class TaaSDbTestCase(testlib_api.SqlTestCase):
         self._delete_tap_flow(tf['id'])
         self.assertRaises(taas_exc.TapFlowNotFound,
                           self._get_tap_flow, tf['id'])
+
+    def test_get_tap_service_flows_vlans(self):
+        """Test to retrieve the VLANs of the tap flows of a tap service."""
+        ts = self._create_tap_service(self._get_tap_service_data())
+        legacy_port = _uuid()
+        tfs = [
+            self._create_tap_flow(self._get_tap_flow_data(
+                tap_service_id=ts['id'], vlan_filter='9-18'), '20'),
+            self._create_tap_flow(self._get_tap_flow_data(
+                tap_service_id=ts['id'], vlan_filter='9-18'), '20'),
+            self._create_tap_flow(self._get_tap_flow_data(
+                tap_service_id=ts['id'], source_port=legacy_port)),
+            self._create_tap_flow(self._get_tap_flow_data(
+                tap_service_id=ts['id']), '30'),
+        ]
+        self.mixin.update_tap_flows_status(
+            self.ctx, [tf['id'] for tf in tfs[:3]], constants.ACTIVE)
+
+        self.assertCountEqual(
+            [(None, '20', '9-18'), (legacy_port, None, None)],
+            self.mixin.get_tap_service_flows_vlans(self.ctx, ts['id']))
+
+    def test_update_tap_flows_source_vlans(self):
+        """Test to update the source VLANs of the tap flows of a port."""
+        ts = self._create_tap_service(self._get_tap_service_data())
+        tf_data = self._get_tap_flow_data(tap_service_id=ts['id'])
+        tf = self._create_tap_flow(tf_data, '20')
+        self.mixin.update_tap_flows_status(self.ctx, [tf['id']],
+                                           constants.ACTIVE)
+        source_port = tf_data['tap_flow']['source_port']
+
+        self.assertTrue(
+            self.mixin.is_tap_flow_source_port(self.ctx, source_port))
+        self.assertFalse(
+            self.mixin.is_tap_flow_source_port(self.ctx, _uuid()))
+        self.mixin.update_tap_flows_source_vlans(self.ctx, source_port, '30')
+
+        self.assertEqual(
+            [(None, '30', None)],
+            self.mixin.get_tap_service_flows_vlans(self.ctx, ts['id']))
+
+    def test_agent_rpc_version(self):
+        """Test to record the RPC version of the TaaS agents."""
+        self.assertIsNone(
+            self.mixin.get_agent_rpc_version(self.ctx, 'host-A', 'ovs'))
+
+        self.mixin.update_agent_rpc_version(self.ctx, 'host-A',
+                                            ['ovs', 'sriov'], '1.0')
+        self.mixin.update_agent_rpc_version(self.ctx, 'host-A', ['ovs'],
+                                            '1.1')
+
+        self.assertEqual(
+            '1.1', self.mixin.get_agent_rpc_version(self.ctx, 'host-A', 'ovs'))
+        self.assertEqual(
+            '1.0',
+            self.mixin.get_agent_rpc_version(self.ctx, 'host-A', 'sriov'))
+
+        self.mixin.delete_agent_rpc_version(self.ctx, 'host-A', 'ovs')
+
+        self.assertIsNone(
+            self.mixin.get_agent_rpc_version(self.ctx, 'host-A', 'ovs'))
+        self.assertEqual(
+            '1.0',
+            self.mixin.get_agent_rpc_version(self.ctx, 'host-A', 'sriov'))
+
+    def test_tap_id_association_create(self):
+        """Test to allocate taas ids to tap services."""
+        cfg.CONF.set_override("vlan_range_start", 10, group="taas")
+        cfg.CONF.set_override("vlan_range_end", 13, group="taas")
+        ts_ids = [self._create_tap_service(
+            self._get_tap_service_data(name='ts-%d' % i))['id']
+            for i in range(4)]
+
+        taas_ids = {self._create_tap_id_association(ts_id)['taas_id']
+                    for ts_id in ts_ids[:3]}
+        self.assertEqual({10, 11, 12}, taas_ids)
+        self.assertRaises(taas_exc.TapServiceLimitReached,
+                          self._create_tap_id_association, ts_ids[3])
+        with self.ctx.session.begin():
+            self.assertEqual(
+                3, self.ctx.session.query(taas_db.TapIdAssociation).count())
+
+    def test_tap_id_association_create_concurrently_taken(self):
+        """Test that a request is retried if its candidates are taken."""
+        ts_1 = self._create_tap_service(self._get_tap_service_data())
+        ts_2 = self._create_tap_service(self._get_tap_service_data())
+        taas_id = self._create_tap_id_association(ts_1['id'])['taas_id']
+
+        with mock.patch.object(self.mixin, '_get_free_taas_ids',
+                               return_value=[taas_id]), \
+                self.ctx.session.begin():
+            self.assertRaises(db_exc.RetryRequest,
+                              self.mixin._allocate_taas_id_with_tap_service_id,
+                              self.ctx, ts_2['id'])
+
+    def _enable_port_details_cache(self):
+        cfg.CONF.set_override('port_details_cache_ttl', 2.0, 'taas')
+        self.addCleanup(cfg.CONF.clear_override, 'port_details_cache_ttl',
+                        'taas')
+
+    def test_get_port_details_cached(self):
+        self._enable_port_details_cache()
+        core_plugin = mock.Mock()
+        core_plugin.get_port.return_value = {'id': 'port-1', 'tag': 1}
+        core_plugin.get_ports.return_value = [{'id': 'port-2'}]
+
+        with mock.patch.object(self.mixin, '_core_plugin',
+                               return_value=core_plugin):
+            port = self.mixin.get_port_details(self.ctx, 'port-1')
+            port['tag'] = 2
+            self.assertEqual({'id': 'port-1', 'tag': 1},
+                             self.mixin.get_port_details(self.ctx, 'port-1'))
+            self.assertEqual(
+                {'port-1': {'id': 'port-1', 'tag': 1},
+                 'port-2': {'id': 'port-2'}},
+                self.mixin.get_ports_details(self.ctx, ['port-1', 'port-2']))
+
+            self.mixin._invalidate_port_details(
+                'port', 'after_update', None,
+                mock.Mock(resource_id='port-1'))
+            self.mixin.get_port_details(self.ctx, 'port-1')
+
+        self.assertEqual(2, core_plugin.get_port.call_count)
+        core_plugin.get_ports.assert_called_once_with(
+            self.ctx, filters={'id': ['port-2']})
+
+    def test_get_port_details_cached_per_context_scope(self):
+        self._enable_port_details_cache()
+        core_plugin = mock.Mock()
+        core_plugin.get_port.return_value = {'id': 'port-1'}
+        project_ctx = context.Context(user_id='user-1',
+                                      project_id='project-1')
+        other_project_ctx = context.Context(user_id='user-2',
+                                            project_id='project-2')
+
+        with mock.patch.object(self.mixin, '_core_plugin',
+                               return_value=core_plugin):
+            self.mixin.get_port_details(self.ctx, 'port-1')
+            self.mixin.get_port_details(project_ctx, 'port-1')
+            self.mixin.get_port_details(other_project_ctx, 'port-1')
+            self.mixin.get_port_details(project_ctx.elevated(), 'port-1')
+            self.mixin.get_port_details(project_ctx, 'port-1')
+
+        self.assertEqual(
+            [mock.call(self.ctx, 'port-1'),
+             mock.call(project_ctx, 'port-1'),
+             mock.call(other_project_ctx, 'port-1'),
+             mock.call(mock.ANY, 'port-1')],
+            core_plugin.get_port.call_args_list)
+
+    def test_get_port_details_cache_disabled(self):
+        # The cache is disabled by default.
+        core_plugin = mock.Mock()
+        core_plugin.get_port.return_value = {'id': 'port-1'}
+
+        with mock.patch.object(self.mixin, '_core_plugin',
+                               return_value=core_plugin):
+            self.mixin.get_port_details(self.ctx, 'port-1')
+            self.mixin.get_port_details(self.ctx, 'port-1')
+
+        self.assertEqual(2, core_plugin.get_port.call_count)
+
+    def test_supports_skip_locked(self):
+        for name, is_mariadb, version, expected in (
+                ('sqlite', False, (3, 40), False),
+                ('postgresql', False, (9, 6), True),
+                ('mysql', False, (5, 7, 44), False),
+                ('mysql', False, (8, 0, 36), True),
+                ('mysql', True, (10, 5, 2), False),
+                ('mariadb', True, (10, 11, 6), True)):
+            session = mock.Mock()
+            dialect = session.get_bind.return_value.dialect
+            dialect.name = name
+            dialect.is_mariadb = is_mariadb
+            dialect.server_version_info = version
+            self.assertEqual(expected, taas_db._supports_skip_locked(session),
+                             (name, version))
+
+    def test_get_active_tap_resources_by_host(self):
+        """Test to retrieve the active tap resources of a host."""
+        ts_port = self._create_bound_port('host-A')
+        remote_ts_port = self._create_bound_port('host-B')
+        src_port = self._create_bound_port('host-A')
+        remote_src_port = self._create_bound_port('host-B')
+        inactive_src_port = self._create_bound_port(
+            'host-A', status=constants.INACTIVE)
+
+        ts = self._create_tap_service(
+            self._get_tap_service_data(port_id=ts_port))
+        remote_ts = self._create_tap_service(
+            self._get_tap_service_data(port_id=remote_ts_port))
+        down_ts = self._create_tap_service(
+            self._get_tap_service_data(port_id=ts_port))
+        tfs = {}
+        for name, ts_id, source_port in (
+                ('local', ts['id'], src_port),
+                ('remote-ts', remote_ts['id'], src_port),
+                ('remote-src', ts['id'], remote_src_port),
+                ('inactive-binding', ts['id'], inactive_src_port),
+                ('down-ts', down_ts['id'], src_port)):
+            tfs[name] = self._create_tap_flow(self._get_tap_flow_data(
+                ts_id, name=name, source_port=source_port))
+        for ts_id in (ts['id'], remote_ts['id'], down_ts['id']):
+            self._create_tap_id_association(ts_id)
+        with self.ctx.session.begin():
+            self.mixin.update_tap_flows_status(
+                self.ctx, [tf['id'] for tf in tfs.values()], constants.ACTIVE)
+        for ts_id in (ts['id'], remote_ts['id']):
+            self._update_tap_service(
+                ts_id, {'tap_service': {'status': constants.ACTIVE}})
+
+        with self.ctx.session.begin():
+            tap_services, tap_flows = (
+                self.mixin.get_active_tap_resources_by_host(self.ctx,
+                                                            'host-A'))
+
+        self.assertEqual([ts['id']], [t_s['id'] for t_s, _ in tap_services])
+        self.assertEqual(
+            sorted([(tfs['local']['id'], ts_port),
+                    (tfs['remote-ts']['id'], remote_ts_port)]),
+            sorted((t_f['id'], ts_port_id)
+                   for t_f, ts_port_id, _taas_id in tap_flows))
@@ -10,10 +10,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import netaddr
+from neutron.objects import network as network_obj
+from neutron.objects import ports as port_obj
 from neutron.tests.unit import testlib_api
 
+from neutron_lib import constants
 from neutron_lib import context
 from neutron_lib.exceptions import taas as taas_exc
+from neutron_lib.utils import net as net_utils
 
 from oslo_utils import importutils
 from oslo_utils import uuidutils
@@ -37,9 +42,10 @@ class TapMirrorDbTestCase(testlib_api.SqlTestCase):
         self.project_id = 'fake-project-id'
 
     def _get_tap_mirror_data(self, name='tm-1', port_id=None,
-                             directions='{"IN": "99"}', remote_ip='10.99.8.3',
+                             directions=None, remote_ip='10.99.8.3',
                              mirror_type='erspanv1'):
         port_id = port_id or _uuid()
+        directions = directions or {'IN': 99}
         return {"tap_mirror": {"name": name,
                                "project_id": self.project_id,
                                "description": "test tap mirror",
@@ -77,6 +83,23 @@ class TapMirrorDbTestCase(testlib_api.SqlTestCase):
         with self.ctx.session.begin():
             return self.db_mixin.delete_tap_mirror(self.ctx, tap_mirror_id)
 
+    def _create_bound_port(self, host, status=constants.ACTIVE):
+        """Helper method to create a port bound to a host."""
+        if not hasattr(self, '_network'):
+            self._network = network_obj.Network(self.ctx)
+            self._network.create()
+        port = port_obj.Port(
+            self.ctx, network_id=self._network.id,
+            mac_address=netaddr.EUI(net_utils.get_random_mac(
+                'fa:16:3e:00:00:00'.split(':'))),
+            admin_state_up=True, status=constants.PORT_STATUS_ACTIVE,
+            device_id='', device_owner='')
+        port.create()
+        port_obj.PortBinding(self.ctx, port_id=port.id, host=host,
+                             vif_type='ovs', vnic_type='normal',
+                             status=status).create()
+        return port.id
+
     def test_tap_mirror_get(self):
         name = 'test-tap-mirror'
         data = self._get_tap_mirror_data(name=name)
@@ -96,7 +119,8 @@ class TapMirrorDbTestCase(testlib_api.SqlTestCase):
         name_1 = "tm-1"
         data_1 = self._get_tap_mirror_data(name=name_1)
         name_2 = "tm-2"
-        data_2 = self._get_tap_mirror_data(name=name_2)
+        data_2 = self._get_tap_mirror_data(name=name_2,
+                                           directions={'IN': 100})
         self._create_tap_mirror(data_1)
         self._create_tap_mirror(data_2)
         tap_mirrors = self._get_tap_mirrors()
@@ -107,7 +131,7 @@ class TapMirrorDbTestCase(testlib_api.SqlTestCase):
         updated_name = "tm-1-got-updated"
         data = self._get_tap_mirror_data(name=original_name)
         tm = self._create_tap_mirror(data)
-        updated_data = self._get_tap_mirror_data(name=updated_name)
+        updated_data = {'tap_mirror': {'name': updated_name}}
         tm_updated = self._update_tap_mirror(tm['id'], updated_data)
         self.assertEqual(updated_name, tm_updated['name'])
 
@@ -117,3 +141,65 @@ class TapMirrorDbTestCase(testlib_api.SqlTestCase):
         self._delete_tap_mirror(result['id'])
         self.assertRaises(taas_exc.TapMirrorNotFound,
                           self._get_tap_mirror, result['id'])
+
+    def test_tap_mirror_create_tunnel_ids(self):
+        data = self._get_tap_mirror_data(directions={'IN': 101, 'OUT': 102})
+        result = self._create_tap_mirror(data)
+
+        with self.ctx.session.begin():
+            tunnel_ids = self.ctx.session.query(
+                tap_mirror_db.TapMirrorTunnelId).all()
+        self.assertEqual(
+            {('IN', 101), ('OUT', 102)},
+            {(row.direction, row.tunnel_id) for row in tunnel_ids})
+        self.assertEqual({result['id']},
+                         {row.tap_mirror_id for row in tunnel_ids})
+
+    def test_tap_mirror_create_tunnel_id_conflict(self):
+        self._create_tap_mirror(self._get_tap_mirror_data(
+            directions={'IN': 101}))
+
+        self.assertRaises(taas_exc.TapMirrorTunnelConflict,
+                          self._create_tap_mirror,
+                          self._get_tap_mirror_data(
+                              directions={'OUT': 102, 'BOTH': 101}))
+        self.assertEqual(1, len(self._get_tap_mirrors()))
+
+    def test_tap_mirror_create_tunnel_id_used_twice(self):
+        self.assertRaises(taas_exc.TapMirrorTunnelConflict,
+                          self._create_tap_mirror,
+                          self._get_tap_mirror_data(
+                              directions={'IN': 101, 'OUT': 101}))
+
+    def test_tap_mirror_delete_tunnel_ids(self):
+        result = self._create_tap_mirror(self._get_tap_mirror_data())
+        self._delete_tap_mirror(result['id'])
+
+        with self.ctx.session.begin():
+            self.assertEqual([], self.ctx.session.query(
+                tap_mirror_db.TapMirrorTunnelId).all())
+        # The tunnel id can be used again.
+        self._create_tap_mirror(self._get_tap_mirror_data())
+
+    def test_get_active_tap_mirrors_by_host(self):
+        local_port = self._create_bound_port('host-A')
+        remote_port = self._create_bound_port('host-B')
+        inactive_port = self._create_bound_port('host-A',
+                                                status=constants.INACTIVE)
+        tms = {}
+        for name, port_id, tunnel_id in (('local', local_port, 101),
+                                         ('remote', remote_port, 102),
+                                         ('inactive', inactive_port, 103),
+                                         ('pending', local_port, 104)):
+            tms[name] = self._create_tap_mirror(self._get_tap_mirror_data(
+                name=name, port_id=port_id, directions={'IN': tunnel_id}))
+        with self.ctx.session.begin():
+            self.db_mixin.update_tap_mirrors_status(
+                self.ctx, [tms[name]['id'] for name in
+                           ('local', 'remote', 'inactive')],
+                constants.ACTIVE)
+
+        self.assertEqual(
+            [tms['local']['id']],
+            [tm['id'] for tm in self.db_mixin.get_active_tap_mirrors_by_host(
+                self.ctx, 'host-A')])
@@ -0,0 +1,229 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+from neutron.agent.common import ovs_lib
+from neutron_lib.plugins.ml2 import ovs_constants as n_ovs_consts
+from os_ken.ofproto import ofproto_v1_3 as ofp
+from os_ken.ofproto import ofproto_v1_3_parser as ofpp
+from oslo_config import cfg
+
+import neutron_taas.services.taas.drivers.linux.ovs_constants \
+    as taas_ovs_consts
+from neutron_taas.services.taas.drivers.linux import ovs_flows_native
+from neutron_taas.services.taas.drivers.linux import ovs_taas
+from neutron_taas.tests import base
+
+PORT_MAC = 'fa:16:3e:5c:67:6a'
+TAAS_ID = 4321
+
+
+class TestTaasNativeFlows(base.TaasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.flows = ovs_flows_native.TaasNativeFlows()
+        self.dp = mock.Mock()
+        self.br = mock.Mock(spec=ovs_flows_native.TapBridge)
+        self.br._get_dp.return_value = (self.dp, ofp, ofpp)
+
+    @staticmethod
+    def _str_actions(actions):
+        # os-ken actions have no __eq__, compare their string forms
+        return [str(action) for action in actions]
+
+    def _get_flows(self, **match):
+        return [call for call in self.br.install_apply_actions.mock_calls
+                if all(call.kwargs.get(k) == v for k, v in match.items())]
+
+    def test_deferred(self):
+        self.assertEqual(self.br.bundled.return_value,
+                         self.flows.deferred(self.br))
+        self.br.bundled.assert_called_once_with(atomic=True, ordered=True)
+
+    def test_bundled_bridge_datapath(self):
+        bundle = mock.Mock(spec=['br', 'install_apply_actions'],
+                           br=self.br)
+
+        self.flows.install_tap_mirror(bundle, PORT_MAC, 9)
+
+        self.br._get_dp.assert_called_once_with()
+        self.assertEqual(2, bundle.install_apply_actions.call_count)
+
+    def test_get_flow_cookies(self):
+        self.br.dump_flows.return_value = [mock.Mock(cookie=1),
+                                           mock.Mock(cookie=2),
+                                           mock.Mock(cookie=1)]
+
+        self.assertEqual({1, 2}, self.flows.get_flow_cookies(self.br, 30))
+        self.br.dump_flows.assert_called_once_with(30)
+
+    def test_delete_flows_by_cookie(self):
+        self.flows.delete_flows_by_cookie(self.br, 30, 0xabcd)
+
+        self.br.uninstall_flows.assert_called_once_with(
+            table_id=30, cookie=0xabcd, cookie_mask=ovs_lib.UINT64_BITMASK)
+
+    def test_setup_tap_br_flows(self):
+        self.flows.setup_tap_br_flows(self.br, 5, 6)
+
+        self.br.install_apply_actions.assert_has_calls([
+            mock.call(table_id=0, priority=1, in_port=5, actions=mock.ANY),
+            mock.call(table_id=0, priority=1, in_port=6, actions=mock.ANY),
+            mock.call(table_id=taas_ovs_consts.TAAS_RECV_LOC, priority=0,
+                      actions=mock.ANY),
+        ])
+        self.assertEqual(
+            self._str_actions([ofpp.OFPActionOutput(6, 0)]),
+            self._str_actions(self._get_flows(
+                table_id=taas_ovs_consts.TAAS_RECV_LOC)[0].kwargs['actions']))
+        self.br.install_drop.assert_has_calls([
+            mock.call(table_id=0, priority=0),
+            mock.call(table_id=taas_ovs_consts.TAAS_RECV_REM, priority=0),
+        ])
+
+    def test_update_tunnel_flood_flow(self):
+        self.flows.update_tunnel_flood_flow(self.br, [3, 4])
+
+        self.br.install_apply_actions.assert_called_once_with(
+            table_id=taas_ovs_consts.TAAS_SEND_FLOOD, priority=0,
+            actions=mock.ANY)
+        actions = self.br.install_apply_actions.call_args.kwargs['actions']
+        self.assertEqual([3, 4], [action.port for action in actions[2:]])
+
+    def test_update_tunnel_flood_flow_no_tunnel(self):
+        self.flows.update_tunnel_flood_flow(self.br, [])
+
+        self.br.install_apply_actions.assert_not_called()
+
+    def test_install_tap_service(self):
+        self.flows.install_tap_service(self.br, self.br, self.br, TAAS_ID,
+                                       port_vlan_id=3, ovs_port_id=7,
+                                       patch_int_tap_id=8,
+                                       patch_tap_int_id=9)
+
+        flow, = self._get_flows(table_id=0, priority=25, in_port=8,
+                                vlan_vid=TAAS_ID | ofp.OFPVID_PRESENT)
+        self.assertEqual(
+            self._str_actions([
+                ofpp.OFPActionSetField(vlan_vid=3 | ofp.OFPVID_PRESENT),
+                ofpp.OFPActionOutput(7, 0)]),
+            self._str_actions(flow.kwargs['actions']))
+        for tunnel_type in n_ovs_consts.TUNNEL_NETWORK_TYPES:
+            self.assertEqual(1, len(self._get_flows(
+                table_id=n_ovs_consts.TUN_TABLE[tunnel_type],
+                tunnel_id=TAAS_ID)))
+        self.assertEqual(1, len(self._get_flows(
+            table_id=taas_ovs_consts.TAAS_DST_CHECK, tunnel_id=TAAS_ID)))
+
+    def test_remove_tap_service_no_tunnel(self):
+        self.flows.remove_tap_service(self.br, self.br, None, TAAS_ID, 8)
+
+        self.br.uninstall_flows.assert_has_calls([
+            mock.call(table_id=0, in_port=8,
+                      vlan_vid=TAAS_ID | ofp.OFPVID_PRESENT),
+            mock.call(table_id=taas_ovs_consts.TAAS_RECV_LOC,
+                      vlan_vid=TAAS_ID | ofp.OFPVID_PRESENT),
+            mock.call(table_id=taas_ovs_consts.TAAS_RECV_REM,
+                      vlan_vid=TAAS_ID | ofp.OFPVID_PRESENT),
+        ])
+        self.assertEqual(3, self.br.uninstall_flows.call_count)
+
+    def test_install_tap_flow_in_tags_both_cases(self):
+        self.flows.install_tap_flow(self.br, None, TAAS_ID, 'IN', 7,
+                                    PORT_MAC, 8)
+
+        tagged, untagged = self._get_flows(table_id=0, eth_dst=PORT_MAC)
+        self.assertEqual((ofp.OFPVID_PRESENT, ofp.OFPVID_PRESENT),
+                         tagged.kwargs['vlan_vid'])
+        self.assertNotIn(str(ofpp.OFPActionPushVlan()),
+                         self._str_actions(tagged.kwargs['actions']))
+        self.assertEqual(ofp.OFPVID_NONE, untagged.kwargs['vlan_vid'])
+        self.assertIn(str(ofpp.OFPActionPushVlan()),
+                      self._str_actions(untagged.kwargs['actions']))
+
+    def test_install_tap_flow_vlan_network(self):
+        self.flows.install_tap_flow(self.br, None, TAAS_ID, 'IN', 7,
+                                    PORT_MAC, 8, physical_network='phys',
+                                    network_type='vlan')
+
+        self.br.install_apply_actions.assert_called_once_with(
+            table_id=0, priority=20, eth_dst=PORT_MAC, actions=mock.ANY)
+        self.assertEqual(
+            self._str_actions([
+                ofpp.OFPActionPopVlan(),
+                ofpp.OFPActionOutput(7, 0),
+                ofpp.OFPActionPushVlan(),
+                ofpp.OFPActionSetField(vlan_vid=TAAS_ID | ofp.OFPVID_PRESENT),
+                ofpp.OFPActionOutput(8, 0)]),
+            self._str_actions(
+                self.br.install_apply_actions.call_args.kwargs['actions']))
+
+    def test_install_tap_flow_out(self):
+        self.flows.install_tap_flow(self.br, self.br, TAAS_ID, 'OUT', 7,
+                                    PORT_MAC, 8)
+
+        self.assertEqual(1, len(self._get_flows(table_id=0, in_port=7)))
+        self.assertEqual(1, len(self._get_flows(
+            table_id=taas_ovs_consts.TAAS_SRC_CHECK, tunnel_id=TAAS_ID)))
+
+    def test_remove_tap_flow(self):
+        self.flows.remove_tap_flow(self.br, 'BOTH', 7, PORT_MAC)
+
+        self.br.uninstall_flows.assert_has_calls([
+            mock.call(table_id=0, in_port=7),
+            mock.call(table_id=0, eth_dst=PORT_MAC),
+        ])
+
+    def test_remove_tap_mirror(self):
+        self.flows.remove_tap_mirror(self.br, self.br, {'OUT': 102},
+                                     PORT_MAC, 7)
+
+        self.br.uninstall_flows.assert_has_calls([
+            mock.call(table_id=taas_ovs_consts.TAAS_RECV_REM,
+                      eth_dst=PORT_MAC),
+            mock.call(table_id=taas_ovs_consts.TAAS_RECV_LOC,
+                      eth_dst=PORT_MAC),
+            mock.call(table_id=0, in_port=7),
+            mock.call(table_id=taas_ovs_consts.TAAS_RECV_LOC,
+                      eth_src=PORT_MAC),
+        ])
+
+
+class TestOvsDriverTaasNative(base.TaasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cfg.CONF.set_override('taas_of_interface', 'native')
+        self.addCleanup(cfg.CONF.clear_override, 'taas_of_interface')
+
+    @mock.patch.object(ovs_flows_native, 'TapBridge')
+    def test_initialize(self, mock_tap_br):
+        tap_br = mock_tap_br.return_value
+        tap_br.default_cookie = 1
+        tap_br._get_dp.return_value = (mock.Mock(), ofp, ofpp)
+        tap_br.bundled.return_value.__enter__.return_value.br = tap_br
+        obj = ovs_taas.OvsTaasDriver()
+        obj.tunnel_types = []
+        obj.agent_api = mock.MagicMock()
+        int_br = obj.agent_api.request_int_br.return_value
+
+        obj.initialize()
+
+        self.assertIsInstance(obj.flows, ovs_flows_native.TaasNativeFlows)
+        mock_tap_br.assert_called_once_with(
+            'br-tap', os_ken_app=int_br._app, datapath_type=mock.ANY)
+        tap_br.set_secure_mode.assert_called_once_with()
+        tap_br.setup_controllers.assert_called_once_with(cfg.CONF)
+        tap_br.bundled.assert_called_once_with(atomic=True, ordered=True)
+        tap_br.add_flow.assert_not_called()
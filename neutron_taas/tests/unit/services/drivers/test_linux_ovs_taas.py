@@ -33,6 +33,7 @@ class FakeBridge(object):
 
     def __init__(self, br_name):
         self.br_name = br_name
+        self.ovsdb = mock.Mock()
 
     def add_patch_port(self, local_name, remote_name):
         pass
@@ -59,22 +60,34 @@ class FakeBridge(object):
     def get_port_tag_dict(self):
         return base.FAKE_PORT_DICT
 
+    def db_get_val(self, table, record, column):
+        return base.FAKE_PORT_DICT[record]
+
+    def get_ports_attributes(self, table, columns=None, ports=None,
+                             check_error=True, log_errors=True,
+                             if_exists=False):
+        return []
+
+    def deferred(self, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
 
 class TestOvsDriverTaas(base.TaasTestCase):
 
     def setUp(self):
         super(TestOvsDriverTaas, self).setUp()
 
-    def _create_tun_flood_flow(self):
-        return ''
-
     def _init_taas_driver(self, mock_ovs_ext_api, mock_tap_ext):
         obj = ovs_taas.OvsTaasDriver()
         obj.agent_api = mock_ovs_ext_api
         obj.tunnel_types = 'vxlan'
 
-        obj._create_tunnel_flood_flow_action = self._create_tun_flood_flow
-
         mock_br_int = mock_ovs_ext_api.request_int_br.return_value
         mock_br_int.add_flow = mock.Mock()
         mock_br_int.delete_flows = mock.Mock()
@@ -87,6 +100,8 @@ class TestOvsDriverTaas(base.TaasTestCase):
 
         mock_tap_bridge = mock_tap_ext.return_value
         mock_tap_bridge.create.return_value = None
+        mock_tap_bridge.deferred.return_value.__enter__.return_value = (
+            mock_tap_bridge)
         mock_tap_bridge.add_flow = mock.Mock()
         mock_tap_bridge.delete_flows = mock.Mock()
 
@@ -101,6 +116,8 @@ class TestOvsDriverTaas(base.TaasTestCase):
         mock_ovs_ext_api.request_tun_br.assert_called_once()
 
         mock_tap_bridge.create.assert_called_once()
+        mock_tap_bridge.use_at_least_protocol.assert_called_once_with(
+            n_ovs_consts.OPENFLOW14)
 
         mock_br_int.add_patch_port.assert_called_once()
         mock_br_tun.add_patch_port.assert_called_once()
@@ -175,6 +192,299 @@ class TestOvsDriverTaas(base.TaasTestCase):
                       tun_id=mock.ANY, actions='resubmit(,38)')
         ])
 
+    @mock.patch('neutron.plugins.ml2.drivers.openvswitch.agent.'
+                'ovs_agent_extension_api.OVSAgentExtensionAPI')
+    @mock.patch('neutron_taas.services.taas.drivers.linux.ovs_taas.'
+                'OVSBridge_tap_extension')
+    def test_create_tap_service_defers_flows(self, mock_tap_ext, mock_api):
+        tap_service = base.FAKE_TAP_SERVICE_OVS
+
+        mock_ovs_ext_api = mock_api.return_value
+        mock_ovs_ext_api.request_int_br.return_value = FakeBridge('br_int')
+        mock_ovs_ext_api.request_tun_br.return_value = FakeBridge('br_tun')
+
+        obj, mock_tap_bridge, mock_br_int, mock_br_tun = \
+            self._init_taas_driver(mock_ovs_ext_api, mock_tap_ext)
+
+        mock_tap_bridge.deferred.reset_mock()
+        with mock.patch.object(FakeBridge, 'deferred', autospec=True,
+                               side_effect=lambda br, **kwargs: br) as \
+                mock_deferred, \
+                mock.patch('neutron.agent.linux.utils.execute'):
+            obj.create_tap_service(tap_service)
+
+        mock_deferred.assert_has_calls([
+            mock.call(mock_br_int, full_ordered=True, use_bundle=True),
+            mock.call(mock_br_tun, full_ordered=True, use_bundle=True),
+        ])
+        mock_tap_bridge.deferred.assert_called_once_with(full_ordered=True,
+                                                         use_bundle=True)
+
+    @mock.patch('neutron.plugins.ml2.drivers.openvswitch.agent.'
+                'ovs_agent_extension_api.OVSAgentExtensionAPI')
+    @mock.patch('neutron_taas.services.taas.drivers.linux.ovs_taas.'
+                'OVSBridge_tap_extension')
+    def test_sync_tap_resources_single_bundle(self, mock_tap_ext, mock_api):
+        mock_ovs_ext_api = mock_api.return_value
+        mock_ovs_ext_api.request_int_br.return_value = FakeBridge('br_int')
+        mock_ovs_ext_api.request_tun_br.return_value = FakeBridge('br_tun')
+
+        obj, mock_tap_bridge, mock_br_int, mock_br_tun = \
+            self._init_taas_driver(mock_ovs_ext_api, mock_tap_ext)
+
+        mock_tap_bridge.reset_mock()
+        mock_tap_bridge.deferred.return_value.__enter__.return_value = (
+            mock_tap_bridge)
+        mock_br_int.add_flow.reset_mock()
+        with mock.patch.object(FakeBridge, 'deferred', autospec=True,
+                               side_effect=lambda br, **kwargs: br) as \
+                mock_deferred, \
+                mock.patch('neutron.agent.linux.utils.execute'):
+            obj.sync_tap_resources(
+                {'tap_services': [base.FAKE_TAP_SERVICE_OVS],
+                 'tap_flows': [base.FAKE_TAP_FLOW, base.FAKE_TAP_FLOW]})
+
+        # One bundle per bridge for all the tap resources.
+        self.assertEqual(2, mock_deferred.call_count)
+        mock_tap_bridge.deferred.assert_called_once_with(full_ordered=True,
+                                                         use_bundle=True)
+        mock_br_int.add_flow.assert_has_calls([
+            mock.call(table=0, priority=25, in_port=mock.ANY,
+                      dl_vlan=mock.ANY, actions=mock.ANY),
+            mock.call(table=0, priority=20,
+                      dl_dst=base.FAKE_TAP_FLOW['port_mac'],
+                      actions=mock.ANY),
+            mock.call(table=0, priority=20,
+                      dl_dst=base.FAKE_TAP_FLOW['port_mac'],
+                      actions=mock.ANY),
+        ])
+
+    @mock.patch('neutron.plugins.ml2.drivers.openvswitch.agent.'
+                'ovs_agent_extension_api.OVSAgentExtensionAPI')
+    @mock.patch('neutron_taas.services.taas.drivers.linux.ovs_taas.'
+                'OVSBridge_tap_extension')
+    def test_setup_ovs_bridges_keeps_existing_flows(self, mock_tap_ext,
+                                                    mock_api):
+        mock_ovs_ext_api = mock_api.return_value
+
+        obj, mock_tap_bridge, mock_br_int, mock_br_tun = \
+            self._init_taas_driver(mock_ovs_ext_api, mock_tap_ext)
+
+        mock_tap_bridge.delete_flows.assert_not_called()
+        mock_br_int.delete_flows.assert_not_called()
+        mock_br_tun.delete_flows.assert_not_called()
+
+    @mock.patch('neutron.plugins.ml2.drivers.openvswitch.agent.'
+                'ovs_agent_extension_api.OVSAgentExtensionAPI')
+    @mock.patch('neutron_taas.services.taas.drivers.linux.ovs_taas.'
+                'OVSBridge_tap_extension')
+    def test_cleanup_stale_flows(self, mock_tap_ext, mock_api):
+        mock_ovs_ext_api = mock_api.return_value
+        obj, mock_tap_bridge, mock_br_int, mock_br_tun = \
+            self._init_taas_driver(mock_ovs_ext_api, mock_tap_ext)
+        mock_br_tun.deferred.return_value.__enter__.return_value = (
+            mock_br_tun)
+        mock_tap_bridge.default_cookie = 0x1234
+        mock_br_tun.default_cookie = 0x5678
+
+        def _dump_flows(cookie):
+            return (' cookie=0x%x, duration=5.1s, table=1, priority=1\n'
+                    ' cookie=0xabcd, duration=9.3s, table=1, priority=0\n'
+                    ' cookie=0x0, duration=1.2s, table=30, priority=1' %
+                    cookie)
+
+        mock_tap_bridge.dump_flows_for_table.return_value = _dump_flows(
+            mock_tap_bridge.default_cookie)
+        mock_br_tun.dump_flows_for_table.return_value = _dump_flows(
+            mock_br_tun.default_cookie)
+
+        obj.cleanup_stale_flows()
+
+        mock_tap_bridge.delete_flows.assert_has_calls([
+            mock.call(table=0, cookie='%d/-1' % 0xabcd),
+            mock.call(table=taas_ovs_consts.TAAS_RECV_LOC,
+                      cookie='%d/-1' % 0xabcd),
+            mock.call(table=taas_ovs_consts.TAAS_RECV_REM,
+                      cookie='%d/-1' % 0xabcd),
+        ])
+        self.assertEqual(3, mock_tap_bridge.delete_flows.call_count)
+        mock_br_tun.delete_flows.assert_any_call(
+            table=taas_ovs_consts.TAAS_SEND_UCAST, cookie='%d/-1' % 0xabcd)
+        self.assertEqual(7, mock_br_tun.delete_flows.call_count)
+        mock_br_int.delete_flows.assert_not_called()
+
+    @mock.patch('neutron.plugins.ml2.drivers.openvswitch.agent.'
+                'ovs_agent_extension_api.OVSAgentExtensionAPI')
+    @mock.patch('neutron_taas.services.taas.drivers.linux.ovs_taas.'
+                'OVSBridge_tap_extension')
+    def test_sync_tap_resources_done_cleanup_stale_flows(
+            self, mock_tap_ext, mock_api):
+        mock_ovs_ext_api = mock_api.return_value
+        mock_ovs_ext_api.request_int_br.return_value = FakeBridge('br_int')
+        mock_ovs_ext_api.request_tun_br.return_value = FakeBridge('br_tun')
+        obj, mock_tap_bridge, mock_br_int, mock_br_tun = \
+            self._init_taas_driver(mock_ovs_ext_api, mock_tap_ext)
+
+        with mock.patch.object(obj, 'update_tunnel_flood_flow'), \
+                mock.patch.object(obj, 'cleanup_stale_flows') as mock_clean:
+            # The flows are not cleaned up on a timer, however long the
+            # resync reply takes to arrive
+            obj.periodic_tasks()
+            obj.periodic_tasks()
+            mock_clean.assert_not_called()
+
+            obj.sync_tap_resources_done()
+            mock_clean.assert_called_once_with()
+
+    @mock.patch('neutron.plugins.ml2.drivers.openvswitch.agent.'
+                'ovs_agent_extension_api.OVSAgentExtensionAPI')
+    @mock.patch('neutron_taas.services.taas.drivers.linux.ovs_taas.'
+                'OVSBridge_tap_extension')
+    def test_create_tap_service_uses_port_cache(self, mock_tap_ext,
+                                                mock_api):
+        tap_service = base.FAKE_TAP_SERVICE_OVS
+        port_id = tap_service['port']['id']
+
+        mock_ovs_ext_api = mock_api.return_value
+        br_int = FakeBridge('br_int')
+        mock_ovs_ext_api.request_int_br.return_value = br_int
+        mock_ovs_ext_api.request_tun_br.return_value = FakeBridge('br_tun')
+        obj, mock_tap_bridge, mock_br_int, mock_br_tun = \
+            self._init_taas_driver(mock_ovs_ext_api, mock_tap_ext)
+
+        vif_port = FakeVifPort('tap1234', 42, port_id, 'fa:16:3e:00:00:01',
+                               'br-int')
+        obj.handle_port({'port_id': port_id, 'vif_port': vif_port,
+                         'local_vlan': 7})
+
+        with mock.patch.object(br_int, 'get_vif_port_by_id') as mock_vif, \
+                mock.patch.object(br_int, 'db_get_val') as mock_tag, \
+                mock.patch.object(br_int, 'get_port_ofport') as mock_ofport, \
+                mock.patch('neutron.agent.linux.utils.execute'):
+            obj.create_tap_service(tap_service)
+            obj.create_tap_service(tap_service)
+
+        mock_vif.assert_not_called()
+        mock_tag.assert_not_called()
+        mock_ofport.assert_called_once_with('patch-int-tap')
+        mock_br_int.add_flow.assert_called_with(
+            table=0, priority=25, in_port=mock.ANY, dl_vlan=mock.ANY,
+            actions='mod_vlan_vid:7,output:42')
+
+        # Once the port is gone, its details are looked up again
+        obj.delete_port({'port_id': port_id})
+        with mock.patch.object(br_int, 'get_vif_port_by_id',
+                               return_value=vif_port) as mock_vif, \
+                mock.patch.object(br_int, 'db_get_val',
+                                  return_value=8) as mock_tag, \
+                mock.patch('neutron.agent.linux.utils.execute'):
+            obj.create_tap_service(tap_service)
+
+        mock_vif.assert_called_once_with(port_id)
+        mock_tag.assert_called_once_with('Port', 'tap1234', 'tag')
+        mock_br_int.add_flow.assert_called_with(
+            table=0, priority=25, in_port=mock.ANY, dl_vlan=mock.ANY,
+            actions='mod_vlan_vid:8,output:42')
+
+    @mock.patch('neutron.plugins.ml2.drivers.openvswitch.agent.'
+                'ovs_agent_extension_api.OVSAgentExtensionAPI')
+    @mock.patch('neutron_taas.services.taas.drivers.linux.ovs_taas.'
+                'OVSBridge_tap_extension')
+    def test_get_port_vlan_keeps_concurrent_update(self, mock_tap_ext,
+                                                   mock_api):
+        mock_ovs_ext_api = mock_api.return_value
+        br_int = FakeBridge('br_int')
+        mock_ovs_ext_api.request_int_br.return_value = br_int
+        obj, mock_tap_bridge, mock_br_int, mock_br_tun = \
+            self._init_taas_driver(mock_ovs_ext_api, mock_tap_ext)
+        vif_port = FakeVifPort('tap1234', 42, 'port-1', 'fa:16:3e:00:00:01',
+                               'br-int')
+
+        def _db_get_val(*args):
+            # The port event is handled while the tag is looked up
+            obj.handle_port({'port_id': 'port-1', 'vif_port': vif_port,
+                             'local_vlan': 7})
+            return 8
+
+        with mock.patch.object(br_int, 'db_get_val',
+                               side_effect=_db_get_val):
+            self.assertEqual(7, obj._get_port_vlan(vif_port))
+        self.assertEqual(7, obj._get_port_vlan(vif_port))
+
+    @mock.patch('neutron.plugins.ml2.drivers.openvswitch.agent.'
+                'ovs_agent_extension_api.OVSAgentExtensionAPI')
+    @mock.patch('neutron_taas.services.taas.drivers.linux.ovs_taas.'
+                'OVSBridge_tap_extension')
+    def test_port_events_take_cache_lock(self, mock_tap_ext, mock_api):
+        mock_ovs_ext_api = mock_api.return_value
+        obj, mock_tap_bridge, mock_br_int, mock_br_tun = \
+            self._init_taas_driver(mock_ovs_ext_api, mock_tap_ext)
+        vif_port = FakeVifPort('tap1234', 42, 'port-1', 'fa:16:3e:00:00:01',
+                               'br-int')
+        obj._cache_lock = mock.MagicMock()
+
+        obj.handle_port({'port_id': 'port-1', 'vif_port': vif_port,
+                         'local_vlan': 7})
+        obj.delete_port({'port_id': 'port-1'})
+
+        self.assertEqual(2, obj._cache_lock.__enter__.call_count)
+        self.assertEqual({}, obj._vif_ports)
+        self.assertEqual({}, obj._port_vlans)
+
+    @mock.patch('neutron.plugins.ml2.drivers.openvswitch.agent.'
+                'ovs_agent_extension_api.OVSAgentExtensionAPI')
+    @mock.patch('neutron_taas.services.taas.drivers.linux.ovs_taas.'
+                'OVSBridge_tap_extension')
+    def test_update_tunnel_flood_flow_on_tunnel_port_change(self,
+                                                           mock_tap_ext,
+                                                           mock_api):
+        mock_ovs_ext_api = mock_api.return_value
+        obj, mock_tap_bridge, mock_br_int, mock_br_tun = \
+            self._init_taas_driver(mock_ovs_ext_api, mock_tap_ext)
+        mock_br_tun.ovsdb.idl_monitor.notify_handler.watch_event.\
+            assert_called_once_with(mock.ANY)
+        mock_br_tun.get_ports_attributes.return_value = [
+            {'name': 'patch-int', 'ofport': 1},
+            {'name': 'patch-tun-tap', 'ofport': 2},
+            {'name': 'vxlan-0a000002', 'ofport': 4},
+            {'name': 'vxlan-0a000001', 'ofport': 3},
+            {'name': 'vxlan-0a000003', 'ofport': []},
+        ]
+
+        # Nothing changed since the bridges setup
+        obj.periodic_tasks()
+        mock_br_tun.get_ports_attributes.assert_called_once()
+        mock_br_tun.mod_flow.assert_not_called()
+
+        obj.tunnel_ports_changed = True
+        obj.periodic_tasks()
+        mock_br_tun.mod_flow.assert_called_once_with(
+            table=taas_ovs_consts.TAAS_SEND_FLOOD,
+            actions=('move:NXM_OF_VLAN_TCI[0..11]->NXM_NX_TUN_ID[0..11],'
+                     'mod_vlan_vid:1,output:3,output:4'))
+        self.assertFalse(obj.tunnel_ports_changed)
+
+        # The flow is not rewritten as long as the ofports are the same
+        obj.tunnel_ports_changed = True
+        obj.periodic_tasks()
+        mock_br_tun.mod_flow.assert_called_once()
+
+    def test_tunnel_interface_event_match(self):
+        event = ovs_taas.TunnelInterfaceEvent(mock.Mock())
+        row = mock.Mock(type='vxlan')
+
+        self.assertTrue(event.match_fn(event.ROW_CREATE, row))
+        self.assertTrue(event.match_fn(event.ROW_DELETE, row))
+        self.assertTrue(event.match_fn(event.ROW_UPDATE, row,
+                                       mock.Mock(spec=['ofport'])))
+        self.assertFalse(event.match_fn(event.ROW_UPDATE, row,
+                                        mock.Mock(spec=['options'])))
+        self.assertFalse(event.match_fn(event.ROW_CREATE,
+                                        mock.Mock(type='patch')))
+
+        event.run(event.ROW_CREATE, row, None)
+        self.assertTrue(event.driver.tunnel_ports_changed)
+
     @mock.patch('neutron.plugins.ml2.drivers.openvswitch.agent.'
                 'ovs_agent_extension_api.OVSAgentExtensionAPI')
     @mock.patch('neutron_taas.services.taas.drivers.linux.ovs_taas.'
@@ -72,3 +72,13 @@ class TestOvnNbIdlForTaas(base.BaseTestCase):
         with mock.patch.object(self.idl_taas, 'close') as mock_close:
             self.idl_taas.stop()
         mock_close.assert_called_once_with()
+
+    def test_replicated_columns(self):
+        self.assertEqual({'Logical_Switch_Port', 'Mirror'},
+                         set(self.idl_taas.tables))
+        self.assertEqual({'name', 'mirror_rules'},
+                         set(self.idl_taas.tables[
+                             'Logical_Switch_Port'].columns))
+        self.assertEqual(
+            set(impl_idl_taas.OvnNbIdlForTaas.TABLES['Mirror']),
+            set(self.idl_taas.tables['Mirror'].columns))
@@ -16,6 +16,10 @@ from neutron.conf.plugins.ml2.drivers.ovn import ovn_conf
 from neutron.tests import base
 from neutron_lib.callbacks import events
 from neutron_lib.callbacks import resources
+from neutron_lib import constants
+from neutron_lib.plugins import directory
+from oslo_config import cfg
+from ovsdbapp.backend.ovs_idl import idlutils
 
 from neutron_taas.services.taas.service_drivers.ovn import helper
 
@@ -48,10 +52,10 @@ class TestTaasOvnProviderHelper(base.BaseTestCase):
         self.ovn_nbdb_api.start()
         self.addCleanup(self.ovn_nbdb_api.stop)
 
-        add_req_thread = mock.patch.object(helper.TaasOvnProviderHelper,
-                                           'add_request')
-        self.mock_add_request = add_req_thread.start()
-        self.addCleanup(add_req_thread.stop)
+        self.add_req_thread = mock.patch.object(helper.TaasOvnProviderHelper,
+                                                'add_request')
+        self.mock_add_request = self.add_req_thread.start()
+        self.addCleanup(self.add_req_thread.stop)
 
     def test_mirror_add(self):
         port_id = '1234'
@@ -79,7 +83,10 @@ class TestTaasOvnProviderHelper(base.BaseTestCase):
             mirror_type=type,
             index=tunnel_id
         )
-        self.helper.ovn_nbdb_api.lsp_attach_mirror.assert_called_once()
+        self.helper.ovn_nbdb_api.lsp_attach_mirror.assert_called_once_with(
+            self.helper.ovn_nbdb_api.lookup.return_value.name,
+            self.helper.ovn_nbdb_api.mirror_add.return_value,
+            may_exist=True)
 
     def test_mirror_del(self):
         port_id = '1234'
@@ -104,3 +111,309 @@ class TestTaasOvnProviderHelper(base.BaseTestCase):
         self.helper.ovn_nbdb_api.mirror_get.assert_called_once_with(name)
         self.helper.ovn_nbdb_api.lsp_detach_mirror.assert_called_once()
         self.helper.ovn_nbdb_api.mirror_del.assert_called_once()
+
+    def _mirror_request(self, name, request_type='mirror_add'):
+        return {'type': request_type,
+                'info': {'name': name,
+                         'direction_filter': 'to-lport',
+                         'dest': '10.92.10.5',
+                         'mirror_type': 'gre',
+                         'index': 101,
+                         'port_id': 'port-%s' % name}}
+
+    def test_request_handler_single_transaction(self):
+        request_queue = self.helper._request_queues[0]
+        for name in ('m1', 'm2', 'm3'):
+            request_queue.put(self._mirror_request(name))
+        request_queue.put({'type': 'exit'})
+
+        self.helper._request_handler(request_queue)
+
+        nbdb_api = self.helper.ovn_nbdb_api
+        nbdb_api.transaction.assert_called_once_with(check_error=True)
+        txn = nbdb_api.transaction.return_value.__enter__.return_value
+        self.assertEqual(6, txn.add.call_count)
+        self.assertEqual(3, nbdb_api.mirror_add.call_count)
+        nbdb_api.mirror_add.return_value.execute.assert_not_called()
+        self.assertEqual(0, request_queue.unfinished_tasks)
+
+    def test_request_handler_splits_failed_batch(self):
+        requests = [self._mirror_request(name)
+                    for name in ('m1', 'm2', 'bad', 'm4')]
+        request_queue = self.helper._request_queues[0]
+        for request in requests:
+            request_queue.put(request)
+        request_queue.put({'type': 'exit'})
+        commands = {}
+        self.helper.mirror_add = mock.Mock(
+            side_effect=lambda info: commands.setdefault(
+                info['name'], [mock.Mock(name=info['name'])]))
+        committed = []
+
+        def _execute_commands(cmds):
+            if commands['bad'][0] in cmds:
+                raise RuntimeError('commit failed')
+            committed.extend(cmds)
+
+        with mock.patch.object(self.helper, '_execute_commands',
+                               side_effect=_execute_commands) as m_exec, \
+                mock.patch.object(helper.LOG, 'exception') as m_log:
+            self.helper._taas_mirror_func_map['mirror_add'] = (
+                self.helper.mirror_add)
+            self.helper._request_handler(request_queue)
+
+        # The whole batch, then [m1, m2], [bad, m4], [bad] and [m4].
+        self.assertEqual(5, m_exec.call_count)
+        self.assertEqual([commands[name][0] for name in ('m1', 'm2', 'm4')],
+                         committed)
+        m_log.assert_called_once_with('Failed to process request %s',
+                                      requests[2])
+        stats = self.helper.get_stats()
+        self.assertEqual(3, stats['requests_processed'])
+        self.assertEqual(1, stats['requests_failed'])
+
+    def test_workers(self):
+        self.assertEqual(4, len(self.helper._request_queues))
+        self.assertEqual(4, self.mock_thread_class.call_count)
+        self.mock_thread_class.assert_any_call(
+            target=self.helper._request_handler,
+            args=(self.helper._request_queues[3],))
+
+    def test_add_request_sharded_by_port(self):
+        self.add_req_thread.stop()
+        for name in ('m1', 'm2', 'm3'):
+            request = self._mirror_request(name)
+            request['info']['port_id'] = 'port-1'
+            self.helper.add_request(request)
+        self.helper.add_request(
+            self._mirror_request('m1', request_type='mirror_del'))
+
+        request_queue = self.helper._get_request_queue('port-1')
+        self.assertEqual(['m1', 'm2', 'm3'],
+                         [request_queue.get_nowait()['info']['name']
+                          for _i in range(3)])
+        self.assertEqual(1, self.helper.get_stats()['queue_depth'])
+
+    def test_get_stats_latency(self):
+        request = self._mirror_request('m1')
+        request['enqueued_at'] = 10.0
+        with mock.patch.object(helper.time, 'monotonic', return_value=12.0):
+            self.helper._record_requests([(request, [])])
+
+        stats = self.helper.get_stats()
+        self.assertEqual(1, stats['requests_processed'])
+        self.assertEqual(2.0, stats['latency_avg'])
+        self.assertEqual(2.0, stats['latency_max'])
+        self.assertEqual([0, 0, 0, 0], stats['queue_depths'])
+
+    def test_coalesce_requests_add_del(self):
+        requests = [self._mirror_request('m1'),
+                    self._mirror_request('m2'),
+                    self._mirror_request('m1', request_type='mirror_del')]
+
+        self.assertEqual([requests[1]],
+                         self.helper._coalesce_requests(requests))
+
+    def test_coalesce_requests_duplicates(self):
+        requests = [self._mirror_request('m1'),
+                    self._mirror_request('m1'),
+                    self._mirror_request('m2', request_type='mirror_del'),
+                    self._mirror_request('m2', request_type='mirror_del')]
+
+        self.assertEqual([requests[1], requests[3]],
+                         self.helper._coalesce_requests(requests))
+
+    def test_coalesce_requests_del_add(self):
+        requests = [self._mirror_request('m1', request_type='mirror_del'),
+                    self._mirror_request('m1'),
+                    self._mirror_request('m1')]
+
+        coalesced = self.helper._coalesce_requests(requests)
+
+        self.assertEqual([requests[2]], coalesced)
+        self.assertTrue(coalesced[0]['info']['may_exist'])
+
+    def test_coalesce_requests_del_add_del(self):
+        requests = [self._mirror_request('m1', request_type='mirror_del'),
+                    self._mirror_request('m1'),
+                    self._mirror_request('m1', request_type='mirror_del')]
+
+        self.assertEqual([requests[2]],
+                         self.helper._coalesce_requests(requests))
+
+    def test_request_handler_add_del_no_transaction(self):
+        request_queue = self.helper._request_queues[0]
+        request_queue.put(self._mirror_request('m1'))
+        request_queue.put(
+            self._mirror_request('m1', request_type='mirror_del'))
+        request_queue.put({'type': 'exit'})
+
+        self.helper._request_handler(request_queue)
+
+        self.helper.ovn_nbdb_api.transaction.assert_not_called()
+        self.helper.ovn_nbdb_api.mirror_add.assert_not_called()
+        self.helper.ovn_nbdb_api.mirror_get.assert_not_called()
+
+    def _set_nb_rows(self, mirrors, lsps):
+        ports = {lsp.name: lsp for lsp in lsps}
+
+        def _lookup(table, port_id):
+            try:
+                return ports[port_id]
+            except KeyError:
+                raise idlutils.RowNotFound(table=table, col='name',
+                                           match=port_id)
+
+        self.helper.ovn_nbdb_api.tables = {
+            'Mirror': mock.Mock(rows={m.uuid: m for m in mirrors})}
+        self.helper.ovn_nbdb_api.lookup.side_effect = _lookup
+
+    @staticmethod
+    def _mirror_row(name, info):
+        row = mock.Mock(uuid='uuid-%s' % name, filter=info['direction_filter'],
+                        type=info['mirror_type'], sink=info['dest'],
+                        index=info['index'])
+        row.name = name
+        return row
+
+    def _sync_request(self, name):
+        return dict(self._mirror_request(name), tap_mirror_id='tm-%s' % name)
+
+    def test_sync_mirrors(self):
+        in_sync = self._sync_request('in-sync')
+        outdated = self._sync_request('outdated')
+        missing = self._sync_request('missing')
+        in_sync_row = self._mirror_row('tm_in_sync', in_sync['info'])
+        outdated_row = self._mirror_row('tm_outdated',
+                                        dict(outdated['info'], index=200))
+        stale_row = self._mirror_row('tm_stale', outdated['info'])
+        pending_row = self._mirror_row('tm_pending', outdated['info'])
+        other_row = self._mirror_row('not_taas', outdated['info'])
+        lsp = mock.Mock(mirror_rules=[in_sync_row])
+        lsp.name = in_sync['info']['port_id']
+        self._set_nb_rows([in_sync_row, outdated_row, stale_row, pending_row,
+                           other_row], [lsp])
+        self.helper._status_callback = mock.Mock()
+        committed = []
+
+        with mock.patch.object(self.helper, '_execute_commands',
+                               side_effect=committed.extend), \
+                mock.patch.object(self.helper, 'mirror_add',
+                                  side_effect=lambda info: [info['name']]):
+            self.helper.sync_mirrors({'tm_in_sync': in_sync,
+                                      'tm_outdated': outdated,
+                                      'tm_missing': missing},
+                                     {'tm_pending'})
+
+        nbdb_api = self.helper.ovn_nbdb_api
+        self.assertEqual(['outdated', 'missing',
+                          nbdb_api.mirror_del.return_value], committed)
+        nbdb_api.mirror_del.assert_called_once_with(stale_row.uuid)
+        nbdb_api.lsp_detach_mirror.assert_not_called()
+        nbdb_api.mirror_get.assert_not_called()
+        # The repaired tap mirrors are active again.
+        self.helper._status_callback.assert_called_once_with(
+            ['tm-missing', 'tm-outdated'], constants.ACTIVE)
+
+    def test_sync_mirrors_in_sync(self):
+        request = self._sync_request('m1')
+        row = self._mirror_row('tm_m1', request['info'])
+        lsp = mock.Mock(mirror_rules=[row])
+        lsp.name = request['info']['port_id']
+        self._set_nb_rows([row], [lsp])
+        self.helper._status_callback = mock.Mock()
+
+        with mock.patch.object(self.helper, '_execute_commands') as m_exec:
+            self.helper.sync_mirrors({'tm_m1': request})
+
+        m_exec.assert_not_called()
+        self.helper.ovn_nbdb_api.lookup.assert_called_once_with(
+            'Logical_Switch_Port', request['info']['port_id'])
+        self.helper._status_callback.assert_not_called()
+
+    def test_sync_mirrors_failed(self):
+        request = self._sync_request('m1')
+        self._set_nb_rows([], [])
+        self.helper._status_callback = mock.Mock()
+
+        with mock.patch.object(self.helper, '_execute_commands',
+                               side_effect=RuntimeError), \
+                mock.patch.object(self.helper, 'mirror_add',
+                                  side_effect=lambda info: [info['name']]):
+            self.helper.sync_mirrors({'tm_m1': request})
+
+        self.helper._status_callback.assert_called_once_with(
+            ['tm-m1'], constants.ERROR)
+
+    def _post_fork_initialize(self, nb_idl_mode):
+        self.addCleanup(setattr, helper, '_shared_nb_idl', None)
+        cfg.CONF.set_override('ovn_nb_idl_mode', nb_idl_mode, group='taas')
+        taas_helper = helper.TaasOvnProviderHelper()
+        taas_helper._post_fork_initialize(
+            resources.PROCESS, events.AFTER_INIT, None)
+        return taas_helper
+
+    def test_post_fork_initialize_shared(self):
+        self.mock_ovn_nb_idl.reset_mock()
+        helper_1 = self._post_fork_initialize('shared')
+        helper_2 = self._post_fork_initialize('shared')
+
+        self.mock_ovn_nb_idl.assert_called_once_with()
+        self.assertIs(helper_1.ovn_nbdb_api, helper_2.ovn_nbdb_api)
+        self.assertEqual(
+            self.mock_ovn_nb_idl.return_value.start.return_value,
+            helper_1.ovn_nbdb_api)
+        self.assertFalse(hasattr(helper_1, 'ovn_nbdb'))
+
+    @mock.patch.object(directory, 'get_plugin')
+    def test_post_fork_initialize_ml2(self, mock_get_plugin):
+        mech_driver = mock.Mock(_nb_ovn=mock.sentinel.nb_ovn)
+        mock_get_plugin.return_value.mechanism_manager.mech_drivers = {
+            'ovn': mock.Mock(obj=mech_driver)}
+
+        self.mock_ovn_nb_idl.reset_mock()
+        taas_helper = self._post_fork_initialize('ml2')
+
+        self.assertEqual(mock.sentinel.nb_ovn, taas_helper.ovn_nbdb_api)
+        self.mock_ovn_nb_idl.assert_not_called()
+
+    @mock.patch.object(directory, 'get_plugin')
+    def test_post_fork_initialize_ml2_not_initialized(self, mock_get_plugin):
+        mech_driver = mock.Mock(_nb_ovn=None)
+        mock_get_plugin.return_value.mechanism_manager.mech_drivers = {
+            'ovn': mock.Mock(obj=mech_driver)}
+
+        self.mock_ovn_nb_idl.reset_mock()
+        taas_helper = self._post_fork_initialize('ml2')
+
+        self.mock_ovn_nb_idl.assert_called_once_with()
+        self.assertEqual(
+            self.mock_ovn_nb_idl.return_value.start.return_value,
+            taas_helper.ovn_nbdb_api)
+
+    def test_request_handler_reports_status(self):
+        callback = mock.Mock()
+        self.helper._status_callback = callback
+        request_queue = self.helper._request_queues[0]
+        for name, tap_mirror_id in (('m1', 'tm-1'), ('m2', 'tm-1'),
+                                    ('m3', 'tm-2'), ('bad', 'tm-3')):
+            request = self._mirror_request(name)
+            request['tap_mirror_id'] = tap_mirror_id
+            request_queue.put(request)
+        request_queue.put({'type': 'exit'})
+
+        def _execute_commands(cmds):
+            if 'bad' in cmds:
+                raise RuntimeError('commit failed')
+
+        with mock.patch.object(self.helper, '_execute_commands',
+                               side_effect=_execute_commands), \
+                mock.patch.object(self.helper, 'mirror_add',
+                                  side_effect=lambda info: [info['name']]):
+            self.helper._taas_mirror_func_map['mirror_add'] = (
+                self.helper.mirror_add)
+            self.helper._request_handler(request_queue)
+
+        callback.assert_has_calls([
+            mock.call(['tm-1', 'tm-2'], 'ACTIVE'),
+            mock.call(['tm-3'], 'ERROR')])
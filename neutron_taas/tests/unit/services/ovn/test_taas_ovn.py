@@ -69,6 +69,7 @@ class TestTaasOvnDriver(base.BaseTestCase):
         self.driver.create_tap_mirror_postcommit(ctx)
         expected_dict = {
             'type': 'mirror_add',
+            'tap_mirror_id': self.tap_mirror_dict['id'],
             'info': {
                 'name': mock.ANY,
                 'direction_filter': 'to-lport',
@@ -86,6 +87,7 @@ class TestTaasOvnDriver(base.BaseTestCase):
 
         expected_in_call = {
             'type': 'mirror_add',
+            'tap_mirror_id': self.multi_dir_t_mirror['id'],
             'info': {
                 'name': mock.ANY,
                 'direction_filter': 'to-lport',
@@ -146,3 +148,54 @@ class TestTaasOvnDriver(base.BaseTestCase):
         ]
 
         self.mock_add_request.assert_has_calls(expected_calls)
+
+    def test_sync_tap_mirrors(self):
+        self.driver.service_plugin = mock.Mock()
+        pending_t_mirror = dict(self.multi_dir_t_mirror,
+                                id='222222-tm-id', status='PENDING_CREATE')
+        self.driver.service_plugin.get_tap_mirrors.return_value = [
+            dict(self.multi_dir_t_mirror, status='ERROR'), pending_t_mirror]
+        t_m_id = self.multi_dir_t_mirror['id'][0:6]
+
+        with mock.patch.object(self.driver._ovn_helper,
+                               'sync_mirrors') as mock_sync:
+            self.driver.sync_tap_mirrors(mock.sentinel.context)
+
+        self.driver.service_plugin.get_tap_mirrors.assert_called_once_with(
+            mock.sentinel.context)
+        expected, pending = mock_sync.call_args.args
+        self.assertEqual({'tm_in_%s' % t_m_id, 'tm_out_%s' % t_m_id,
+                          'tm_both_%s' % t_m_id}, set(expected))
+        self.assertEqual(
+            'from-lport',
+            expected['tm_out_%s' % t_m_id]['info']['direction_filter'])
+        self.assertEqual(103,
+                         expected['tm_both_%s' % t_m_id]['info']['index'])
+        self.assertEqual(self.multi_dir_t_mirror['id'],
+                         expected['tm_in_%s' % t_m_id]['tap_mirror_id'])
+        # The pending tap mirrors are left to the helper workers.
+        self.assertEqual({'tm_in_222222', 'tm_out_222222',
+                          'tm_both_222222'}, pending)
+
+    def test_ovn_maintenance_periodics(self):
+        ovn_client = mock.Mock()
+        periodics, = self.driver.ovn_maintenance_periodics(ovn_client)
+
+        ovn_client._nb_idl.has_lock = False
+        with mock.patch.object(self.driver, 'sync_tap_mirrors') as mock_sync:
+            periodics.check_for_tap_mirror_inconsistencies()
+            mock_sync.assert_not_called()
+
+            ovn_client._nb_idl.has_lock = True
+            periodics.check_for_tap_mirror_inconsistencies()
+            mock_sync.assert_called_once_with(mock.ANY)
+
+    def test_set_tap_mirrors_status(self):
+        self.driver.service_plugin = mock.Mock()
+
+        self.driver._set_tap_mirrors_status(['tm-1', 'tm-2'], 'ACTIVE')
+
+        self.driver.service_plugin.update_tap_mirrors_status.\
+            assert_called_once_with(mock.ANY, ['tm-1', 'tm-2'], 'ACTIVE')
+        self.assertEqual(self.driver._set_tap_mirrors_status,
+                         self.driver._ovn_helper._status_callback)
@@ -0,0 +1,407 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import threading
+import time
+from unittest import mock
+
+import fixtures
+from neutron_lib.api.definitions import portbindings
+from neutron_lib import constants
+from neutron_lib import context as neutron_context
+from neutron_lib import rpc as n_rpc
+
+from neutron_taas.common import constants as taas_consts
+from neutron_taas.services.taas.agents.common import taas_agent
+from neutron_taas.tests import base
+
+
+class TestOrderedExecutor(base.TaasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.executor = taas_agent.OrderedExecutor(4)
+        self.addCleanup(self.executor.stop)
+
+    def _wait(self):
+        # Wait for every submitted task to complete.
+        for _i in range(100):
+            if not self.executor.get_stats()['queue_depth']:
+                return
+            time.sleep(0.05)
+        self.fail('Tasks still pending')
+
+    def test_ordered_per_key(self):
+        blocker = threading.Event()
+        calls = []
+        self.executor.submit(['ts-1'], blocker.wait, 5)
+        self.executor.submit(['ts-1', 'port-1'], calls.append, 'flow-1')
+        self.executor.submit(['port-1'], calls.append, 'flow-2')
+        self.executor.submit(['ts-2'], calls.append, 'ts-2')
+
+        # Unrelated resources do not wait for the blocked chain.
+        for _i in range(100):
+            if calls:
+                break
+            time.sleep(0.05)
+        self.assertEqual(['ts-2'], calls)
+
+        blocker.set()
+        self._wait()
+        self.assertEqual(['ts-2', 'flow-1', 'flow-2'], calls)
+
+    def test_all_keys(self):
+        blocker = threading.Event()
+        calls = []
+        self.executor.submit(['ts-1'], blocker.wait, 5)
+        self.executor.submit(taas_agent.ALL_KEYS, calls.append, 'periodic')
+        self.executor.submit(['ts-2'], calls.append, 'ts-2')
+        self.executor.submit(['ts-1'], calls.append, 'ts-1')
+
+        # Neither the all keys task nor the tasks submitted after it run
+        # before the pending tasks.
+        time.sleep(0.2)
+        self.assertEqual([], calls)
+
+        blocker.set()
+        self._wait()
+        self.assertEqual('periodic', calls[0])
+        self.assertEqual({'ts-1', 'ts-2'}, set(calls[1:]))
+
+    def test_get_stats(self):
+        self.executor.submit(['ts-1'], mock.Mock())
+        self.executor.submit(['ts-1'], mock.Mock(side_effect=ValueError))
+        self._wait()
+
+        stats = self.executor.get_stats()
+        self.assertEqual(2, stats['tasks_processed'])
+        self.assertEqual(1, stats['tasks_failed'])
+        self.assertEqual(0, stats['queue_depth'])
+        self.assertEqual(0, stats['ready_depth'])
+        self.assertGreaterEqual(stats['latency_max'], stats['latency_avg'])
+
+
+class TestTaasAgentRpcCallback(base.TaasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.conf = mock.Mock(host='host-A')
+        self.callback = taas_agent.TaasAgentRpcCallback(self.conf, 'ovs')
+        self.callback.executor = mock.Mock()
+        self.callback.taas_driver = mock.Mock()
+        self.callback.taas_plugin_rpc = mock.Mock()
+        self.callback.func_dict = {
+            'create_tap_flow': {
+                'msg_name': 'tap_flow',
+                'fail_status': constants.ERROR,
+                'succ_status': constants.ACTIVE}}
+
+    def test_invoke_driver_ordering_keys(self):
+        msg = {'tap_flow': {'id': 'tf-1', 'tap_service_id': 'ts-1'},
+               'port': {'id': 'port-1'}}
+
+        self.callback._invoke_driver_for_plugin_api(None, msg,
+                                                    'create_tap_flow')
+
+        self.callback.executor.submit.assert_called_once_with(
+            [('port', 'port-1'), ('tap_service', 'ts-1')],
+            self.callback._run_driver_func, msg, 'create_tap_flow')
+
+    def test_get_ordering_keys(self):
+        get_keys = taas_agent.TaasAgentRpcCallback._get_ordering_keys
+        self.assertEqual(
+            [('tap_service', 'ts-1')],
+            get_keys({'tap_service': {'id': 'ts-1'}}, 'delete_tap_service'))
+        self.assertEqual(
+            [('port', 'port-1'), ('tap_mirror', 'tm-1')],
+            get_keys({'tap_mirror': {'id': 'tm-1'}, 'port': {'id': 'port-1'}},
+                     'create_tap_mirror'))
+        self.assertEqual([('periodic_tasks',)],
+                         get_keys(None, 'periodic_tasks'))
+
+    def test_run_driver_func(self):
+        msg = {'tap_flow': {'id': 'tf-1'}}
+        self.callback.taas_driver.create_tap_flow.side_effect = [
+            None, ValueError]
+
+        self.callback._run_driver_func(msg, 'create_tap_flow')
+        self.callback._run_driver_func(msg, 'create_tap_flow')
+
+        self.callback.taas_driver.create_tap_flow.assert_called_with(msg)
+        self.callback.taas_plugin_rpc.set_tap_resources_status.\
+            assert_not_called()
+        self.callback._flush_statuses()
+        self.callback.taas_plugin_rpc.set_tap_resources_status.\
+            assert_called_once_with(
+                [{'resource': 'tap_flow', 'id': 'tf-1',
+                  'status': constants.ACTIVE},
+                 {'resource': 'tap_flow', 'id': 'tf-1',
+                  'status': constants.ERROR}],
+                'host-A')
+
+    def test_flush_statuses_empty(self):
+        self.callback._flush_statuses()
+
+        self.callback.taas_plugin_rpc.set_tap_resources_status.\
+            assert_not_called()
+
+    def test_sync_tap_resources_reply(self):
+        ts_msg = {'tap_service': {'id': 'ts-1'},
+                  'port': {'id': 'port-1',
+                           portbindings.VNIC_TYPE: portbindings.VNIC_NORMAL}}
+        tf_msg = {'tap_flow': {'id': 'tf-1', 'tap_service_id': 'ts-1'},
+                  'port': {'id': 'port-2',
+                           portbindings.VNIC_TYPE: portbindings.VNIC_NORMAL}}
+        sriov_tf_msg = {'tap_flow': {'id': 'tf-2', 'tap_service_id': 'ts-1'},
+                        'port': {'id': 'port-3',
+                                 portbindings.VNIC_TYPE:
+                                     portbindings.VNIC_DIRECT}}
+        self.callback.portbind_drivers_map = (
+            taas_consts.VNIC_TYPE_DRIVER_TYPES)
+
+        self.callback.sync_tap_resources_reply(
+            None, {'tap_services': [ts_msg],
+                   'tap_flows': [tf_msg, sriov_tf_msg]}, 'host-A')
+
+        # The server answering handles the bulk status reports.
+        self.callback.taas_plugin_rpc.set_version_cap.assert_called_once_with(
+            None)
+
+        self.callback.executor.submit.assert_called_once_with(
+            [('tap_service', 'ts-1'), ('port', 'port-2'),
+             ('tap_service', 'ts-1')],
+            self.callback._sync_tap_resources,
+            {'tap_services': [ts_msg], 'tap_flows': [tf_msg]},
+            {'tap_services': [], 'tap_flows': [], 'tap_mirrors': []})
+
+    def test_sync_tap_resources_reply_tap_mirrors(self):
+        state_dir = self.useFixture(fixtures.TempDir()).path
+        self.callback.state_store = taas_agent.AgentStateStore(
+            os.path.join(state_dir, 'state.json'))
+        tm_msg = {'tap_mirror': {'id': 'tm-1'},
+                  'port': {'id': 'port-1',
+                           portbindings.VNIC_TYPE: portbindings.VNIC_NORMAL}}
+        stale_tm_msg = {'tap_mirror': {'id': 'tm-2'},
+                        'port': {'id': 'port-2',
+                                 portbindings.VNIC_TYPE:
+                                     portbindings.VNIC_NORMAL}}
+        self.callback.state_store.add('tap_mirrors', 'tm-1', tm_msg)
+        self.callback.state_store.add('tap_mirrors', 'tm-2', stale_tm_msg)
+        self.callback.portbind_drivers_map = (
+            taas_consts.VNIC_TYPE_DRIVER_TYPES)
+        self.callback.func_dict['create_tap_mirror'] = {
+            'msg_name': 'tap_mirror',
+            'fail_status': constants.ERROR,
+            'succ_status': constants.ACTIVE}
+        msg = {'tap_services': [], 'tap_flows': [], 'tap_mirrors': [tm_msg]}
+
+        self.callback.sync_tap_resources_reply(None, msg, 'host-A')
+
+        self.callback.executor.submit.assert_called_once_with(
+            [('port', 'port-1'), ('tap_mirror', 'tm-1'),
+             ('port', 'port-2'), ('tap_mirror', 'tm-2')],
+            self.callback._sync_tap_resources, msg,
+            {'tap_services': [], 'tap_flows': [],
+             'tap_mirrors': [stale_tm_msg]})
+
+        self.callback._sync_tap_resources(
+            msg, self.callback.executor.submit.call_args.args[3])
+
+        self.callback.taas_driver.delete_tap_mirror.assert_called_once_with(
+            stale_tm_msg)
+        self.callback.taas_driver.create_tap_mirror.assert_called_once_with(
+            tm_msg)
+        self.assertEqual([tm_msg],
+                         self.callback.state_store.get('tap_mirrors'))
+
+    def test_get_stale_resources_without_tap_mirrors(self):
+        state_dir = self.useFixture(fixtures.TempDir()).path
+        self.callback.state_store = taas_agent.AgentStateStore(
+            os.path.join(state_dir, 'state.json'))
+        self.callback.state_store.add('tap_mirrors', 'tm-1',
+                                      {'tap_mirror': {'id': 'tm-1'}})
+
+        # An older server does not send the tap mirrors back, they are kept.
+        self.assertEqual(
+            {'tap_services': [], 'tap_flows': [], 'tap_mirrors': []},
+            self.callback._get_stale_resources(
+                {'tap_services': [], 'tap_flows': []}))
+
+    def test_sync_tap_resources_reply_cancels_timeout(self):
+        self.callback.expect_sync_reply(60)
+        timer = self.callback._sync_reply_timer
+        self.addCleanup(timer.cancel)
+
+        self.callback.sync_tap_resources_reply(
+            None, {'tap_services': [], 'tap_flows': []}, 'host-A')
+
+        self.assertTrue(timer.finished.is_set())
+
+    def test_sync_reply_timeout(self):
+        self.callback._sync_reply_timeout()
+
+        self.callback.executor.submit.assert_called_once_with(
+            taas_agent.ALL_KEYS, self.callback._sync_tap_resources_done)
+        self.callback._sync_tap_resources_done()
+        self.callback.taas_driver.sync_tap_resources_done.\
+            assert_called_once_with()
+
+    def test_sync_tap_resources(self):
+        msg = {'tap_services': [{'tap_service': {'id': 'ts-1'}}],
+               'tap_flows': [{'tap_flow': {'id': 'tf-1'}}]}
+
+        self.callback._sync_tap_resources(msg)
+
+        self.callback.taas_driver.sync_tap_resources.assert_called_once_with(
+            msg)
+        self.assertEqual(
+            [{'resource': 'tap_service', 'id': 'ts-1',
+              'status': constants.ACTIVE},
+             {'resource': 'tap_flow', 'id': 'tf-1',
+              'status': constants.ACTIVE}],
+            self.callback._statuses)
+        self.callback.taas_driver.sync_tap_resources_done.\
+            assert_called_once_with()
+
+    def test_sync_tap_resources_failure(self):
+        msg = {'tap_services': [],
+               'tap_flows': [{'tap_flow': {'id': 'tf-1'}}]}
+        self.callback.taas_driver.sync_tap_resources.side_effect = ValueError
+
+        with mock.patch.object(self.callback,
+                               '_run_driver_func') as mock_run:
+            self.callback._sync_tap_resources(msg)
+
+        mock_run.assert_called_once_with(msg['tap_flows'][0],
+                                         'create_tap_flow')
+        self.assertEqual([], self.callback._statuses)
+        self.callback.taas_driver.sync_tap_resources_done.\
+            assert_called_once_with()
+
+    def test_sync_tap_resources_removes_stale(self):
+        state_dir = self.useFixture(fixtures.TempDir()).path
+        self.callback.state_store = taas_agent.AgentStateStore(
+            os.path.join(state_dir, 'state.json'))
+        stale_tf_msg = {'tap_flow': {'id': 'tf-2'}}
+        self.callback.state_store.add('tap_flows', 'tf-2', stale_tf_msg)
+        msg = {'tap_services': [],
+               'tap_flows': [{'tap_flow': {'id': 'tf-1'}}]}
+
+        self.callback._sync_tap_resources(
+            msg, self.callback._get_stale_resources(msg))
+
+        self.callback.taas_driver.delete_tap_flow.assert_called_once_with(
+            stale_tf_msg)
+        self.assertEqual(msg['tap_flows'],
+                         self.callback.state_store.get('tap_flows'))
+
+    def test_update_state_delete_tap_service(self):
+        state_dir = self.useFixture(fixtures.TempDir()).path
+        self.callback.state_store = taas_agent.AgentStateStore(
+            os.path.join(state_dir, 'state.json'))
+        self.callback.state_store.add('tap_services', 'ts-1',
+                                      {'tap_service': {'id': 'ts-1'}})
+        for tf_id, ts_id in (('tf-1', 'ts-1'), ('tf-2', 'ts-2')):
+            self.callback.state_store.add(
+                'tap_flows', tf_id,
+                {'tap_flow': {'id': tf_id, 'tap_service_id': ts_id}})
+
+        self.callback._update_state('delete_tap_service', 'tap_services',
+                                    'ts-1', {'tap_service': {'id': 'ts-1'}})
+
+        self.assertEqual([], self.callback.state_store.get('tap_services'))
+        self.assertEqual(
+            [{'tap_flow': {'id': 'tf-2', 'tap_service_id': 'ts-2'}}],
+            self.callback.state_store.get('tap_flows'))
+
+
+class TestTaasPluginApi(base.TaasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        mock.patch.object(n_rpc, 'get_client').start()
+        mock.patch.object(neutron_context, 'get_admin_context').start()
+        self.addCleanup(mock.patch.stopall)
+        self.api = taas_agent.TaasPluginApi('taas_plugin', 'host-A')
+        self.statuses = [{'resource': 'tap_service', 'id': 'ts-1',
+                          'status': constants.ACTIVE},
+                         {'resource': 'tap_flow', 'id': 'tf-1',
+                          'status': constants.INACTIVE}]
+
+    def test_set_tap_resources_status_older_server(self):
+        self.api.client.can_send_version.return_value = False
+
+        self.api.set_tap_resources_status(self.statuses, 'host-A')
+
+        n_rpc.get_client.assert_called_with(mock.ANY, version_cap='1.0')
+        self.assertEqual(
+            [mock.call(mock.ANY, 'set_tap_service_status', msg={'id': 'ts-1'},
+                       status=constants.ACTIVE, host='host-A'),
+             mock.call(mock.ANY, 'set_tap_flow_status', msg={'id': 'tf-1'},
+                       status=constants.INACTIVE, host='host-A')],
+            self.api.client.prepare.return_value.cast.call_args_list)
+
+    def test_set_tap_resources_status(self):
+        self.api.set_version_cap(None)
+        n_rpc.get_client.assert_called_with(mock.ANY, version_cap=None)
+        self.api.client.can_send_version.return_value = True
+
+        self.api.set_tap_resources_status(self.statuses, 'host-A')
+
+        self.api.client.prepare.assert_called_once_with(fanout=False,
+                                                        version='1.1')
+        self.api.client.prepare.return_value.cast.assert_called_once_with(
+            mock.ANY, 'set_tap_resources_status', statuses=self.statuses,
+            host='host-A')
+
+
+class TestAgentStateStore(base.TaasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                 'taas', 'taas-agent-ovs.json')
+        self.store = taas_agent.AgentStateStore(self.path)
+
+    def test_save_and_load(self):
+        msg = {'tap_service': {'id': 'ts-1'}, 'taas_id': 42}
+        self.store.add('tap_services', 'ts-1', msg)
+        self.store.add('tap_flows', 'tf-1', {'tap_flow': {'id': 'tf-1'}})
+        self.store.remove('tap_flows', 'tf-1')
+        self.store.save()
+
+        store = taas_agent.AgentStateStore(self.path)
+        self.assertTrue(store.load())
+        self.assertEqual([msg], store.get('tap_services'))
+        self.assertEqual([], store.get('tap_flows'))
+        self.assertEqual([], store.get('tap_mirrors'))
+
+    def test_save_mode(self):
+        self.store.add('tap_flows', 'tf-1', {'tap_flow': {'id': 'tf-1'}})
+        self.store.save()
+
+        self.assertEqual(0o600, os.stat(self.path).st_mode & 0o777)
+
+    def test_save_unchanged(self):
+        self.store.save()
+
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_load_missing_or_corrupted(self):
+        self.assertFalse(self.store.load())
+
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as state_file:
+            state_file.write('{not json')
+        self.assertFalse(self.store.load())
+        self.assertEqual([], self.store.get('tap_services'))
@@ -0,0 +1,173 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+from unittest import mock
+
+from neutron_lib.api.definitions import portbindings
+from neutron_lib import rpc as n_rpc
+
+from neutron_taas.common import topics
+from neutron_taas.services.taas.service_drivers import taas_agent_api
+from neutron_taas.tests import base
+
+OVS_PORT = {'id': 'port-1', portbindings.VNIC_TYPE: portbindings.VNIC_NORMAL}
+SRIOV_PORT = {'id': 'port-2',
+              portbindings.VNIC_TYPE: portbindings.VNIC_DIRECT}
+
+
+class TestTaasAgentApi(base.TaasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        mock.patch.object(n_rpc, 'get_client').start()
+        self.addCleanup(mock.patch.stopall)
+        self.plugin = mock.Mock()
+        self.plugin.get_agent_rpc_version.return_value = '1.1'
+        self.api = taas_agent_api.TaasAgentApi(topics.TAAS_AGENT, 'server',
+                                               self.plugin)
+        self.client = self.api.client
+        self.client.prepare.return_value.can_send_version.side_effect = (
+            lambda version: (
+                self.client.prepare.call_args.kwargs['version_cap'] >=
+                version))
+        self.context = mock.Mock()
+
+    def test_create_tap_flow_host_targeted(self):
+        msg = {'port': OVS_PORT}
+        self.api.create_tap_flow(self.context, msg, 'host-A')
+
+        self.client.prepare.assert_called_with(
+            topic=topics.get_agent_topic('ovs'), server='host-A',
+            version='1.0')
+        self.client.prepare.return_value.cast.assert_called_once_with(
+            self.context, 'create_tap_flow', tap_flow_msg=msg, host='host-A')
+        self.plugin.get_agent_rpc_version.assert_called_once_with(
+            self.context, 'host-A', 'ovs')
+
+        # The version of an upgraded agent is read once.
+        self.api.create_tap_flow(self.context, msg, 'host-A')
+        self.plugin.get_agent_rpc_version.assert_called_once_with(
+            self.context, 'host-A', 'ovs')
+
+    @mock.patch.object(time, 'monotonic', return_value=100.0)
+    def test_create_tap_flow_older_agent(self, mock_monotonic):
+        self.plugin.get_agent_rpc_version.return_value = None
+        msg = {'port': OVS_PORT}
+        self.api.create_tap_flow(self.context, msg, 'host-A')
+        self.api.create_tap_flow(self.context, msg, 'host-A')
+
+        self.client.prepare.assert_called_with(fanout=True)
+        self.assertEqual(1, self.plugin.get_agent_rpc_version.call_count)
+
+        # The version of an agent not upgraded yet is read again later.
+        mock_monotonic.return_value += taas_agent_api.OLDER_AGENT_VERSION_TTL
+        self.api.create_tap_flow(self.context, msg, 'host-A')
+        self.assertEqual(2, self.plugin.get_agent_rpc_version.call_count)
+
+    def test_set_agent_versions(self):
+        self.plugin.get_agent_rpc_version.return_value = None
+        msg = {'port': OVS_PORT}
+        self.api.create_tap_flow(self.context, msg, 'host-A')
+        self.client.prepare.assert_called_with(fanout=True)
+
+        # The agent resynced after its upgrade.
+        self.api.set_agent_versions('host-A', ['ovs'], '1.1')
+        self.api.create_tap_flow(self.context, msg, 'host-A')
+
+        self.client.prepare.assert_called_with(
+            topic=topics.get_agent_topic('ovs'), server='host-A',
+            version='1.0')
+        self.plugin.get_agent_rpc_version.assert_called_once_with(
+            self.context, 'host-A', 'ovs')
+
+    def test_create_tap_service_unknown_host(self):
+        self.api.create_tap_service(self.context, {'port': OVS_PORT}, None)
+
+        self.client.prepare.assert_called_once_with(fanout=True)
+        self.plugin.get_agent_rpc_version.assert_not_called()
+
+    def test_delete_tap_service_fanout(self):
+        self.api.delete_tap_service(self.context, {'port': OVS_PORT},
+                                    'host-A')
+
+        self.client.prepare.assert_called_once_with(fanout=True)
+
+    def test_delete_tap_mirror_no_port(self):
+        self.api.delete_tap_mirror(self.context, {'port': None}, None)
+
+        self.client.prepare.assert_called_once_with(fanout=True)
+
+    def test_create_tap_flows_per_driver_type(self):
+        msgs = [{'port': OVS_PORT}, {'port': SRIOV_PORT}, {'port': OVS_PORT}]
+        self.api.create_tap_flows(self.context, msgs, 'host-A')
+
+        self.client.prepare.assert_any_call(
+            topic=topics.get_agent_topic('ovs'), server='host-A',
+            version='1.1')
+        self.client.prepare.assert_any_call(
+            topic=topics.get_agent_topic('sriov'), server='host-A',
+            version='1.1')
+        self.assertEqual(
+            [mock.call(self.context, 'create_tap_flows',
+                       tap_flow_msgs=[msgs[0], msgs[2]], host='host-A'),
+             mock.call(self.context, 'create_tap_flows',
+                       tap_flow_msgs=[msgs[1]], host='host-A')],
+            self.client.prepare.return_value.cast.call_args_list)
+
+    def test_create_tap_flows_older_agent(self):
+        self.plugin.get_agent_rpc_version.side_effect = (
+            lambda context, host, driver_type: (
+                '1.1' if driver_type == 'ovs' else '1.0'))
+        msgs = [{'port': OVS_PORT}, {'port': SRIOV_PORT}, {'port': SRIOV_PORT}]
+        self.api.create_tap_flows(self.context, msgs, 'host-A')
+
+        self.client.prepare.assert_any_call(
+            topic=topics.get_agent_topic('ovs'), server='host-A',
+            version='1.1')
+        self.client.prepare.assert_any_call(fanout=True)
+        self.assertEqual(
+            [mock.call(self.context, 'create_tap_flows',
+                       tap_flow_msgs=[msgs[0]], host='host-A'),
+             mock.call(self.context, 'create_tap_flow',
+                       tap_flow_msg=msgs[1], host='host-A'),
+             mock.call(self.context, 'create_tap_flow',
+                       tap_flow_msg=msgs[2], host='host-A')],
+            self.client.prepare.return_value.cast.call_args_list)
+
+    def test_sync_tap_resources_reply(self):
+        msg = {'tap_services': [{'port': OVS_PORT}], 'tap_flows': []}
+        self.api.sync_tap_resources_reply(self.context, msg, 'host-A', 'ovs')
+
+        self.client.prepare.assert_called_with(
+            topic=topics.get_agent_topic('ovs'), server='host-A',
+            version='1.1')
+        self.client.prepare.return_value.cast.assert_called_once_with(
+            self.context, 'sync_tap_resources_reply', tap_resources_msg=msg,
+            host='host-A')
+
+    def test_sync_tap_resources_reply_older_agent(self):
+        ts_msg = {'port': OVS_PORT}
+        tf_msgs = [{'port': OVS_PORT}, {'port': SRIOV_PORT}]
+        self.api.sync_tap_resources_reply(
+            self.context, {'tap_services': [ts_msg], 'tap_flows': tf_msgs},
+            'host-A', None)
+
+        self.client.prepare.assert_called_once_with(fanout=True)
+        self.assertEqual(
+            [mock.call(self.context, 'create_tap_service',
+                       tap_service_msg=ts_msg, host='host-A'),
+             mock.call(self.context, 'create_tap_flow',
+                       tap_flow_msg=tf_msgs[0], host='host-A'),
+             mock.call(self.context, 'create_tap_flow',
+                       tap_flow_msg=tf_msgs[1], host='host-A')],
+            self.client.prepare.return_value.cast.call_args_list)
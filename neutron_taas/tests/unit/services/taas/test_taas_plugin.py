@@ -18,9 +18,12 @@ import contextlib
 import testtools
 from unittest import mock
 
+from neutron_lib.api.definitions import portbindings
+from neutron_lib.callbacks import events
 from neutron_lib import constants
 from neutron_lib import context
 from neutron_lib.exceptions import taas as taas_exc
+from neutron_lib.plugins import directory
 from neutron_lib import rpc as n_rpc
 from neutron_lib.utils import net as n_utils
 from oslo_config import cfg
@@ -64,6 +67,10 @@ class TestTaasPlugin(testlib_api.SqlTestCase):
             'mac_address': n_utils.get_random_mac(
                 'fa:16:3e:00:00:00'.split(':')),
         }
+        mock.patch.object(
+            self._plugin, 'get_ports_details',
+            side_effect=lambda context, port_ids: {
+                port_id: self._port_details for port_id in port_ids}).start()
         self._tap_service = {
             'tenant_id': self._tenant_id,
             'name': 'MyTap',
@@ -225,12 +232,12 @@ class TestTaasPlugin(testlib_api.SqlTestCase):
             self._tap_service['id'] = ts['id']
             self._tap_flow['id'] = tf['id']
         self.driver.assert_has_calls([
-            mock.call.delete_tap_flow_precommit(mock.ANY),
+            mock.call.delete_tap_flows_precommit(mock.ANY),
             mock.call.delete_tap_service_precommit(mock.ANY),
         ])
         self._tap_service['status'] = constants.PENDING_DELETE
         self._tap_flow['status'] = constants.PENDING_DELETE
-        pre_args = self.driver.delete_tap_flow_precommit.call_args[0][0]
+        pre_args, = self.driver.delete_tap_flows_precommit.call_args[0][0]
         self.assertEqual(self._context, pre_args._plugin_context)
         self.assertEqual(self._tap_flow, pre_args.tap_flow)
         pre_args = self.driver.delete_tap_service_precommit.call_args[0][0]
@@ -253,6 +260,76 @@ class TestTaasPlugin(testlib_api.SqlTestCase):
         with self.tap_service() as ts, self.tap_flow(tap_service=ts['id']):
             pass
 
+    def test_create_tap_flow_source_vlans(self):
+        self._port_details[portbindings.VIF_DETAILS] = {
+            portbindings.VIF_DETAILS_VLAN: '20'}
+        with self.tap_service() as ts:
+            self._tap_flow['tap_service_id'] = ts['id']
+            req = {'tap_flows': [{'tap_flow': dict(self._tap_flow)}]}
+            tf_bulk, = self._plugin.create_tap_flow_bulk(self._context, req)
+            with self.tap_flow(tap_service=ts['id']):
+                pass
+            tf_ids = [tf['id'] for tf in self._plugin.get_tap_flows(
+                self._context)]
+            self._plugin.update_tap_flows_status(
+                self._context, tf_ids, constants.ACTIVE)
+
+            self.assertIn(tf_bulk['id'], tf_ids)
+            self.assertEqual(
+                [(None, '20', self.vlan_filter)],
+                self._plugin.get_tap_service_flows_vlans(
+                    self._context, ts['id']))
+
+    def test_handle_delete_agent(self):
+        for driver_type in ('ovs', 'sriov'):
+            self._plugin.update_agent_rpc_version(
+                self._context, self._host_id, [driver_type], '1.1')
+
+        for agent_type in (constants.AGENT_TYPE_OVS,
+                           constants.AGENT_TYPE_DHCP):
+            self._plugin.handle_delete_agent(
+                'agent', 'after_delete', None,
+                events.DBEventPayload(
+                    self._context, resource_id='agent-id',
+                    states=({'agent_type': agent_type,
+                             'host': self._host_id},)))
+
+        self.assertIsNone(self._plugin.get_agent_rpc_version(
+            self._context, self._host_id, 'ovs'))
+        self.assertEqual('1.1', self._plugin.get_agent_rpc_version(
+            self._context, self._host_id, 'sriov'))
+
+    def _update_port_vlan(self, port_id, vlan):
+        original_port = {portbindings.VIF_DETAILS: {
+            portbindings.VIF_DETAILS_VLAN: '20'}}
+        port = {portbindings.VIF_DETAILS: {
+            portbindings.VIF_DETAILS_VLAN: vlan}}
+        self._plugin.handle_update_port(
+            'port', 'after_update', None,
+            events.DBEventPayload(self._context, resource_id=port_id,
+                                  states=(original_port, port)))
+
+    def test_handle_update_port_source_vlans(self):
+        self._port_details[portbindings.VIF_DETAILS] = {
+            portbindings.VIF_DETAILS_VLAN: '20'}
+        with self.tap_service() as ts, self.tap_flow(tap_service=ts['id']):
+            self._update_port_vlan(self._port_id, '30')
+
+            self.assertEqual(
+                [(None, '30', self.vlan_filter)],
+                self._plugin.get_tap_service_flows_vlans(
+                    self._context, ts['id']))
+
+    def test_handle_update_port_not_source_port(self):
+        with mock.patch.object(self._plugin,
+                               'update_tap_flows_source_vlans') as m_update:
+            # The source VLANs did not change.
+            self._update_port_vlan(self._port_id, '20')
+            # The port is not the source of any tap flow.
+            self._update_port_vlan(self._port_id, '30')
+
+        m_update.assert_not_called()
+
     def test_create_tap_flow_wrong_tenant_id(self):
         with self.tap_service() as ts, \
                 testtools.ExpectedException(
@@ -289,3 +366,107 @@ class TestTaasPlugin(testlib_api.SqlTestCase):
                                           {'id': self._tap_flow['id']},
                                           constants.INACTIVE,
                                           "dummyHost")
+
+    def test_create_tap_flow_bulk(self):
+        with self.tap_service() as ts:
+            self._tap_flow['tap_service_id'] = ts['id']
+            req = {'tap_flows': [{'tap_flow': dict(self._tap_flow)},
+                                 {'tap_flow': dict(self._tap_flow)}]}
+            tfs = self._plugin.create_tap_flow_bulk(self._context, req)
+
+        self.assertEqual(2, len(tfs))
+        self.driver.assert_has_calls([
+            mock.call.create_tap_flows_precommit(mock.ANY),
+            mock.call.create_tap_flows_postcommit(mock.ANY),
+        ])
+        post_args = self.driver.create_tap_flows_postcommit.call_args[0][0]
+        self.assertEqual(tfs, [arg.tap_flow for arg in post_args])
+        self.assertEqual(
+            {tf['id'] for tf in tfs},
+            {tf['id'] for tf in self._plugin.get_tap_flows(self._context)})
+
+    def test_create_tap_flow_bulk_wrong_tenant_id(self):
+        with self.tap_service() as ts:
+            self._tap_flow['tap_service_id'] = ts['id']
+            other_tf = dict(self._tap_flow, tenant_id='other-tenant')
+            req = {'tap_flows': [{'tap_flow': dict(self._tap_flow)},
+                                 {'tap_flow': other_tf}]}
+            with testtools.ExpectedException(
+                    taas_exc.TapServiceNotBelongToTenant):
+                self._plugin.create_tap_flow_bulk(self._context, req)
+
+        self.driver.create_tap_flows_precommit.assert_not_called()
+        self.assertEqual([], self._plugin.get_tap_flows(self._context))
+
+    def test_create_tap_flow_bulk_tap_service_not_found(self):
+        self._tap_flow['tap_service_id'] = uuidutils.generate_uuid()
+        req = {'tap_flows': [{'tap_flow': self._tap_flow}]}
+        with testtools.ExpectedException(taas_exc.TapServiceNotFound):
+            self._plugin.create_tap_flow_bulk(self._context, req)
+
+    def test_delete_tap_flows(self):
+        with self.tap_service() as ts:
+            self._tap_flow['tap_service_id'] = ts['id']
+            req = {'tap_flows': [{'tap_flow': dict(self._tap_flow)},
+                                 {'tap_flow': dict(self._tap_flow)}]}
+            tf_active, tf_down = self._plugin.create_tap_flow_bulk(
+                self._context, req)
+            self._plugin.update_tap_flows_status(
+                self._context, [tf_active['id']], constants.ACTIVE)
+            self._plugin.delete_tap_flows(
+                self._context, [tf_active['id'], tf_down['id']])
+
+        pre_args, = self.driver.delete_tap_flows_precommit.call_args[0][0]
+        self.assertEqual(tf_active['id'], pre_args.tap_flow['id'])
+        self.assertEqual(constants.PENDING_DELETE,
+                         pre_args.tap_flow['status'])
+        post_args, = self.driver.delete_tap_flows_postcommit.call_args[0][0]
+        self.assertEqual(tf_down['id'], post_args.tap_flow['id'])
+        tfs = self._plugin.get_tap_flows(self._context)
+        self.assertEqual([(tf_active['id'], constants.PENDING_DELETE)],
+                         [(tf['id'], tf['status']) for tf in tfs])
+
+    def test_set_tap_resources_status(self):
+        mock.patch.object(directory, 'get_plugin',
+                          return_value=self._plugin).start()
+        with self.tap_service() as ts:
+            self._tap_flow['tap_service_id'] = ts['id']
+            req = {'tap_flows': [{'tap_flow': dict(self._tap_flow)},
+                                 {'tap_flow': dict(self._tap_flow)}]}
+            tf_1, tf_2 = self._plugin.create_tap_flow_bulk(
+                self._context, req)
+            self._plugin.update_tap_flows_status(
+                self._context, [tf_2['id']], constants.PENDING_DELETE)
+
+            self.taas_cbs.set_tap_resources_status(
+                self._context,
+                [{'resource': 'tap_service', 'id': ts['id'],
+                  'status': constants.ERROR},
+                 {'resource': 'tap_flow', 'id': tf_1['id'],
+                  'status': constants.ERROR},
+                 {'resource': 'tap_flow', 'id': tf_1['id'],
+                  'status': constants.ACTIVE},
+                 {'resource': 'tap_flow', 'id': tf_2['id'],
+                  'status': constants.INACTIVE}],
+                'dummyHost')
+
+            self.assertEqual(
+                constants.ERROR,
+                self._plugin.get_tap_service(self._context,
+                                             ts['id'])['status'])
+            tfs = self._plugin.get_tap_flows(self._context)
+            self.assertEqual([(tf_1['id'], constants.ACTIVE)],
+                             [(tf['id'], tf['status']) for tf in tfs])
+            post_args, = self.driver.delete_tap_flows_postcommit.call_args[
+                0][0]
+            self.assertEqual(tf_2['id'], post_args.tap_flow['id'])
+
+            self.taas_cbs.set_tap_resources_status(
+                self._context,
+                [{'resource': 'tap_service', 'id': ts['id'],
+                  'status': constants.INACTIVE}],
+                'dummyHost')
+
+        self.assertEqual([], self._plugin.get_tap_services(self._context))
+        post_args = self.driver.delete_tap_service_postcommit.call_args[0][0]
+        self.assertEqual(ts['id'], post_args.tap_service['id'])
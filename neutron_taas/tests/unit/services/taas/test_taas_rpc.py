@@ -0,0 +1,288 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import time
+from unittest import mock
+
+from neutron_lib.api.definitions import portbindings
+from neutron_lib.api.definitions import tap_mirror as t_m_api_def
+from neutron_lib import constants
+from neutron_lib import context as n_context
+from neutron_lib import exceptions as n_exc
+from neutron_lib.plugins import directory
+from neutron_lib import rpc as n_rpc
+from oslo_config import cfg
+
+from neutron_taas.common import constants as taas_consts
+from neutron_taas.services.taas.service_drivers import (service_driver_context
+                                                        as sd_context)
+from neutron_taas.services.taas.service_drivers import taas_agent_api
+from neutron_taas.services.taas.service_drivers import taas_rpc
+from neutron_taas.tests import base
+
+
+class TestTaasRpcDriver(base.TaasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        mock.patch.object(n_rpc, 'Connection').start()
+        mock.patch.object(taas_agent_api, 'TaasAgentApi').start()
+        self.addCleanup(mock.patch.stopall)
+        self.plugin = mock.Mock()
+        self.context = mock.Mock()
+        self.driver = taas_rpc.TaasRpcDriver(self.plugin)
+
+        self.ports = {
+            'src-1': {'id': 'src-1', 'binding:host_id': 'host-A',
+                      'mac_address': 'fa:16:3e:00:00:01',
+                      'network_id': 'net-1'},
+            'src-2': {'id': 'src-2', 'binding:host_id': 'host-B',
+                      'mac_address': 'fa:16:3e:00:00:02',
+                      'network_id': 'net-1'},
+            'src-3': {'id': 'src-3', 'binding:host_id': 'host-A',
+                      'mac_address': 'fa:16:3e:00:00:03',
+                      'network_id': 'net-1'},
+            'ts-port': {'id': 'ts-port', 'binding:host_id': 'host-C',
+                        'mac_address': 'fa:16:3e:00:00:04',
+                        'network_id': 'net-1'},
+        }
+        for port in self.ports.values():
+            port[portbindings.VNIC_TYPE] = portbindings.VNIC_NORMAL
+        self.plugin.get_tap_services.return_value = [
+            {'id': 'ts-1', 'port_id': 'ts-port'}]
+        self.plugin.get_tap_id_associations.return_value = {
+            'ts-1': {'tap_service_id': 'ts-1', 'taas_id': 42}}
+        self.plugin.get_ports_details.side_effect = (
+            lambda context, port_ids: {port_id: self.ports[port_id]
+                                       for port_id in port_ids
+                                       if port_id in self.ports})
+        self.plugin.get_ports_network_data.side_effect = (
+            lambda context, ports: {port['id']: {'network_type': 'vxlan'}
+                                    for port in ports})
+
+    def _contexts(self, *source_ports):
+        return [sd_context.TapFlowContext(
+                    self.plugin, self.context,
+                    {'id': 'tf-%s' % port_id, 'tap_service_id': 'ts-1',
+                     'source_port': port_id, 'vlan_filter': None})
+                for port_id in source_ports]
+
+    def test_create_tap_flows_postcommit_one_cast_per_host(self):
+        self.driver.create_tap_flows_postcommit(
+            self._contexts('src-1', 'src-2', 'src-3'))
+
+        agent_rpc = self.driver.agent_rpc
+        self.assertEqual(2, agent_rpc.create_tap_flows.call_count)
+        casts = {call.args[2]: call.args[1]
+                 for call in agent_rpc.create_tap_flows.call_args_list}
+        self.assertEqual(['tf-src-1', 'tf-src-3'],
+                         [msg['tap_flow']['id'] for msg in casts['host-A']])
+        self.assertEqual(['tf-src-2'],
+                         [msg['tap_flow']['id'] for msg in casts['host-B']])
+        msg = casts['host-B'][0]
+        self.assertEqual(42, msg['taas_id'])
+        self.assertEqual('fa:16:3e:00:00:02', msg['port_mac'])
+        self.assertEqual(self.ports['ts-port'], msg['tap_service_port'])
+        self.assertEqual({'network_type': 'vxlan'}, msg['tf_nw'])
+        self.plugin.get_ports_details.assert_called_once_with(
+            self.context, {'src-1', 'src-2', 'src-3', 'ts-port'})
+        self.plugin.get_port_details.assert_not_called()
+
+    def test_create_tap_flows_postcommit_port_not_found(self):
+        del self.ports['src-2']
+
+        self.assertRaises(n_exc.PortNotFound,
+                          self.driver.create_tap_flows_postcommit,
+                          self._contexts('src-1', 'src-2'))
+        self.driver.agent_rpc.create_tap_flows.assert_not_called()
+
+    def test_create_tap_flows_postcommit_empty(self):
+        self.driver.create_tap_flows_postcommit([])
+
+        self.plugin.get_tap_services.assert_not_called()
+        self.driver.agent_rpc.create_tap_flows.assert_not_called()
+
+    def test_delete_tap_flows_precommit_direct_port(self):
+        self.ports['src-1'][portbindings.VNIC_TYPE] = (
+            portbindings.VNIC_DIRECT)
+        self.ports['src-3'][portbindings.VNIC_TYPE] = (
+            portbindings.VNIC_DIRECT)
+        self.plugin.get_tap_service_flows_vlans.return_value = [
+            (None, '20', '9-18')]
+
+        self.driver.delete_tap_flows_precommit(
+            self._contexts('src-1', 'src-2', 'src-3'))
+
+        agent_rpc = self.driver.agent_rpc
+        casts = {call.args[2]: call.args[1]
+                 for call in agent_rpc.delete_tap_flows.call_args_list}
+        for msg in casts['host-A']:
+            self.assertEqual(['20'], msg['source_vlans_list'])
+            self.assertEqual(['9-18'], msg['vlan_filter_list'])
+        self.assertEqual([], casts['host-B'][0]['source_vlans_list'])
+        # The VLANs of the tap service are read only once, and without
+        # looking up the source ports of its tap flows.
+        self.plugin.get_tap_service_flows_vlans.assert_called_once_with(
+            self.context, 'ts-1')
+        self.plugin.get_ports_details.assert_any_call(self.context, set())
+
+    def test_get_tap_service_vlans_defaults(self):
+        self.plugin.get_tap_service_flows_vlans.return_value = [
+            (None, taas_consts.VLAN_RANGE, None)]
+
+        self.assertEqual(
+            ([taas_consts.VLAN_RANGE], [taas_consts.VLAN_RANGE]),
+            self.driver._get_tap_service_vlans(self.context, 'ts-1'))
+
+    def test_get_tap_service_vlans_legacy_tap_flows(self):
+        self.ports['src-3'][portbindings.VIF_DETAILS] = {
+            portbindings.VIF_DETAILS_VLAN: '20'}
+        self.plugin.get_tap_service_flows_vlans.return_value = [
+            ('src-1', None, '9-18'), ('src-3', None, None)]
+
+        self.assertEqual(
+            ([taas_consts.VLAN_RANGE, '20'],
+             ['9-18', taas_consts.VLAN_RANGE]),
+            self.driver._get_tap_service_vlans(self.context, 'ts-1'))
+        self.plugin.get_ports_details.assert_called_once_with(
+            self.context, {'src-1', 'src-3'})
+
+    @mock.patch.object(directory, 'get_plugin')
+    def test_sync_tap_resources(self, mock_get_plugin):
+        self.ports['src-2'][portbindings.VNIC_TYPE] = (
+            portbindings.VNIC_DIRECT)
+        tm = {'id': 'tm-1', 'port_id': 'src-3'}
+        tm_deleted = {'id': 'tm-2', 'port_id': 'deleted-port'}
+        tap_mirror_plugin = mock_get_plugin.return_value
+        tap_mirror_plugin.get_active_tap_mirrors_by_host.return_value = [
+            tm, tm_deleted]
+        ts = {'id': 'ts-1', 'port_id': 'ts-port'}
+        tf_1 = {'id': 'tf-1', 'source_port': 'src-1'}
+        tf_2 = {'id': 'tf-2', 'source_port': 'src-2'}
+        tf_3 = {'id': 'tf-3', 'source_port': 'deleted-port'}
+        self.plugin.get_active_tap_resources_by_host.return_value = (
+            [(ts, 42)],
+            [(tf_1, 'ts-port', 42), (tf_2, 'ts-port', 42),
+             (tf_3, 'ts-port', 42)])
+        cfg.CONF.set_override('sync_tap_resources_rate', 0, 'taas')
+        self.addCleanup(cfg.CONF.clear_override, 'sync_tap_resources_rate',
+                        'taas')
+        callbacks = taas_rpc.TaasCallbacks(self.driver, self.plugin)
+
+        callbacks.sync_tap_resources(
+            self.context, {'host_id': 'host-A', 'driver_type': 'ovs',
+                           'rpc_version': '1.1'},
+            'host-A')
+
+        self.plugin.update_agent_rpc_version.assert_called_once_with(
+            self.context, 'host-A', ['ovs'], '1.1')
+        self.driver.agent_rpc.set_agent_versions.assert_called_once_with(
+            'host-A', ['ovs'], '1.1')
+        self.plugin.get_active_tap_resources_by_host.assert_called_once_with(
+            self.context, 'host-A')
+        self.driver.agent_rpc.sync_tap_resources_reply.assert_called_once_with(
+            self.context,
+            {'tap_services': [{'tap_service': ts, 'taas_id': 42,
+                               'port': self.ports['ts-port']}],
+             'tap_flows': [{'tap_flow': tf_1,
+                            'port_mac': 'fa:16:3e:00:00:01',
+                            'taas_id': 42,
+                            'port': self.ports['src-1'],
+                            'tap_service_port': self.ports['ts-port'],
+                            'tf_nw': {'network_type': 'vxlan'}}],
+             'tap_mirrors': [{'tap_mirror': tm,
+                              'port': self.ports['src-3']}]},
+            'host-A', 'ovs')
+        self.plugin.get_port_details.assert_not_called()
+        mock_get_plugin.assert_called_with(t_m_api_def.ALIAS)
+        tap_mirror_plugin.get_active_tap_mirrors_by_host.\
+            assert_called_once_with(self.context, 'host-A')
+
+    @mock.patch.object(directory, 'get_plugin', return_value=None)
+    def test_sync_tap_resources_no_tap_mirror_plugin(self, mock_get_plugin):
+        self.plugin.get_active_tap_resources_by_host.return_value = ([], [])
+
+        msg = self.driver.get_tap_resources_msg(self.context, 'host-A',
+                                                'ovs')
+
+        self.assertEqual([], msg['tap_mirrors'])
+
+    def test_sync_tap_resources_older_agent(self):
+        callbacks = taas_rpc.TaasCallbacks(self.driver, self.plugin)
+        callbacks._sync_bucket = mock.Mock()
+
+        with mock.patch.object(threading, 'Thread'):
+            callbacks.sync_tap_resources(self.context, {'host_id': 'host-A'},
+                                         'host-A')
+
+        # The driver type of the agent is not known, all the agents of the
+        # host are handled as older ones.
+        self.plugin.update_agent_rpc_version.assert_called_once_with(
+            self.context, 'host-A', ['ovs', 'sriov'], '1.0')
+
+    @mock.patch.object(n_context, 'get_admin_context')
+    @mock.patch.object(threading, 'Thread')
+    def test_sync_tap_resources_rate_limited(self, mock_thread,
+                                             mock_get_admin_context):
+        callbacks = taas_rpc.TaasCallbacks(self.driver, self.plugin)
+        callbacks._sync_bucket = mock.Mock()
+        self.driver.get_tap_resources_msg = mock.Mock()
+
+        for host in ('host-A', 'host-B', 'host-A'):
+            callbacks.sync_tap_resources(
+                self.context, {'host_id': host, 'driver_type': 'ovs'}, host)
+
+        # One handler thread, the requests are queued once per host.
+        mock_thread.return_value.start.assert_called_once_with()
+        self.driver.agent_rpc.sync_tap_resources_reply.assert_not_called()
+        callbacks._process_sync_request()
+        callbacks._process_sync_request()
+        self.assertTrue(callbacks._sync_queue.empty())
+        self.assertEqual(2, callbacks._sync_bucket.acquire.call_count)
+        self.assertEqual(
+            ['host-A', 'host-B'],
+            [call.args[2] for call in
+             self.driver.agent_rpc.sync_tap_resources_reply.call_args_list])
+        # The queued requests are answered with a context of the thread.
+        self.assertEqual(
+            [mock_get_admin_context.return_value] * 2,
+            [call.args[0] for call in
+             self.driver.agent_rpc.sync_tap_resources_reply.call_args_list])
+
+    @mock.patch.object(time, 'sleep')
+    @mock.patch.object(time, 'monotonic', return_value=100.0)
+    def test_token_bucket(self, mock_monotonic, mock_sleep):
+        bucket = taas_rpc.TokenBucket(2.0, 2)
+        mock_sleep.side_effect = (
+            lambda delay: setattr(mock_monotonic, 'return_value',
+                                  mock_monotonic.return_value + delay))
+
+        for _i in range(3):
+            bucket.acquire()
+
+        mock_sleep.assert_called_once_with(0.5)
+
+    @mock.patch.object(directory, 'get_plugin')
+    def test_set_tap_mirror_status(self, mock_get_plugin):
+        callbacks = taas_rpc.TaasCallbacks(self.driver, self.plugin)
+
+        callbacks.set_tap_mirror_status(
+            self.context, {'ids': ['tm-1', 'tm-2']}, constants.ACTIVE,
+            'host-A')
+        callbacks.set_tap_mirror_status(
+            self.context, {'id': 'tm-3'}, constants.INACTIVE, 'host-A')
+
+        mock_get_plugin.assert_called_once_with(t_m_api_def.ALIAS)
+        mock_get_plugin.return_value.update_tap_mirrors_status.\
+            assert_called_once_with(self.context, ['tm-1', 'tm-2'],
+                                    constants.ACTIVE)
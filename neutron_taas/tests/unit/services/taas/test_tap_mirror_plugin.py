@@ -16,6 +16,7 @@ import testtools
 from unittest import mock
 
 from neutron.tests.unit import testlib_api
+from neutron_lib import constants
 from neutron_lib import context
 from neutron_lib.exceptions import taas as taas_exc
 from neutron_lib import rpc as n_rpc
@@ -70,6 +71,7 @@ class TestTapMirrorPlugin(testlib_api.SqlTestCase):
                                return_value=self._port_details):
             mirror = self._plugin.create_tap_mirror(self._context, req)
         self._tap_mirror['id'] = mock.ANY
+        self._tap_mirror['status'] = constants.PENDING_CREATE
 
         self.driver.assert_has_calls([
             mock.call.create_tap_mirror_precommit(mock.ANY),
@@ -141,3 +143,45 @@ class TestTapMirrorPlugin(testlib_api.SqlTestCase):
     def test_delete_tap_mirror_non_existent(self):
         with testtools.ExpectedException(taas_exc.TapMirrorNotFound):
             self._plugin.delete_tap_mirror(self._context, 'non-existent')
+
+    def test_ovn_maintenance_periodics(self):
+        self.assertEqual(
+            self.driver.ovn_maintenance_periodics.return_value,
+            self._plugin.ovn_maintenance_periodics(mock.sentinel.ovn_client))
+        self.driver.ovn_maintenance_periodics.assert_called_once_with(
+            mock.sentinel.ovn_client)
+
+    def test_ovn_maintenance_periodics_not_supported(self):
+        self._plugin.driver = mock.Mock(spec=[])
+
+        self.assertEqual(
+            [], self._plugin.ovn_maintenance_periodics(mock.Mock()))
+
+    def test_create_tap_mirror_status(self):
+        with self.tap_mirror() as tm:
+            self.assertEqual(constants.PENDING_CREATE, tm['status'])
+            self._plugin.update_tap_mirrors_status(
+                self._context, [tm['id']], constants.ACTIVE)
+            self.assertEqual(
+                constants.ACTIVE,
+                self._plugin.get_tap_mirror(self._context,
+                                            tm['id'])['status'])
+
+    def test_create_tap_mirror_postcommit_error(self):
+        self.driver.create_tap_mirror_postcommit.side_effect = Exception
+        with mock.patch.object(self._plugin, 'get_port_details',
+                               return_value=self._port_details):
+            tm = self._plugin.create_tap_mirror(
+                self._context, {'tap_mirror': self._tap_mirror})
+
+        self.assertEqual(constants.ERROR, tm['status'])
+        self.assertEqual(
+            constants.ERROR,
+            self._plugin.get_tap_mirror(self._context, tm['id'])['status'])
+
+    def test_create_tap_mirror_no_full_scan(self):
+        with mock.patch.object(self._plugin, 'get_tap_mirrors') as m_get, \
+                self.tap_mirror():
+            pass
+
+        m_get.assert_not_called()